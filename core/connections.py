@@ -0,0 +1,126 @@
+"""
+Persistent database connections with health checks.
+
+With ``CONN_MAX_AGE`` > 0 each thread keeps its connection to a database
+across requests for up to that many seconds, Django's own limit on the
+connection lifetime. A kept connection may have been dropped by the
+server meanwhile (MySQL's ``wait_timeout``, a failover), so at the start of
+a request every connection idle for HEALTH_CHECK_IDLE_SECONDS or more is
+pinged and closed when unusable; the request then reconnects on first use.
+Connections in use back to back skip the ping.
+
+Django keeps one connection per thread and database rather than a shared
+pool, so the pool size of a gunicorn worker is its thread count (see
+gunicorn.conf.py) and no thread ever waits for a connection. The counters
+below, per process and database, are served by ``/metrics``.
+"""
+import os
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .instrumentation import register_collector
+
+DEFAULT_DB_CONNECTIONS = {
+    'HEALTH_CHECK_IDLE_SECONDS': 30,
+}
+
+
+def get_connection_setting(name):
+    return getattr(settings, 'DB_CONNECTIONS', {}).get(name, DEFAULT_DB_CONNECTIONS[name])
+
+
+class ConnectionStats:
+    COUNTERS = ('opened', 'reused', 'health_checks', 'health_check_failures')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        # wrapper -> monotonic time its thread last finished a request
+        self.last_used = weakref.WeakKeyDictionary()
+        self.wrappers = weakref.WeakSet()
+        self.busy_threads = set()
+
+    def increment(self, alias, counter):
+        with self.lock:
+            counters = self.counters.setdefault(alias, dict.fromkeys(self.COUNTERS, 0))
+            counters[counter] += 1
+
+    def snapshot(self):
+        """{alias: {open, idle, busy, <counters>}} for this process."""
+        with self.lock:
+            result = {alias: dict(counters, open=0, idle=0, busy=0) for alias, counters in self.counters.items()}
+            for wrapper in list(self.wrappers):
+                if wrapper.connection is None:
+                    continue
+                stats = result.setdefault(wrapper.alias, dict.fromkeys(self.COUNTERS + ('open', 'idle', 'busy'), 0))
+                stats['open'] += 1
+                stats['busy' if wrapper._thread_ident in self.busy_threads else 'idle'] += 1
+        return result
+
+
+stats = ConnectionStats()
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    stats.increment(connection.alias, 'opened')
+    with stats.lock:
+        stats.wrappers.add(connection)
+
+
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+    # runs after Django's close_old_connections, which drops expired ones
+    idle_limit = get_connection_setting('HEALTH_CHECK_IDLE_SECONDS')
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        stats.increment(connection.alias, 'reused')
+        last_used = stats.last_used.get(connection)
+        if last_used is not None and now - last_used < idle_limit:
+            continue
+        stats.increment(connection.alias, 'health_checks')
+        if not connection.is_usable():
+            stats.increment(connection.alias, 'health_check_failures')
+            connection.close()
+    with stats.lock:
+        stats.busy_threads.add(threading.get_ident())
+
+
+@receiver(request_finished)
+def mark_connections_idle(sender, **kwargs):
+    now = time.monotonic()
+    with stats.lock:
+        stats.busy_threads.discard(threading.get_ident())
+        for connection in connections.all():
+            if connection.connection is not None:
+                stats.last_used[connection] = now
+
+
+@register_collector
+def connection_metrics():
+    pid = os.getpid()
+    lines = []
+    snapshot = sorted(stats.snapshot().items())
+    for name, kind, help, key in (
+        ('eshop_db_connections_open', 'gauge', 'Open database connections.', 'open'),
+        ('eshop_db_connections_idle', 'gauge', 'Open connections not serving a request.', 'idle'),
+        ('eshop_db_connections_busy', 'gauge', 'Open connections serving a request.', 'busy'),
+        ('eshop_db_connections_opened_total', 'counter', 'Connections established.', 'opened'),
+        ('eshop_db_connections_reused_total', 'counter', 'Requests that started on a kept connection.', 'reused'),
+        ('eshop_db_connection_health_checks_total', 'counter', 'Pings of idle kept connections.', 'health_checks'),
+        ('eshop_db_connection_health_check_failures_total', 'counter',
+         'Kept connections found unusable and closed.', 'health_check_failures'),
+    ):
+        lines += [f'# HELP {name} {help}', f'# TYPE {name} {kind}']
+        for alias, values in snapshot:
+            lines.append(f'{name}{{database="{alias}",pid="{pid}"}} {values[key]}')
+    return lines
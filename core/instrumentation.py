@@ -0,0 +1,283 @@
+"""
+Per-request SQL and timing instrumentation.
+
+Every database connection gets record_query() as an execute wrapper, which
+hands each query to the QueryRecorder that InstrumentationMiddleware sets
+for the current request, in sync and async mode alike. The recorder
+counts queries, sums their time and counts them per fingerprint, the SQL
+with ``IN (...)`` lists collapsed, so an N+1 loop shows up as one
+fingerprint executed many times. Each response gets a ``Server-Timing``
+header, a sample of requests (and every slow one) is logged as JSON, and
+the totals are added to per-view histograms that ``/metrics`` serves in
+the Prometheus text format, followed by the lines of every function
+registered with register_collector().
+
+Views are named after the DRF viewset and action (``ProductViewSet.list``),
+the function for ``@api_view`` views, or else the URL name. Histograms
+live in the worker process, so each worker reports its own; the ``pid``
+label tells them apart. Queries run while a streamed response is read
+(the exports) happen after the middleware returns and are not counted.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INSTRUMENTATION = {
+    'ENABLED': False,
+    # share of requests logged, requests slower than SLOW_REQUEST_MS always are
+    'SAMPLE_RATE': 0.01,
+    'SLOW_REQUEST_MS': 500,
+    'SERVER_TIMING': True,
+    # when set, /metrics requires ``Authorization: Bearer <token>``, otherwise a staff user
+    'METRICS_TOKEN': None,
+}
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+_collectors = []
+
+
+def register_collector(func):
+    """Add the metric lines returned by ``func()`` to /metrics."""
+    _collectors.append(func)
+    return func
+
+
+def get_instrumentation_setting(name):
+    return getattr(settings, 'INSTRUMENTATION', {}).get(name, DEFAULT_INSTRUMENTATION[name])
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    return hashlib.md5(IN_LIST.sub('IN (...)', sql).encode()).hexdigest()[:12]
+
+
+class QueryRecorder:
+    """Execute wrapper counting and timing the queries of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = {}
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            key = fingerprint(sql)
+            self.fingerprints[key] = self.fingerprints.get(key, 0) + 1
+            self.statements.setdefault(key, sql)
+
+    def duplicates(self):
+        """{fingerprint: count} of the statements executed more than once."""
+        return {key: count for key, count in self.fingerprints.items() if count > 1}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.db_duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.duplicate_queries = 0
+
+
+class Metrics:
+    """Per (view, method) request histograms of this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view, method, duration, recorder):
+        duplicates = sum(count - 1 for count in recorder.fingerprints.values())
+        with self.lock:
+            metrics = self.views.get((view, method))
+            if metrics is None:
+                metrics = self.views[view, method] = ViewMetrics()
+            metrics.duration.observe(duration)
+            metrics.db_duration.observe(recorder.duration)
+            metrics.queries.observe(recorder.count)
+            metrics.duplicate_queries += duplicates
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def render(self):
+        """The histograms in the Prometheus text exposition format."""
+        pid = os.getpid()
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = []
+            for name, help, attribute in (
+                ('eshop_request_duration_seconds', 'Request duration.', 'duration'),
+                ('eshop_request_db_duration_seconds', 'Time spent in database queries per request.', 'db_duration'),
+                ('eshop_request_queries', 'Database queries per request.', 'queries'),
+            ):
+                lines += [f'# HELP {name} {help}', f'# TYPE {name} histogram']
+                for (view, method), metrics in views:
+                    labels = f'view="{view}",method="{method}",pid="{pid}"'
+                    histogram = getattr(metrics, attribute)
+                    for bound, total in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+            name = 'eshop_request_duplicate_queries_total'
+            lines += [f'# HELP {name} Queries repeating a statement already run in the same request.',
+                      f'# TYPE {name} counter']
+            for (view, method), metrics in views:
+                lines.append(f'{name}{{view="{view}",method="{method}",pid="{pid}"}} {metrics.duplicate_queries}')
+        for collector in _collectors:
+            lines += collector()
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def view_name(request):
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved'
+    cls = getattr(match.func, 'cls', None)
+    if cls is not None:
+        actions = getattr(match.func, 'actions', None)
+        if actions:
+            return f'{cls.__name__}.{actions.get(request.method.lower(), request.method.lower())}'
+        # @api_view names its wrapper class after the function
+        return cls.__name__
+    return match.view_name
+
+
+_recorder = ContextVar('instrumentation_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    # the context, and with it the recorder, follows the request into the
+    # threads sync_to_async runs its database work in
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        # outermost, execute_wrapper() blocks push and pop at the end
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if get_instrumentation_setting('ENABLED'):
+        install_recorder(connection)
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_instrumentation_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = get_instrumentation_setting('SAMPLE_RATE')
+        self.slow_request = get_instrumentation_setting('SLOW_REQUEST_MS') / 1000
+        self.server_timing = get_instrumentation_setting('SERVER_TIMING')
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        # connections opened before instrumentation was enabled
+        for connection in connections.all():
+            install_recorder(connection)
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(request, response, time.perf_counter() - start, recorder)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(request, response, time.perf_counter() - start, recorder)
+
+    def finish(self, request, response, duration, recorder):
+        view = view_name(request)
+        metrics.record(view, request.method, duration, recorder)
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries", '
+                f'app;dur={duration * 1000:.2f}'
+            )
+        if duration >= self.slow_request or random.random() < self.sample_rate:
+            self.log(request, response, view, duration, recorder)
+        return response
+
+    def log(self, request, response, view, duration, recorder):
+        duplicates = recorder.duplicates()
+        logger.info(json.dumps({
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'db_ms': round(recorder.duration * 1000, 2),
+            'queries': recorder.count,
+            'duplicates': [
+                {'fingerprint': key, 'count': count, 'sql': recorder.statements[key][:300]}
+                for key, count in sorted(duplicates.items(), key=lambda item: -item[1])
+            ],
+        }))
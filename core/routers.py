@@ -0,0 +1,200 @@
+"""
+Read-replica routing.
+
+Reads go to a replica only inside read_from_replica(), which the catalog
+viewsets enter for safe requests (see store.mixins.ReplicaReadMixin).
+Everything else, carts, orders, admin and management commands, reads from
+the primary. Within such a block the router still uses the primary:
+
+- inside ``transaction.atomic()`` on the primary,
+- once the request has written anything, so it reads its own writes,
+- for the PIN_SECONDS after a request that wrote, through a cookie set by
+  ReplicaPinningMiddleware, so a client's next requests see its writes.
+
+A replica is picked once per request, round-robin or, with SELECTION
+``'least-lag'``, the one furthest ahead among those at most
+MAX_LAG_SECONDS behind. Lag is measured at most every LAG_CHECK_SECONDS
+per process; with no healthy replica reads fall back to the primary.
+"""
+import asyncio
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+DEFAULT_READ_REPLICAS = {
+    # None uses every alias in DATABASES other than 'default'
+    'ALIASES': None,
+    'SELECTION': 'round-robin',
+    'MAX_LAG_SECONDS': 5,
+    'LAG_CHECK_SECONDS': 10,
+    'PIN_SECONDS': 5,
+    'PIN_COOKIE': 'primary_pin',
+    # cached responses read from a replica expire after this many seconds
+    'CACHE_TIMEOUT': 10,
+}
+
+
+def get_replica_setting(name):
+    return getattr(settings, 'READ_REPLICAS', {}).get(name, DEFAULT_READ_REPLICAS[name])
+
+
+def replica_aliases():
+    aliases = get_replica_setting('ALIASES')
+    if aliases is None:
+        aliases = [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+    return list(aliases)
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.replica_reads = False
+        self.pinned = pinned
+        self.wrote = False
+        self.alias = None
+
+
+_state = ContextVar('replica_routing', default=None)
+
+
+@contextmanager
+def routing_state(pinned=False):
+    token = _state.set(RoutingState(pinned))
+    try:
+        yield _state.get()
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def read_from_replica():
+    state = _state.get()
+    if state is None:
+        # outside a request, the block gets a state of its own
+        with routing_state(), read_from_replica():
+            yield
+        return
+    previous = state.replica_reads
+    state.replica_reads = True
+    try:
+        yield
+    finally:
+        state.replica_reads = previous
+
+
+def current_replica():
+    """Alias of the replica the current request has read from, or None."""
+    state = _state.get()
+    if state is None or state.alias in (None, DEFAULT_DB_ALIAS):
+        return None
+    return state.alias
+
+
+_round_robin = itertools.count()
+_lags = {}
+
+
+def measure_lag(alias):
+    """Seconds the replica is behind the primary, None when it is unusable."""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)'
+                )
+                return float(cursor.fetchone()[0])
+            if connection.vendor == 'mysql':
+                cursor.execute('SHOW SLAVE STATUS')
+                row = cursor.fetchone()
+                if row is None:
+                    return 0.0
+                lag = dict(zip([column[0] for column in cursor.description], row))['Seconds_Behind_Master']
+                return None if lag is None else float(lag)
+            cursor.execute('SELECT 1')
+            return 0.0
+    except DatabaseError:
+        return None
+
+
+def replica_lag(alias):
+    checked_at, lag = _lags.get(alias, (None, None))
+    now = time.monotonic()
+    if checked_at is None or now - checked_at >= get_replica_setting('LAG_CHECK_SECONDS'):
+        lag = measure_lag(alias)
+        _lags[alias] = (now, lag)
+    return lag
+
+
+def choose_replica():
+    aliases = replica_aliases()
+    if not aliases:
+        return None
+    if get_replica_setting('SELECTION') == 'least-lag':
+        max_lag = get_replica_setting('MAX_LAG_SECONDS')
+        lags = {alias: replica_lag(alias) for alias in aliases}
+        healthy = [alias for alias in aliases if lags[alias] is not None and lags[alias] <= max_lag]
+        return min(healthy, key=lags.get) if healthy else None
+    return aliases[next(_round_robin) % len(aliases)]
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica_reads or state.pinned:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        if state.alias is None:
+            state.alias = choose_replica() or DEFAULT_DB_ALIAS
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema through replication
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with routing_state(pinned=self.pin_cookie in request.COOKIES) as state:
+            response = self.get_response(request)
+        return self.pin(state, response)
+
+    async def __acall__(self, request):
+        with routing_state(pinned=self.pin_cookie in request.COOKIES) as state:
+            response = await self.get_response(request)
+        return self.pin(state, response)
+
+    @property
+    def pin_cookie(self):
+        return get_replica_setting('PIN_COOKIE')
+
+    def pin(self, state, response):
+        if state.wrote and replica_aliases():
+            response.set_cookie(self.pin_cookie, '1', max_age=get_replica_setting('PIN_SECONDS'),
+                                httponly=True, samesite='Lax')
+        return response
@@ -1,3 +1,21 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+
+@override_settings(INSTRUMENTATION={'ENABLED': True, 'METRICS_TOKEN': None})
+class MetricsViewTests(TestCase):
+    def test_disabled(self):
+        with override_settings(INSTRUMENTATION={'ENABLED': False}):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    def test_without_token_requires_staff(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        user = get_user_model().objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(INSTRUMENTATION={'ENABLED': True, 'METRICS_TOKEN': 'secret'})
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
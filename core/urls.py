@@ -4,5 +4,6 @@ from django.views.generic import TemplateView
 from . import views
 
 urlpatterns = [
-    path('', TemplateView.as_view(template_name='core/index.html'))
+    path('', TemplateView.as_view(template_name='core/index.html')),
+    path('metrics', views.metrics_view, name='metrics'),
 ]
@@ -1,3 +1,19 @@
-from django.shortcuts import render
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
 
-# Create your views here.
+from .instrumentation import get_instrumentation_setting, metrics
+
+
+def metrics_view(request):
+    if not get_instrumentation_setting('ENABLED'):
+        raise Http404
+    # per-view timings and connection stats are not public: a scraper sends
+    # the token, and without one configured only staff may look
+    token = get_instrumentation_setting('METRICS_TOKEN')
+    if token:
+        allowed = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
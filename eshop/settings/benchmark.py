@@ -0,0 +1,21 @@
+from .common import *
+
+# Settings for `manage.py benchmark_endpoints --settings=eshop.settings.benchmark`,
+# which seeds and measures a throwaway SQLite test database.
+DEBUG = False
+SECRET_KEY = 'benchmark-only-insecure-key-not-used-anywhere-else'
+
+ALLOWED_HOSTS = ['testserver']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'benchmark.sqlite3'),
+    }
+}
+
+IMAGE_PROCESSING = {
+    'EXECUTOR': 'off',
+}
+
+SILENCED_SYSTEM_CHECKS = ['debug_toolbar.W001']
@@ -28,6 +28,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'debug_toolbar',
     'rest_framework',
+    'django_filters',
     'corsheaders',
     'djoser',
     'rest_framework_simplejwt.token_blacklist',
@@ -38,9 +39,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.instrumentation.InstrumentationMiddleware',
+    'core.routers.ReplicaPinningMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -131,7 +134,7 @@ AUTH_USER_MODEL = 'account.User'
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING': False,
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'store.authentication.ClaimsJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
@@ -146,6 +149,13 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# Safe requests are authenticated from token claims. User flags are cached
+# for TIMEOUT seconds so deactivation takes effect; 0 trusts the token alone.
+JWT_USER_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 60,
+}
+
 DJOSER = {
     'USER_CREATE_PASSWORD_RETYPE': True,
     'SET_PASSWORD_RETYPE': True,
@@ -155,3 +165,74 @@ DJOSER = {
         'current_user': 'account.serializers.UserSerializer',
     }
 }
+
+# Cart storage backend. Use 'store.carts.KeyValueCartStore' with
+# OPTIONS {'URL': 'redis://...', 'TTL': <seconds>} to keep cart contents out
+# of SQL. Stock reservations (store.reservations) are written to SQL on
+# every add either way, so it does not reduce the database write load.
+CART_STORE = {
+    'BACKEND': 'store.carts.ORMCartStore',
+    'OPTIONS': {},
+}
+
+# Product and collection read responses are cached under a catalog version
+# that is bumped on every catalog change, bulk ones (checkout, imports)
+# included; the timeout only bounds how long unused entries are kept.
+CATALOG_CACHE_TIMEOUT = 60 * 5
+
+# Order events are stored in an outbox table at checkout and delivered by
+# `manage.py process_order_events`.
+ORDER_EVENTS = {
+    'BATCH_SIZE': 100,
+    'LEASE_SECONDS': 300,
+    'MAX_ATTEMPTS': 8,
+    'RETRY_BASE_SECONDS': 30,
+    'RETRY_MAX_SECONDS': 60 * 60,
+}
+
+# Resized product image variants, see store/images.py for all options.
+IMAGE_PROCESSING = {
+    'EXECUTOR': 'thread',
+    'WORKERS': 2,
+    'RENDER_PROCESSES': 0,
+}
+
+# Catalog delta sync (GET /store/products/changes/), see store/sync.py.
+# Tokens older than the tombstone retention get 410 and must resync.
+CATALOG_SYNC = {
+    'BATCH_SIZE': 500,
+    # must exceed the longest transaction that saves or deletes products
+    'SETTLE_SECONDS': 5,
+    'TOMBSTONE_RETENTION_DAYS': 30,
+}
+
+# Cart stock reservations, see store/reservations.py. Expired holds are
+# reaped on demand and by manage.py reap_stock_holds.
+STOCK_RESERVATIONS = {
+    'TTL_SECONDS': 15 * 60,
+    'REAP_BATCH_SIZE': 500,
+}
+
+# Shared cache of user id -> customer id, see store/customers.py.
+CUSTOMER_ID_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 60 * 60,
+}
+
+# Per-request query counts and timings as Server-Timing headers, sampled
+# JSON logs and /metrics histograms, see core/instrumentation.py.
+INSTRUMENTATION = {
+    'ENABLED': False,
+    'SAMPLE_RATE': 0.01,
+    'SLOW_REQUEST_MS': 500,
+    'SERVER_TIMING': True,
+    'METRICS_TOKEN': None,
+}
+
+# Catalog reads go to the replicas among DATABASES, see core/routers.py.
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+READ_REPLICAS = {
+    'SELECTION': 'round-robin',
+    'MAX_LAG_SECONDS': 5,
+    'PIN_SECONDS': 5,
+}
@@ -12,6 +12,43 @@ SECRET_KEY = os.environ['SECRET_KEY']
 
 ALLOWED_HOSTS = ['django-myeshop.de.r.appspot.com', 'django-myeshop.herokuapp.com']
 
+# Connections are kept for DB_CONN_MAX_AGE seconds (0 closes them after
+# every request) and pinged when idle, see core/connections.py. Under ASGI
+# Django 4.0 runs each request's sync code in a thread of its own, so kept
+# connections would pile up; they are closed after every request there.
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 0 if SERVER_MODE == 'asgi' else 600))
+
 DATABASES = {
-  'default': dj_database_url.config()
+  'default': dj_database_url.config(conn_max_age=DB_CONN_MAX_AGE)
+}
+# comma-separated URLs of read replicas of the default database
+for i, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica_{i}'] = dj_database_url.parse(url.strip(), conn_max_age=DB_CONN_MAX_AGE)
+
+DB_CONNECTIONS = {
+    'HEALTH_CHECK_IDLE_SECONDS': int(os.environ.get('DB_HEALTH_CHECK_IDLE_SECONDS', 30)),
+}
+
+READ_REPLICAS = {
+    **READ_REPLICAS,
+    'SELECTION': os.environ.get('READ_REPLICA_SELECTION', 'round-robin'),
+}
+
+INSTRUMENTATION = {
+    **INSTRUMENTATION,
+    'ENABLED': os.environ.get('INSTRUMENTATION_ENABLED', '0') == '1',
+    'SAMPLE_RATE': float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', '0.01')),
+    'METRICS_TOKEN': os.environ.get('METRICS_TOKEN'),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
 }
@@ -0,0 +1,32 @@
+import dj_database_url
+
+from .common import *
+
+# Settings for `manage.py test --settings=eshop.settings.test`. Tests run on
+# SQLite unless DATABASE_URL points at MySQL or PostgreSQL; the concurrency
+# tests need row locks and are skipped on SQLite.
+DEBUG = False
+SECRET_KEY = 'test-only-insecure-key-not-used-anywhere-else'
+
+ALLOWED_HOSTS = ['testserver']
+
+DATABASES = {
+    'default': dj_database_url.config(default=f"sqlite:///{os.path.join(BASE_DIR, 'test.sqlite3')}"),
+}
+# stand-ins for read replicas, mirrors of the test database; only the
+# replica routing tests turn them on
+for alias in ('replica_1', 'replica_2'):
+    DATABASES[alias] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+
+READ_REPLICAS = {
+    **READ_REPLICAS,
+    'ALIASES': [],
+}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+IMAGE_PROCESSING = {
+    'EXECUTOR': 'off',
+}
+
+SILENCED_SYSTEM_CHECKS = ['debug_toolbar.W001']
@@ -0,0 +1,19 @@
+import os
+
+# SERVER_MODE=asgi serves eshop.asgi with uvicorn workers: a slow client
+# then holds a coroutine instead of a worker thread (see store/async_views.py).
+if os.environ.get('SERVER_MODE', 'wsgi') == 'asgi':
+    wsgi_app = 'eshop.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'eshop.wsgi:application'
+
+# Every worker thread keeps one persistent connection per database (see
+# core/connections.py), so the connections a dyno holds to each database
+# are workers * threads; keep that under the database's connection limit.
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+
+# recycle workers now and then, which also renews their connections
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
@@ -1,12 +1,22 @@
+from datetime import timedelta
+
 from django.contrib import admin, messages
 from django.db.models.aggregates import Count
 from django.db.models.query import QuerySet
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html, urlencode
 
 from . import models
+from .analytics import sales_report, sales_series
+from .caching import bump_catalog_version
+from .exports import export_response
 from .models import Cart, CartItem, Collection, Order, Product
 
+def plain_queryset(queryset):
+    # drop changelist annotations so the export selects only its own columns
+    return queryset.model.objects.filter(pk__in=queryset.values('pk'))
+
 admin.site.register(Cart)
 admin.site.register(CartItem)
 
@@ -19,6 +29,15 @@ class CustomerAdmin(admin.ModelAdmin):
     list_select_related = ['user']
     ordering = ['user__first_name', 'user__last_name']
     search_fields = ['first_name__istartswith', 'last_name__istartswith']
+    actions = ['export_csv', 'export_ndjson']
+
+    @admin.action(description='Export selected customers as CSV')
+    def export_csv(self, request, queryset):
+        return export_response('customers', 'csv', plain_queryset(queryset))
+
+    @admin.action(description='Export selected customers as NDJSON')
+    def export_ndjson(self, request, queryset):
+        return export_response('customers', 'ndjson', plain_queryset(queryset))
 
     @admin.display(ordering='orders_count')
     def orders(self, customer):
@@ -56,10 +75,16 @@ class ProductImageInline(admin.TabularInline):
     readonly_fields = ['thumbnail']
 
     def thumbnail(self, instance):
+        for variant in instance.variants.all():
+            if variant.name == 'thumbnail':
+                return format_html('<img src="{}" class="thumbnail"/>', variant.file.url)
         if instance.image.name != '':
             return format_html(f'<img src="{instance.image.url}" class="thumbnail"/>')
         return ''
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('variants')
+
 @admin.register(models.Product)
 class ProductAdmin(admin.ModelAdmin):
     search_fields = ['title']
@@ -87,7 +112,8 @@ class ProductAdmin(admin.ModelAdmin):
 
     @admin.action(description='Clear inventory')
     def clear_inventory(self, request, queryset):
-        updated_count = queryset.update(inventory=0)
+        updated_count = queryset.update(inventory=0, last_update=timezone.now())
+        bump_catalog_version()
         self.message_user(
             request,
             f'{updated_count} products were successfully updated.',
@@ -97,11 +123,12 @@ class ProductAdmin(admin.ModelAdmin):
 @admin.register(models.Collection)
 class CollectionAdmin(admin.ModelAdmin):
     search_fields = ['title']
-    list_display = ['title', 'products_count']
+    list_display = ['title', 'products']
     
 
-    @admin.display(ordering='products_count')
-    def products_count(self, collection):
+    # a method named after the products_count field would be shadowed by it
+    @admin.display(ordering='products_count', description='products count')
+    def products(self, collection):
         url = (
             reverse('admin:store_product_changelist')
             + '?'
@@ -110,11 +137,6 @@ class CollectionAdmin(admin.ModelAdmin):
             }))
         return format_html('<a href="{}">{} Products</a>', url, collection.products_count)
 
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(
-            products_count=Count('products')
-        )
-
 class OrderItemInline(admin.TabularInline):
     autocomplete_fields = ['product']
     min_num = 1
@@ -127,5 +149,70 @@ class OrderAdmin(admin.ModelAdmin):
     autocomplete_fields = ['customer']
     inlines = [OrderItemInline]
     list_display = ['id', 'placed_at', 'customer']
-
-    
\ No newline at end of file
+    actions = ['export_csv', 'export_ndjson', 'export_items_csv']
+
+    @admin.action(description='Export selected orders as CSV')
+    def export_csv(self, request, queryset):
+        return export_response('orders', 'csv', plain_queryset(queryset))
+
+    @admin.action(description='Export selected orders as NDJSON')
+    def export_ndjson(self, request, queryset):
+        return export_response('orders', 'ndjson', plain_queryset(queryset))
+
+    @admin.action(description='Export items of selected orders as CSV')
+    def export_items_csv(self, request, queryset):
+        return export_response('order-items', 'csv', plain_queryset(queryset))
+
+@admin.register(models.OrderEvent)
+class OrderEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'order', 'event', 'status', 'attempts', 'available_at', 'processed_at']
+    list_filter = ['status', 'event']
+    list_select_related = ['order']
+    readonly_fields = ['created_at']
+
+class SalesRollupAdmin(admin.ModelAdmin):
+    date_hierarchy = 'period_start'
+    list_filter = ['period']
+    list_select_related = ['collection']
+    ordering = ['-period_start']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(models.ProductSalesRollup)
+class ProductSalesRollupAdmin(SalesRollupAdmin):
+    list_display = ['period_start', 'period', 'product', 'collection', 'revenue', 'units', 'orders']
+    list_select_related = ['product', 'collection']
+
+@admin.register(models.CollectionSalesRollup)
+class CollectionSalesRollupAdmin(SalesRollupAdmin):
+    list_display = ['period_start', 'period', 'collection', 'revenue', 'units', 'orders']
+    change_list_template = 'admin/store/sales_dashboard.html'
+    dashboard_days = 30
+
+    def changelist_view(self, request, extra_context=None):
+        start = timezone.now() - timedelta(days=self.dashboard_days)
+        day = models.SalesRollup.PERIOD_DAY
+        top_products = sales_report(day, 'product', start, limit=10)
+        titles = dict(Product.objects
+                      .filter(id__in=[row['product_id'] for row in top_products])
+                      .values_list('id', 'title'))
+        for row in top_products:
+            row['title'] = titles.get(row['product_id'])
+        collections = sales_report(day, 'collection', start)
+        titles = dict(Collection.objects
+                      .filter(id__in=[row['collection_id'] for row in collections])
+                      .values_list('id', 'title'))
+        for row in collections:
+            row['title'] = titles.get(row['collection_id'])
+        extra_context = {
+            'dashboard_days': self.dashboard_days,
+            'daily_sales': sales_series(day, start),
+            'top_products': top_products,
+            'collection_sales': collections,
+            **(extra_context or {}),
+        }
+        return super().changelist_view(request, extra_context)
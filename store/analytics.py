@@ -0,0 +1,224 @@
+"""
+Hourly and daily sales rollups.
+
+update_rollups() reads completed orders past its watermark in
+(completed_at, id) order, aggregates their items per product and per
+collection for each period, and adds the result to ProductSalesRollup and
+CollectionSalesRollup. Every batch and its watermark move commit together,
+so an order is counted exactly once even if the job is interrupted.
+Reports then read the rollup tables instead of scanning OrderItem.
+
+Product rollups are keyed by collection as well, as a product that moves
+collections keeps its earlier sales under the old one. Refunded or
+cancelled orders are read from a second watermark in (reversed_at, id)
+order and subtracted from the rows they were added to. Every reversed order
+was completed before it was reversed, so it is always added first.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import (CollectionSalesRollup, Order, OrderItem,
+                     ProductSalesRollup, RollupWatermark, SalesRollup)
+
+WATERMARK = 'sales_rollups'
+REVERSALS_WATERMARK = 'sales_rollup_reversals'
+# orders completed more recently than this are left for the next run, so a
+# transaction still in flight cannot commit behind the watermark
+SETTLE_SECONDS = 5
+PERIODS = {
+    SalesRollup.PERIOD_HOUR: TruncHour,
+    SalesRollup.PERIOD_DAY: TruncDay,
+}
+VALUE_FIELDS = ['revenue', 'units', 'orders']
+
+
+def _aggregate(order_ids, trunc, dimensions):
+    return OrderItem.objects \
+        .filter(order_id__in=order_ids) \
+        .annotate(period_start=trunc('order__placed_at')) \
+        .values('period_start', *dimensions) \
+        .annotate(
+            revenue=Sum(F('quantity') * F('unit_price'),
+                        output_field=DecimalField(max_digits=12, decimal_places=2)),
+            units=Sum('quantity'),
+            orders=Count('order_id', distinct=True),
+        ) \
+        .order_by()
+
+
+def _add(model, period, key_fields, rows):
+    """Add aggregated ``rows`` keyed by (period_start, *key_fields) to ``model``."""
+    rows = {(row['period_start'], *(row[field] for field in key_fields)): row for row in rows}
+    if not rows:
+        return
+    existing = model.objects \
+        .select_for_update() \
+        .filter(
+            period=period,
+            period_start__in={key[0] for key in rows},
+            **{f'{field}__in': {key[index] for key in rows} for index, field in enumerate(key_fields, 1)},
+        )
+    to_update = []
+    for rollup in existing:
+        row = rows.pop((rollup.period_start, *(getattr(rollup, field) for field in key_fields)), None)
+        if row is None:
+            continue
+        rollup.revenue += Decimal(row['revenue'])
+        rollup.units += row['units']
+        rollup.orders += row['orders']
+        to_update.append(rollup)
+    model.objects.bulk_update(to_update, VALUE_FIELDS)
+    model.objects.bulk_create([
+        model(
+            period=period,
+            period_start=key[0],
+            revenue=Decimal(row['revenue']),
+            units=row['units'],
+            orders=row['orders'],
+            **dict(zip(key_fields, key[1:])),
+        )
+        for key, row in rows.items()
+    ])
+
+
+def rollup_orders(order_ids):
+    for period, trunc in PERIODS.items():
+        _add(ProductSalesRollup, period, ['product_id', 'collection_id'], [
+            dict(row, collection_id=row['product__collection_id'])
+            for row in _aggregate(order_ids, trunc, ['product_id', 'product__collection_id'])
+        ])
+        _add(CollectionSalesRollup, period, ['collection_id'], [
+            dict(row, collection_id=row['product__collection_id'])
+            for row in _aggregate(order_ids, trunc, ['product__collection_id'])
+        ])
+
+
+def reverse_orders(order_ids):
+    """
+    Subtract reversed orders from the product rows they were added to. A
+    product that has since moved collections is taken off the row of the
+    collection it was counted under, and so is its collection total.
+    """
+    for period, trunc in PERIODS.items():
+        rows = list(_aggregate(order_ids, trunc, ['product_id', 'product__collection_id', 'order_id']))
+        if not rows:
+            continue
+        collections = {(row['period_start'], row['product_id']): row['product__collection_id'] for row in rows}
+        rollups = {}
+        for rollup in ProductSalesRollup.objects.select_for_update().filter(
+                period=period,
+                period_start__in={row['period_start'] for row in rows},
+                product_id__in={row['product_id'] for row in rows}):
+            key = (rollup.period_start, rollup.product_id)
+            # prefer the row of the product's current collection
+            if key in collections and (key not in rollups or rollup.collection_id == collections[key]):
+                rollups[key] = rollup
+
+        collection_rows = {}
+        for row in rows:
+            rollup = rollups.get((row['period_start'], row['product_id']))
+            if rollup is None:
+                continue
+            rollup.revenue -= Decimal(row['revenue'])
+            rollup.units -= row['units']
+            rollup.orders -= row['orders']
+            totals = collection_rows.setdefault((row['period_start'], rollup.collection_id), {
+                'revenue': Decimal(0), 'units': 0, 'orders': set(),
+            })
+            totals['revenue'] += Decimal(row['revenue'])
+            totals['units'] += row['units']
+            totals['orders'].add(row['order_id'])
+        ProductSalesRollup.objects.bulk_update(rollups.values(), VALUE_FIELDS)
+
+        for rollup in CollectionSalesRollup.objects.select_for_update().filter(
+                period=period,
+                period_start__in={period_start for period_start, _ in collection_rows},
+                collection_id__in={collection_id for _, collection_id in collection_rows}):
+            totals = collection_rows.get((rollup.period_start, rollup.collection_id))
+            if totals is not None:
+                rollup.revenue -= totals['revenue']
+                rollup.units -= totals['units']
+                rollup.orders -= len(totals['orders'])
+                rollup.save(update_fields=VALUE_FIELDS)
+
+
+def _consume(name, time_field, handle, until, batch_size):
+    """
+    Pass orders with ``time_field`` past watermark ``name`` and up to
+    ``until`` to ``handle`` in batches. Returns the number of orders read.
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.get_or_create(name=name)
+            # lock the watermark row so concurrent runs do not count orders twice
+            watermark = RollupWatermark.objects.select_for_update().get(id=watermark.id)
+            orders = Order.objects \
+                .filter(**{f'{time_field}__lte': until}) \
+                .order_by(time_field, 'id')
+            if watermark.position_at is not None:
+                orders = orders.filter(
+                    Q(**{f'{time_field}__gt': watermark.position_at}) |
+                    Q(**{time_field: watermark.position_at, 'id__gt': watermark.position_id})
+                )
+            orders = list(orders.values_list('id', time_field)[:batch_size])
+            if not orders:
+                return total
+            handle([order_id for order_id, _ in orders])
+            watermark.position_id, watermark.position_at = orders[-1]
+            watermark.save()
+        total += len(orders)
+
+
+def update_rollups(batch_size=1000):
+    """Roll up orders completed or reversed past the watermarks. Returns the number of orders read."""
+    until = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+    # completions first, so a reversal always finds the order it takes back
+    return _consume(WATERMARK, 'completed_at', rollup_orders, until, batch_size) \
+        + _consume(REVERSALS_WATERMARK, 'reversed_at', reverse_orders, until, batch_size)
+
+
+def rebuild_rollups(batch_size=1000):
+    with transaction.atomic():
+        ProductSalesRollup.objects.all().delete()
+        CollectionSalesRollup.objects.all().delete()
+        RollupWatermark.objects.filter(name__in=[WATERMARK, REVERSALS_WATERMARK]).delete()
+    return update_rollups(batch_size)
+
+
+def sales_report(period, by, start=None, end=None, limit=None):
+    """
+    Totals per product or collection (``by``) over the rollups of ``period``
+    starting in [start, end), largest revenue first.
+    """
+    model, key = (ProductSalesRollup, 'product_id') if by == 'product' else (CollectionSalesRollup, 'collection_id')
+    queryset = model.objects.filter(period=period)
+    if start is not None:
+        queryset = queryset.filter(period_start__gte=start)
+    if end is not None:
+        queryset = queryset.filter(period_start__lt=end)
+    rows = queryset \
+        .values(key) \
+        .annotate(revenue=Sum('revenue'), units=Sum('units'), orders=Sum('orders')) \
+        .order_by('-revenue', key)
+    return list(rows[:limit] if limit else rows)
+
+
+def sales_series(period, start=None, end=None):
+    """Store-wide revenue, units and orders per period, oldest first."""
+    queryset = CollectionSalesRollup.objects.filter(period=period)
+    if start is not None:
+        queryset = queryset.filter(period_start__gte=start)
+    if end is not None:
+        queryset = queryset.filter(period_start__lt=end)
+    return list(
+        queryset
+        .values('period_start')
+        .annotate(revenue=Sum('revenue'), units=Sum('units'))
+        .order_by('period_start')
+    )
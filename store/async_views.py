@@ -0,0 +1,85 @@
+"""
+Async read endpoints for ASGI deployments.
+
+Django 4.0 has no async ORM (``aget()``, ``aiterator()`` and ``acount()``
+arrive in 4.1) and DRF views are sync, so these views answer what they can
+from the catalog cache with the async cache API, and hand anything else to
+the DRF viewset through sync_to_async. A cache hit or a 304 therefore
+waits on the cache without holding a thread, and a miss runs exactly the
+code of the sync endpoint, serializers, permissions and replica routing
+included, then fills the cache for the requests after it.
+
+Requests are negotiated the way DRF negotiates them for the viewset, and
+only those it would answer with JSON take the cache path; the browsable
+API, unacceptable Accept headers (DRF's 406) and unsafe methods go to the
+viewset.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.utils.http import parse_etags
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .caching import (CATALOG_VERSION_KEY, catalog_etag, get_catalog_cache,
+                      request_cache_key)
+from .views import CartViewSet, CollectionViewSet, ProductViewSet
+
+
+def negotiate_json(viewset, request):
+    """
+    The JSON renderer and media type DRF would pick for the request, or
+    None for any other outcome.
+    """
+    renderers = [renderer() for renderer in viewset.renderer_classes]
+    try:
+        renderer, media_type = viewset.content_negotiation_class().select_renderer(Request(request), renderers)
+    except (Http404, NotAcceptable):
+        # the viewset answers these, an unknown ?format= is a 404
+        return None
+    return (renderer, media_type) if isinstance(renderer, JSONRenderer) else None
+
+
+async def cached_catalog_response(request, basename, action, renderer, media_type):
+    """The response CatalogCacheMixin would serve from the cache, or None."""
+    cache = get_catalog_cache()
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        return None
+    key = request_cache_key(version, basename, action, request.path, request.GET, renderer.format)
+    etag = catalog_etag(key, version)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    entry = await cache.aget(key)
+    if entry is None or entry['version'] != version:
+        return None
+    response = HttpResponse(renderer.render(entry['data'], media_type), content_type=renderer.media_type)
+    response['Vary'] = 'Accept'
+    if not entry.get('replica', False):
+        response['ETag'] = etag
+    return response
+
+
+def async_view(viewset, action, basename, detail, cached=True):
+    sync_view = sync_to_async(viewset.as_view({'get': action}, basename=basename, detail=detail))
+
+    async def view(request, *args, **kwargs):
+        negotiated = negotiate_json(viewset, request) if cached and request.method == 'GET' else None
+        if negotiated is not None:
+            response = await cached_catalog_response(request, basename, action, *negotiated)
+            if response is not None:
+                return response
+        return await sync_view(request, *args, **kwargs)
+    view.csrf_exempt = True
+    return view
+
+
+product_list = async_view(ProductViewSet, 'list', 'products', detail=False)
+product_detail = async_view(ProductViewSet, 'retrieve', 'products', detail=True)
+collection_list = async_view(CollectionViewSet, 'list', 'collections', detail=False)
+collection_detail = async_view(CollectionViewSet, 'retrieve', 'collections', detail=True)
+# carts are not cached, the view only moves off the event loop
+cart_detail = async_view(CartViewSet, 'retrieve', 'carts', detail=True, cached=False)
@@ -0,0 +1,118 @@
+"""
+JWT authentication backed by token claims.
+
+Access tokens carry ``is_staff``, ``is_superuser`` and ``customer_id``
+(see MyTokenObtainPairSerializer), so safe requests are authenticated
+from the token alone with a ClaimsUser and run no auth query. Unsafe
+requests still load the User row, so views that change the user (for
+example djoser's ``users/me``) get a model instance.
+
+With ``JWT_USER_CACHE['TIMEOUT']`` > 0 the user's is_active/is_staff flags
+are read from the cache, falling back to one query per timeout and user,
+so deactivated users and revoked staff rights take effect within the
+timeout. Saving or deleting a user drops its entry.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .customers import lookup_customer_id
+
+DEFAULT_JWT_USER_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 60,
+}
+USER_FLAGS = ('is_active', 'is_staff', 'is_superuser')
+
+
+def get_user_cache_setting(name):
+    return getattr(settings, 'JWT_USER_CACHE', {}).get(name, DEFAULT_JWT_USER_CACHE[name])
+
+
+def user_flags_key(user_id):
+    return f'store:jwt-user:{user_id}'
+
+
+def get_user_flags(user_id):
+    """
+    Return {is_active, is_staff, is_superuser} for the user from the cache,
+    or None when revocation checks are disabled. A missing user is cached
+    as inactive.
+    """
+    timeout = get_user_cache_setting('TIMEOUT')
+    if not timeout:
+        return None
+    cache = caches[get_user_cache_setting('ALIAS')]
+    key = user_flags_key(user_id)
+    flags = cache.get(key)
+    if flags is None:
+        values = get_user_model().objects.filter(id=user_id).values_list(*USER_FLAGS).first()
+        flags = dict(zip(USER_FLAGS, values or (False, False, False)))
+        cache.set(key, flags, timeout)
+    return flags
+
+
+def forget_user_flags(user_id):
+    if get_user_cache_setting('TIMEOUT'):
+        caches[get_user_cache_setting('ALIAS')].delete(user_flags_key(user_id))
+
+
+class ClaimsUser(TokenUser):
+    """
+    User built from token claims. Attributes the token does not carry,
+    such as email, are read from the User row, loaded on first use.
+    """
+
+    def __init__(self, token, flags=None):
+        super().__init__(token)
+        self.flags = flags or {}
+
+    @cached_property
+    def is_staff(self):
+        return self.flags.get('is_staff', self.token.get('is_staff', False))
+
+    @cached_property
+    def is_superuser(self):
+        return self.flags.get('is_superuser', self.token.get('is_superuser', False))
+
+    @cached_property
+    def customer_id(self):
+        if 'customer_id' in self.token:
+            return self.token['customer_id']
+        # tokens issued before the claim was added
+        return lookup_customer_id(self.id)
+
+    @cached_property
+    def user(self):
+        try:
+            return get_user_model().objects.get(**{api_settings.USER_ID_FIELD: self.id})
+        except get_user_model().DoesNotExist:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def authenticate(self, request):
+        self.safe_request = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        if not self.safe_request:
+            return super().get_user(validated_token)
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken('Token contained no recognizable user identification')
+        flags = get_user_flags(validated_token[api_settings.USER_ID_CLAIM])
+        if flags is not None and not flags['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return ClaimsUser(validated_token, flags)
@@ -0,0 +1,57 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import urlencode
+
+CATALOG_VERSION_KEY = 'store:catalog:version'
+DEFAULT_CATALOG_CACHE_TIMEOUT = 60 * 15
+
+
+def get_catalog_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def get_catalog_cache_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', DEFAULT_CATALOG_CACHE_TIMEOUT)
+
+
+def _initial_version():
+    # start from the clock so a version lost to eviction is never reused
+    return int(time.time() * 1000)
+
+
+def get_catalog_version():
+    cache = get_catalog_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = _initial_version()
+        if not cache.add(CATALOG_VERSION_KEY, version, timeout=None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    cache = get_catalog_cache()
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        version = _initial_version()
+        cache.set(CATALOG_VERSION_KEY, version, timeout=None)
+        return version
+
+
+def catalog_cache_key(version, *parts):
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'store:catalog:{version}:{digest}'
+
+
+def request_cache_key(version, basename, action, path, query_params, format):
+    """Cache key of a catalog response, shared by the sync and async views."""
+    query = urlencode(sorted(query_params.lists()), doseq=True)
+    return catalog_cache_key(version, basename, action, path, query, format)
+
+
+def catalog_etag(key, version):
+    return f'W/"{key.rsplit(":", 1)[-1]}-{version}"'
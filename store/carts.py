@@ -0,0 +1,556 @@
+import threading
+import time
+from datetime import timedelta
+from functools import lru_cache
+from uuid import UUID, uuid4
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Cart, CartItem, Product
+
+DEFAULT_CART_STORE = 'store.carts.ORMCartStore'
+DEFAULT_CART_TTL = 60 * 60 * 24 * 7
+
+
+class InsufficientInventory(Exception):
+    pass
+
+
+class WatchError(Exception):
+    """A key watched by a LocMemPipeline changed before execute()."""
+
+
+class CartStore:
+    """
+    Storage backend for carts and cart items.
+
+    Item ids are backend specific: the ORM store uses CartItem primary keys,
+    the key-value store uses the product id.
+    """
+
+    def create_cart(self):
+        raise NotImplementedError
+
+    def get_cart(self, cart_id):
+        raise NotImplementedError
+
+    def has_cart(self, cart_id):
+        raise NotImplementedError
+
+    def delete_cart(self, cart_id):
+        raise NotImplementedError
+
+    def count_items(self, cart_id):
+        raise NotImplementedError
+
+    def get_items(self, cart_id):
+        raise NotImplementedError
+
+    def get_item(self, cart_id, item_id):
+        raise NotImplementedError
+
+    def add_item(self, cart_id, product, quantity):
+        """
+        Add ``quantity`` of ``product`` to the cart. Raises
+        InsufficientInventory when the resulting quantity would exceed the
+        inventory; the check and the write are atomic without any lock held
+        by the caller.
+        """
+        raise NotImplementedError
+
+    def add_items(self, cart_id, lines):
+        """
+        Add several ``(product, quantity)`` lines at once. Raises
+        InsufficientInventory with the offending product ids, applying
+        nothing, when a resulting quantity would exceed the inventory.
+        """
+        raise NotImplementedError
+
+    def update_item(self, cart_id, item, quantity):
+        raise NotImplementedError
+
+    def remove_item(self, cart_id, item_id):
+        raise NotImplementedError
+
+
+class ORMCartStore(CartStore):
+    def __init__(self, **options):
+        pass
+
+    def _parse(self, cart_id):
+        try:
+            return UUID(str(cart_id))
+        except ValueError:
+            return None
+
+    def create_cart(self):
+        return Cart.objects.create()
+
+    def get_cart(self, cart_id):
+        cart_id = self._parse(cart_id)
+        if cart_id is None:
+            return None
+        return Cart.objects.prefetch_related('items__product').filter(id=cart_id).first()
+
+    def has_cart(self, cart_id):
+        cart_id = self._parse(cart_id)
+        return cart_id is not None and Cart.objects.filter(id=cart_id).exists()
+
+    def delete_cart(self, cart_id):
+        cart_id = self._parse(cart_id)
+        if cart_id is None:
+            return False
+        deleted, _ = Cart.objects.filter(id=cart_id).delete()
+        return deleted > 0
+
+    def count_items(self, cart_id):
+        return CartItem.objects.filter(cart_id=cart_id).count()
+
+    def get_items(self, cart_id):
+        return list(CartItem.objects.filter(cart_id=cart_id).select_related('product'))
+
+    def get_item(self, cart_id, item_id):
+        try:
+            return CartItem.objects.select_related('product').get(cart_id=cart_id, id=item_id)
+        except (CartItem.DoesNotExist, ValueError, ValidationError):
+            return None
+
+    def add_item(self, cart_id, product, quantity):
+        if self._increment(cart_id, product, quantity):
+            return self._get_line(cart_id, product)
+        if quantity > product.inventory:
+            raise InsufficientInventory
+        try:
+            with transaction.atomic():
+                return CartItem.objects.create(cart_id=cart_id, product=product, quantity=quantity)
+        except IntegrityError:
+            # the row exists, added concurrently or already holding too much;
+            # one more conditional update tells which
+            if self._increment(cart_id, product, quantity):
+                return self._get_line(cart_id, product)
+            raise InsufficientInventory
+
+    def _increment(self, cart_id, product, quantity):
+        # the inventory check is part of the UPDATE, so two concurrent adds
+        # to the same row cannot both pass it
+        return CartItem.objects.filter(
+            cart_id=cart_id, product_id=product.id, quantity__lte=product.inventory - quantity,
+        ).update(quantity=F('quantity') + quantity)
+
+    def _get_line(self, cart_id, product):
+        cart_item = CartItem.objects.get(cart_id=cart_id, product_id=product.id)
+        cart_item.product = product
+        return cart_item
+
+    def add_items(self, cart_id, lines):
+        # no savepoint of its own: shortages and retries only happen once the
+        # block is left, and failed writes roll back their inner savepoint
+        with transaction.atomic(savepoint=False):
+            existing = self._lock_lines(cart_id, lines)
+            shortages = []
+            to_update = []
+            to_create = []
+            for product, quantity in lines:
+                cart_item = existing.get(product.id)
+                total = quantity + (cart_item.quantity if cart_item is not None else 0)
+                if total > product.inventory:
+                    shortages.append(product.id)
+                elif cart_item is not None:
+                    cart_item.quantity = total
+                    to_update.append(cart_item)
+                else:
+                    to_create.append(CartItem(cart_id=cart_id, product=product, quantity=total))
+
+            collided = False
+            if not shortages:
+                try:
+                    with transaction.atomic():
+                        CartItem.objects.bulk_update(to_update, ['quantity'])
+                        CartItem.objects.bulk_create(to_create)
+                except IntegrityError:
+                    # a concurrent request inserted one of the products after
+                    # the read; the writes were rolled back, so start over
+                    collided = True
+        if collided:
+            return self.add_items(cart_id, lines)
+        if shortages:
+            raise InsufficientInventory(*shortages)
+        return to_update + to_create
+
+    def _lock_lines(self, cart_id, lines):
+        # the rows stay locked until the new quantities are written, so a
+        # concurrent add cannot slip in between the check and the write
+        return {
+            item.product_id: item for item in
+            CartItem.objects.select_for_update()
+            .filter(cart_id=cart_id, product_id__in=[product.id for product, _ in lines])
+        }
+
+    def update_item(self, cart_id, item, quantity):
+        item.quantity = quantity
+        item.save(update_fields=['quantity'])
+        return item
+
+    def remove_item(self, cart_id, item_id):
+        try:
+            deleted, _ = CartItem.objects.filter(cart_id=cart_id, id=item_id).delete()
+        except (ValueError, ValidationError):
+            return False
+        return deleted > 0
+
+
+class StoredCartItems(list):
+    # mimics the related manager so serializers can call items.all()
+    def all(self):
+        return self
+
+
+class StoredCart:
+    def __init__(self, id, created_at, items=None):
+        self.id = id
+        self.created_at = created_at
+        self.items = StoredCartItems(items or [])
+
+
+class StoredCartItem:
+    def __init__(self, cart_id, product, quantity):
+        self.id = product.id
+        self.cart_id = cart_id
+        self.product = product
+        self.product_id = product.id
+        self.quantity = quantity
+
+
+class KeyValueCartStore(CartStore):
+    """
+    Keeps each cart in one hash, ``cart:<uuid>``, holding a ``created_at``
+    field plus one ``<product_id>: <quantity>`` field per item. Every write
+    refreshes the key's TTL so abandoned carts expire on their own.
+
+    Adds check the inventory against the quantity read under WATCH and
+    write in MULTI/EXEC, retrying when the cart changed in between, so two
+    concurrent adds cannot both pass the check.
+
+    ``client`` is anything speaking the redis-py hash/pipeline API; when it
+    is omitted one is built from ``URL`` (``locmem://`` selects the
+    in-process LocMemClient).
+
+    Only the cart contents are kept here; the stock holds of the cart are
+    still written to SQL by store.reservations on every add.
+    """
+    CREATED_FIELD = 'created_at'
+
+    def __init__(self, client=None, URL='locmem://', TTL=DEFAULT_CART_TTL, KEY_PREFIX='cart', **options):
+        self.client = client if client is not None else self._connect(URL)
+        self.ttl = int(TTL)
+        self.key_prefix = KEY_PREFIX
+        self.watch_errors = (WatchError,)
+        try:
+            from redis.exceptions import WatchError as RedisWatchError
+        except ImportError:
+            pass
+        else:
+            self.watch_errors += (RedisWatchError,)
+
+    def _connect(self, url):
+        if url.startswith('locmem://'):
+            return LocMemClient()
+        try:
+            import redis
+        except ImportError as exc:
+            raise ImproperlyConfigured('KeyValueCartStore requires the redis package.') from exc
+        return redis.Redis.from_url(url, decode_responses=True)
+
+    def _key(self, cart_id):
+        return f'{self.key_prefix}:{cart_id}'
+
+    def _load_products(self, fields):
+        quantities = {
+            int(field): int(quantity) for field, quantity in fields.items()
+            if field != self.CREATED_FIELD
+        }
+        products = Product.objects.in_bulk(quantities)
+        return [
+            (products[product_id], quantity) for product_id, quantity in sorted(quantities.items())
+            if product_id in products
+        ]
+
+    def create_cart(self):
+        cart_id = uuid4()
+        created_at = timezone.now()
+        key = self._key(cart_id)
+        pipe = self.client.pipeline()
+        pipe.hset(key, self.CREATED_FIELD, created_at.isoformat())
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+        return StoredCart(cart_id, created_at)
+
+    def get_cart(self, cart_id):
+        key = self._key(cart_id)
+        pipe = self.client.pipeline()
+        pipe.hgetall(key)
+        pipe.expire(key, self.ttl)
+        fields, _ = pipe.execute()
+        if not fields:
+            return None
+        items = [
+            StoredCartItem(cart_id, product, quantity)
+            for product, quantity in self._load_products(fields)
+        ]
+        return StoredCart(cart_id, fields.get(self.CREATED_FIELD), items)
+
+    def has_cart(self, cart_id):
+        return bool(self.client.exists(self._key(cart_id)))
+
+    def delete_cart(self, cart_id):
+        return bool(self.client.delete(self._key(cart_id)))
+
+    def count_items(self, cart_id):
+        return max(self.client.hlen(self._key(cart_id)) - 1, 0)
+
+    def get_items(self, cart_id):
+        cart = self.get_cart(cart_id)
+        return list(cart.items) if cart is not None else []
+
+    def get_item(self, cart_id, item_id):
+        try:
+            product_id = int(item_id)
+        except (TypeError, ValueError):
+            return None
+        quantity = self.client.hget(self._key(cart_id), str(product_id))
+        if quantity is None:
+            return None
+        product = Product.objects.filter(id=product_id).first()
+        if product is None:
+            return None
+        return StoredCartItem(cart_id, product, int(quantity))
+
+    def _watched_add(self, key, lines):
+        """
+        Increment the cart's quantities by ``(product, quantity)`` lines if
+        none goes over its inventory. Returns the new quantities.
+        """
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    fields = pipe.hgetall(key)
+                    shortages = [
+                        product.id for product, quantity in lines
+                        if quantity + int(fields.get(str(product.id), 0)) > product.inventory
+                    ]
+                    if shortages:
+                        raise InsufficientInventory(*shortages)
+                    pipe.multi()
+                    for product, quantity in lines:
+                        pipe.hincrby(key, str(product.id), quantity)
+                    pipe.expire(key, self.ttl)
+                    return pipe.execute()[:-1]
+                except self.watch_errors:
+                    continue
+
+    def add_item(self, cart_id, product, quantity):
+        total, = self._watched_add(self._key(cart_id), [(product, quantity)])
+        return StoredCartItem(cart_id, product, int(total))
+
+    def add_items(self, cart_id, lines):
+        totals = self._watched_add(self._key(cart_id), lines)
+        return [
+            StoredCartItem(cart_id, product, int(total))
+            for (product, _), total in zip(lines, totals)
+        ]
+
+    def update_item(self, cart_id, item, quantity):
+        key = self._key(cart_id)
+        pipe = self.client.pipeline()
+        pipe.hset(key, str(item.product_id), quantity)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+        item.quantity = quantity
+        return item
+
+    def remove_item(self, cart_id, item_id):
+        key = self._key(cart_id)
+        pipe = self.client.pipeline()
+        pipe.hdel(key, str(item_id))
+        pipe.expire(key, self.ttl)
+        deleted, _ = pipe.execute()
+        return deleted > 0
+
+
+class LocMemClient:
+    """
+    Dict-backed stand-in for the subset of the redis-py API used by
+    KeyValueCartStore. Values are kept as strings, as with
+    ``decode_responses=True``. Every write bumps a per-key version, which
+    is what LocMemPipeline.watch() compares.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._versions = {}
+        self._lock = threading.RLock()
+
+    def _get(self, name):
+        expires = self._expires.get(name)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(name, None)
+            self._expires.pop(name, None)
+            self._touch(name)
+        return self._data.get(name)
+
+    def _touch(self, name):
+        self._versions[name] = self._versions.get(name, 0) + 1
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        with self._lock:
+            fields = dict(mapping or {})
+            if key is not None:
+                fields[key] = value
+            hash_ = self._get(name)
+            if hash_ is None:
+                hash_ = self._data[name] = {}
+            added = len(fields.keys() - hash_.keys())
+            hash_.update({str(k): str(v) for k, v in fields.items()})
+            self._touch(name)
+            return added
+
+    def hget(self, name, key):
+        with self._lock:
+            return (self._get(name) or {}).get(str(key))
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._get(name) or {})
+
+    def hincrby(self, name, key, amount=1):
+        with self._lock:
+            hash_ = self._get(name)
+            if hash_ is None:
+                hash_ = self._data[name] = {}
+            value = int(hash_.get(str(key), 0)) + amount
+            hash_[str(key)] = str(value)
+            self._touch(name)
+            return value
+
+    def hdel(self, name, *keys):
+        with self._lock:
+            hash_ = self._get(name) or {}
+            deleted = sum(1 for key in keys if hash_.pop(str(key), None) is not None)
+            if deleted:
+                self._touch(name)
+            if name in self._data and not hash_:
+                self.delete(name)
+            return deleted
+
+    def hlen(self, name):
+        with self._lock:
+            return len(self._get(name) or {})
+
+    def exists(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._get(name) is not None)
+
+    def delete(self, *names):
+        with self._lock:
+            deleted = 0
+            for name in names:
+                if self._get(name) is not None:
+                    deleted += 1
+                    self._touch(name)
+                self._data.pop(name, None)
+                self._expires.pop(name, None)
+            return deleted
+
+    def expire(self, name, time_):
+        with self._lock:
+            if self._get(name) is None:
+                return False
+            if isinstance(time_, timedelta):
+                time_ = time_.total_seconds()
+            self._expires[name] = time.monotonic() + time_
+            self._touch(name)
+            return True
+
+    def flushall(self):
+        with self._lock:
+            for name in self._data:
+                self._touch(name)
+            self._data.clear()
+            self._expires.clear()
+
+    def pipeline(self, transaction=True):
+        return LocMemPipeline(self)
+
+
+class LocMemPipeline:
+    """
+    Queues commands until execute(). As in redis-py, commands issued after
+    watch() and before multi() run immediately, and execute() raises
+    WatchError, running nothing, when a watched key changed since watch().
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.reset()
+
+    def reset(self):
+        self.commands = []
+        self.watched = {}
+        self.immediate = False
+
+    def watch(self, *names):
+        with self.client._lock:
+            for name in names:
+                self.watched[name] = self.client._versions.get(name, 0)
+        self.immediate = True
+
+    def multi(self):
+        self.immediate = False
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        if self.immediate:
+            return method
+
+        def queue(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        try:
+            with self.client._lock:
+                for name, version in self.watched.items():
+                    if self.client._versions.get(name, 0) != version:
+                        raise WatchError(name)
+                return [method(*args, **kwargs) for method, args, kwargs in self.commands]
+        finally:
+            self.reset()
+
+
+@lru_cache(maxsize=None)
+def get_cart_store():
+    config = getattr(settings, 'CART_STORE', {})
+    backend = import_string(config.get('BACKEND', DEFAULT_CART_STORE))
+    return backend(**config.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def reset_cart_store(sender, setting, **kwargs):
+    if setting == 'CART_STORE':
+        get_cart_store.cache_clear()
@@ -0,0 +1,60 @@
+"""
+Resolving the Customer of a user.
+
+Order and profile endpoints only need the customer id of the requesting
+user. get_customer_id() takes it from the token claim when there is one,
+memoizes it on the user object for the rest of the request, and otherwise
+reads it through a shared cache that the Customer signal handlers
+invalidate.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Customer
+
+DEFAULT_CUSTOMER_ID_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 60 * 60,
+}
+
+
+def get_customer_id_setting(name):
+    return getattr(settings, 'CUSTOMER_ID_CACHE', {}).get(name, DEFAULT_CUSTOMER_ID_CACHE[name])
+
+
+def customer_id_key(user_id):
+    return f'store:customer-id:{user_id}'
+
+
+def lookup_customer_id(user_id):
+    """Customer id for ``user_id`` via the shared cache, or None."""
+    timeout = get_customer_id_setting('TIMEOUT')
+    cache = caches[get_customer_id_setting('ALIAS')] if timeout else None
+    if cache is not None:
+        customer_id = cache.get(customer_id_key(user_id))
+        if customer_id is not None:
+            return customer_id
+    # order by id, Customer.Meta.ordering would join the user table
+    customer_id = Customer.objects.filter(user_id=user_id).order_by('id').values_list('id', flat=True).first()
+    if cache is not None and customer_id is not None:
+        cache.set(customer_id_key(user_id), customer_id, timeout)
+    return customer_id
+
+
+def get_customer_id(user):
+    """Customer id of ``user``, memoized on the user for the request."""
+    try:
+        return user.__dict__['_customer_id']
+    except KeyError:
+        pass
+    # ClaimsUser carries it in the token
+    customer_id = getattr(user, 'customer_id', None)
+    if customer_id is None:
+        customer_id = lookup_customer_id(user.id)
+    user.__dict__['_customer_id'] = customer_id
+    return customer_id
+
+
+def forget_customer_id(user_id):
+    if get_customer_id_setting('TIMEOUT'):
+        caches[get_customer_id_setting('ALIAS')].delete(customer_id_key(user_id))
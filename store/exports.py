@@ -0,0 +1,101 @@
+"""
+Streaming CSV/NDJSON exports of orders, order items and customers.
+
+Rows are built from ``values_list()`` and read with ``iterator()`` (a
+server-side cursor where the database supports one), then written through
+StreamingHttpResponse, so memory use does not grow with the row count and
+no serializer runs per row.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, DecimalField, F, Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Customer, Order, OrderItem
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def order_rows(queryset=None, chunk_size=CHUNK_SIZE):
+    queryset = Order.objects.all() if queryset is None else queryset
+    fields = ['id', 'placed_at', 'payment_status', 'customer_id', 'items_count', 'total']
+    rows = queryset \
+        .order_by('id') \
+        .annotate(
+            items_count=Count('items'),
+            total=Sum(F('items__quantity') * F('items__unit_price'),
+                      output_field=DecimalField(max_digits=9, decimal_places=2)),
+        ) \
+        .values_list(*fields) \
+        .iterator(chunk_size=chunk_size)
+    return fields, rows
+
+
+def order_item_rows(queryset=None, chunk_size=CHUNK_SIZE):
+    queryset = OrderItem.objects.all() if queryset is None else OrderItem.objects.filter(order__in=queryset)
+    fields = ['order_id', 'placed_at', 'payment_status', 'customer_id',
+              'product_id', 'product_title', 'quantity', 'unit_price']
+    rows = queryset \
+        .order_by('order_id', 'id') \
+        .values_list(
+            'order_id', 'order__placed_at', 'order__payment_status', 'order__customer_id',
+            'product_id', 'product__title', 'quantity', 'unit_price',
+        ) \
+        .iterator(chunk_size=chunk_size)
+    return fields, rows
+
+
+def customer_rows(queryset=None, chunk_size=CHUNK_SIZE):
+    queryset = Customer.objects.all() if queryset is None else queryset
+    fields = ['id', 'first_name', 'last_name', 'email', 'phone', 'birth_date', 'membership']
+    rows = queryset \
+        .order_by('id') \
+        .values_list(
+            'id', 'user__first_name', 'user__last_name', 'user__email',
+            'phone', 'birth_date', 'membership',
+        ) \
+        .iterator(chunk_size=chunk_size)
+    return fields, rows
+
+
+EXPORTS = {
+    'orders': order_rows,
+    'order-items': order_item_rows,
+    'customers': customer_rows,
+}
+
+
+def stream_csv(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_ndjson(fields, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def export_response(name, format='csv', queryset=None):
+    """StreamingHttpResponse with the ``name`` export as an attachment."""
+    fields, rows = EXPORTS[name](queryset)
+    stream = stream_csv if format == 'csv' else stream_ndjson
+    response = StreamingHttpResponse(stream(fields, rows), content_type=FORMATS[format])
+    filename = f"{name}-{timezone.now():%Y%m%d-%H%M%S}.{format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
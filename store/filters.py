@@ -0,0 +1,92 @@
+from django.db.models import Case, Count, IntegerField, Value, When
+from django_filters.rest_framework import (BooleanFilter, FilterSet,
+                                           IsoDateTimeFilter, NumberFilter)
+from rest_framework.filters import OrderingFilter
+
+from .models import Product
+
+# (label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = [
+    ('0-10', 0, 10),
+    ('10-25', 10, 25),
+    ('25-50', 25, 50),
+    ('50-100', 50, 100),
+    ('100+', 100, None),
+]
+
+
+class ProductFilter(FilterSet):
+    collection_id = NumberFilter(field_name='collection_id')
+    min_price = NumberFilter(field_name='unit_price', lookup_expr='gte')
+    max_price = NumberFilter(field_name='unit_price', lookup_expr='lte')
+    in_stock = BooleanFilter(method='filter_in_stock')
+    updated_since = IsoDateTimeFilter(field_name='last_update', lookup_expr='gte')
+
+    class Meta:
+        model = Product
+        fields = []
+
+    def filter_in_stock(self, queryset, name, value):
+        if value:
+            return queryset.filter(inventory__gt=0)
+        return queryset.filter(inventory__lte=0)
+
+
+def stable_ordering(ordering):
+    """
+    ``ordering`` with the primary key appended, in the direction of the
+    first field, so rows sharing the ordered values keep a fixed order
+    across pages.
+    """
+    ordering = list(ordering)
+    if ordering and not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+        ordering.append('-id' if ordering[0].startswith('-') else 'id')
+    return ordering
+
+
+class StableOrderingFilter(OrderingFilter):
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        return stable_ordering(ordering) if ordering else ordering
+
+
+def price_bucket():
+    whens = []
+    for index, (_, lower, upper) in enumerate(PRICE_BUCKETS):
+        if upper is None:
+            whens.append(When(unit_price__gte=lower, then=Value(index)))
+        else:
+            whens.append(When(unit_price__gte=lower, unit_price__lt=upper, then=Value(index)))
+    return Case(*whens, output_field=IntegerField())
+
+
+def product_facets(queryset):
+    """
+    Count ``queryset`` per collection and per price bucket with a single
+    GROUP BY (collection_id, bucket) query, summed in Python.
+    """
+    rows = queryset \
+        .order_by() \
+        .annotate(price_bucket=price_bucket()) \
+        .values('collection_id', 'price_bucket') \
+        .annotate(count=Count('id'))
+
+    collections = {}
+    buckets = [0] * len(PRICE_BUCKETS)
+    total = 0
+    for row in rows:
+        collections[row['collection_id']] = collections.get(row['collection_id'], 0) + row['count']
+        if row['price_bucket'] is not None:
+            buckets[row['price_bucket']] += row['count']
+        total += row['count']
+    return {
+        'count': total,
+        'collections': [
+            {'collection_id': collection_id, 'count': count}
+            for collection_id, count in sorted(collections.items())
+        ],
+        'price_buckets': [
+            {'range': label, 'min': lower, 'max': upper, 'count': count}
+            for (label, lower, upper), count in zip(PRICE_BUCKETS, buckets)
+        ],
+    }
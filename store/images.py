@@ -0,0 +1,173 @@
+"""
+Resized product image variants.
+
+Originals are stored as uploaded. After the upload commits, the image is
+handed to a background executor that renders one file per configured size
+and format with Pillow, stores it under a content-hash name and records a
+ProductImageVariant row for it. ``manage.py process_product_images``
+renders anything that was missed, for example after a restart. Variant
+files are shared by content hash, so a file is deleted once no variant row
+refers to it any more.
+"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .caching import bump_catalog_version
+from .models import Product, ProductImage, ProductImageVariant
+
+DEFAULT_IMAGE_PROCESSING = {
+    # 'thread' runs jobs on a thread pool inside the web process, 'sync'
+    # renders inline, 'off' leaves images to process_product_images.
+    'EXECUTOR': 'thread',
+    'WORKERS': 2,
+    # >0 renders in a process pool of that size so resizing does not
+    # compete with request threads for the GIL
+    'RENDER_PROCESSES': 0,
+    'SIZES': {'thumbnail': 150, 'small': 400, 'large': 1200},
+    'FORMATS': ['webp', 'jpeg'],
+    'QUALITY': 80,
+    'UPLOAD_TO': 'store/images/variants',
+}
+PIL_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+RESAMPLE = getattr(Image, 'Resampling', Image).LANCZOS
+
+logger = logging.getLogger(__name__)
+
+_executor_lock = threading.Lock()
+_executors = {}
+
+
+def get_image_setting(name):
+    return getattr(settings, 'IMAGE_PROCESSING', {}).get(name, DEFAULT_IMAGE_PROCESSING[name])
+
+
+def render_variants(data, sizes, formats, quality):
+    """
+    Render every (size, format) pair of the image in ``data``. Pure function
+    of its arguments so it can run in a worker process. Returns a list of
+    dicts with name, format, width, height, content and content_hash.
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        original = ImageOps.exif_transpose(original)
+        original.load()
+
+    variants = []
+    for name, width in sizes.items():
+        width = min(width, original.width)
+        height = max(round(original.height * width / original.width), 1)
+        resized = original.resize((width, height), RESAMPLE)
+        for format in formats:
+            image = resized
+            if format == 'jpeg' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            elif format == 'webp' and image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            buffer = io.BytesIO()
+            image.save(buffer, PIL_FORMATS[format], quality=quality, optimize=True)
+            content = buffer.getvalue()
+            variants.append({
+                'name': name,
+                'format': format,
+                'width': width,
+                'height': height,
+                'content': content,
+                'content_hash': hashlib.sha256(content).hexdigest(),
+            })
+    return variants
+
+
+def _get_executor(kind, workers):
+    with _executor_lock:
+        executor = _executors.get(kind)
+        if executor is None:
+            if kind == 'process':
+                executor = ProcessPoolExecutor(max_workers=workers)
+            else:
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='product-images')
+            _executors[kind] = executor
+        return executor
+
+
+def render(data):
+    args = (data, get_image_setting('SIZES'), get_image_setting('FORMATS'), get_image_setting('QUALITY'))
+    processes = get_image_setting('RENDER_PROCESSES')
+    if processes:
+        return _get_executor('process', processes).submit(render_variants, *args).result()
+    return render_variants(*args)
+
+
+def process_image(product_image_id):
+    """Render and store the variants of one ProductImage."""
+    product_image = ProductImage.objects.filter(id=product_image_id).first()
+    if product_image is None or not product_image.image:
+        return []
+    with product_image.image.open('rb') as file:
+        data = file.read()
+
+    upload_to = get_image_setting('UPLOAD_TO')
+    variants = []
+    for variant in render(data):
+        name = f"{upload_to}/{variant['content_hash'][:32]}.{variant['format']}"
+        if not default_storage.exists(name):
+            name = default_storage.save(name, ContentFile(variant['content']))
+        variants.append(ProductImageVariant(
+            image=product_image,
+            name=variant['name'],
+            format=variant['format'],
+            width=variant['width'],
+            height=variant['height'],
+            file=name,
+            content_hash=variant['content_hash'],
+        ))
+
+    with transaction.atomic():
+        ProductImageVariant.objects.filter(image=product_image).delete()
+        ProductImageVariant.objects.bulk_create(variants)
+        ProductImage.objects.filter(id=product_image.id).update(processed_at=timezone.now())
+        Product.objects.filter(id=product_image.product_id).update(last_update=timezone.now())
+        transaction.on_commit(bump_catalog_version)
+    return variants
+
+
+def delete_variant_files(names):
+    """Delete the stored variant files no remaining variant refers to."""
+    referenced = set(ProductImageVariant.objects.filter(file__in=names).values_list('file', flat=True))
+    for name in set(names) - referenced:
+        default_storage.delete(name)
+
+
+def _process_logged(product_image_id):
+    # the upload has already committed; a failed render must not fail it
+    try:
+        process_image(product_image_id)
+    except Exception:
+        logger.exception('Rendering the variants of product image %s failed', product_image_id)
+
+
+def _run_job(product_image_id):
+    try:
+        _process_logged(product_image_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_image_processing(product_image_id):
+    """Queue variant rendering for when the current transaction commits."""
+    executor = get_image_setting('EXECUTOR')
+    if executor == 'off':
+        return
+    if executor == 'sync':
+        transaction.on_commit(lambda: _process_logged(product_image_id))
+        return
+    pool = _get_executor('thread', get_image_setting('WORKERS'))
+    transaction.on_commit(lambda: pool.submit(_run_job, product_image_id))
@@ -0,0 +1,141 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from store.caching import bump_catalog_version
+from store.models import Collection, Product, ProductImage
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the throughput of the catalog endpoints served by WSGI worker threads, '
+        'by ASGI with the sync views and by ASGI with the async views, on one seeded test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=100, help='Clients in flight at once.')
+        parser.add_argument('--threads', type=int, default=4, help='Threads of the WSGI worker.')
+        parser.add_argument('--client-delay', type=float, default=20,
+                            help='Milliseconds a slow client takes to read each response.')
+        parser.add_argument('--cold', action='store_true', help='Invalidate the catalog cache before every request.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1 or options['threads'] < 1:
+            raise CommandError('--requests, --concurrency and --threads must be at least 1.')
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.seed(options['products'])
+            with override_settings(ALLOWED_HOSTS=['*']):
+                for name, run, path in (
+                    (f'WSGI, {options["threads"]} threads', self.run_wsgi, '/store/products/'),
+                    ('ASGI, sync views', self.run_asgi, '/store/products/'),
+                    ('ASGI, async views', self.run_asgi, '/store/async/products/'),
+                ):
+                    bump_catalog_version()
+                    elapsed, timings = run(path, options)
+                    timings.sort()
+                    self.stdout.write(
+                        f'{name:<20} {len(timings) / elapsed:8.1f} req/s, '
+                        f'{statistics.median(timings):8.2f} ms median, '
+                        f'{timings[int(0.95 * (len(timings) - 1))]:8.2f} ms p95'
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, count):
+        collection = Collection.objects.create(title='benchmark asgi')
+        Product.objects.bulk_create(
+            Product(title=f'benchmark asgi {i}', unit_price=Decimal('9.99'), inventory=10, collection=collection)
+            for i in range(count)
+        )
+        ProductImage.objects.bulk_create(
+            ProductImage(product_id=product_id, image=f'store/images/benchmark-{product_id}.jpg')
+            for product_id in Product.objects.values_list('id', flat=True)
+        )
+
+    def run_wsgi(self, path, options):
+        handler = WSGIHandler()
+        environ = RequestFactory().get(path).environ
+        delay = options['client_delay'] / 1000
+
+        def request():
+            if options['cold']:
+                bump_catalog_version()
+            response = handler(dict(environ), lambda status, headers: None)
+            # a sync worker thread stays busy until the client has read the body
+            time.sleep(delay)
+            b''.join(response)
+            response.close()
+            if response.status_code != 200:
+                raise CommandError(f'GET {path} returned {response.status_code}.')
+
+        # each client waits for a free worker thread, as on a real socket
+        with ThreadPoolExecutor(max_workers=options['threads']) as workers, \
+                ThreadPoolExecutor(max_workers=options['concurrency']) as clients:
+            def client(_):
+                start = time.perf_counter()
+                workers.submit(request).result()
+                return (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            timings = list(clients.map(client, range(options['requests'])))
+            return time.perf_counter() - start, timings
+
+    def run_asgi(self, path, options):
+        return asyncio.run(self.drive_asgi(path, options))
+
+    async def drive_asgi(self, path, options):
+        handler = ASGIHandler()
+        delay = options['client_delay'] / 1000
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'query_string': b'', 'root_path': '', 'headers': [(b'host', b'testserver')],
+            'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def request():
+            status = None
+
+            async def send(message):
+                nonlocal status
+                if message['type'] == 'http.response.start':
+                    status = message['status']
+                elif not message.get('more_body'):
+                    # the slow client holds a coroutine, not a thread
+                    await asyncio.sleep(delay)
+
+            if options['cold']:
+                bump_catalog_version()
+            start = time.perf_counter()
+            await handler(dict(scope), receive, send)
+            if status != 200:
+                raise CommandError(f'GET {path} returned {status}.')
+            return (time.perf_counter() - start) * 1000
+
+        remaining = iter(range(options['requests']))
+        timings = []
+
+        async def client():
+            for _ in remaining:
+                timings.append(await request())
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options['concurrency'])))
+        return time.perf_counter() - start, timings
@@ -0,0 +1,67 @@
+import statistics
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from core.connections import stats
+from store.caching import bump_catalog_version
+
+
+class Command(BaseCommand):
+    help = (
+        'Time GET requests through the WSGI handler with connections closed after every request '
+        'and with persistent connections. Reads from the configured, migrated database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/store/products/')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--max-age', type=int, default=600, help='CONN_MAX_AGE of the persistent run.')
+
+    def handle(self, *args, **options):
+        # unlike the test client, the WSGI handler sends the request signals
+        # that close and health-check connections
+        handler = WSGIHandler()
+        max_ages = {connection.alias: connection.settings_dict['CONN_MAX_AGE'] for connection in connections.all()}
+        try:
+            self.compare(handler, options)
+        finally:
+            for connection in connections.all():
+                connection.close()
+                connection.settings_dict['CONN_MAX_AGE'] = max_ages[connection.alias]
+
+    def compare(self, handler, options):
+        with override_settings(ALLOWED_HOSTS=['*']):
+            for name, max_age in (('closed per request', 0), (f'CONN_MAX_AGE={options["max_age"]}', options['max_age'])):
+                timings, opened = self.run(handler, options['path'], options['requests'], max_age)
+                timings.sort()
+                self.stdout.write(
+                    f'{name:<22} {statistics.median(timings):7.2f} ms median, '
+                    f'{timings[int(0.95 * (len(timings) - 1))]:7.2f} ms p95, {opened} connections opened'
+                )
+
+    def run(self, handler, path, count, max_age):
+        for connection in connections.all():
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = max_age
+        environ = RequestFactory().get(path).environ
+        opened_before = self.opened()
+        timings = []
+        for _ in range(count):
+            # a cached catalog response would not touch the database
+            bump_catalog_version()
+            start = time.perf_counter()
+            response = handler(environ, lambda status, headers: None)
+            b''.join(response)
+            response.close()
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'GET {path} returned {response.status_code}.')
+        return timings, self.opened() - opened_before
+
+    def opened(self):
+        return sum(values['opened'] for values in stats.snapshot().values())
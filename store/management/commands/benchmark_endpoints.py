@@ -0,0 +1,410 @@
+import json
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+from itertools import count
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from store import urls
+from store.analytics import rollup_orders
+from store.caching import bump_catalog_version
+from store.models import (Collection, Customer, Order, OrderItem, Product,
+                          ProductImage, ProductImageVariant)
+from store.search import rebuild_index
+from store.serializers import MyTokenObtainPairSerializer
+
+
+class Endpoint:
+    """
+    One request to measure. ``prepare`` runs before every request, outside
+    the measurement, and returns the URL kwargs and the request body.
+    """
+
+    def __init__(self, route, method, budget, user='anonymous', prepare=None, query=None, status=200, label=None):
+        self.route = route
+        self.method = method
+        self.budget = budget
+        self.user = user
+        self.prepare = prepare
+        self.query = query or {}
+        self.status = status
+        self.label = label or f'{method} {route}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database and measure queries, latency and memory of every store endpoint. '
+        'Exits with an error when an endpoint goes over its query budget. '
+        'Run with --settings=eshop.settings.benchmark to use SQLite.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collections', type=int, default=10)
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--images', type=int, default=2, help='Images per product.')
+        parser.add_argument('--customers', type=int, default=50)
+        parser.add_argument('--carts', type=int, default=20)
+        parser.add_argument('--cart-items', type=int, default=5, help='Items per cart.')
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--order-items', type=int, default=3, help='Items per order.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep catalog responses cached between requests.')
+        parser.add_argument('--output', default='benchmark_endpoints.json', help='Path of the JSON report.')
+
+    def handle(self, *args, **options):
+        for name in ('collections', 'products', 'images', 'customers', 'carts', 'cart_items', 'orders', 'repeat'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1.")
+
+        # a fresh test database, so the benchmark never touches real data
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=['*'], IMAGE_PROCESSING={'EXECUTOR': 'off'}):
+                self.seed(options)
+                endpoints = self.endpoints()
+                self.check_coverage(endpoints)
+                results = [self.measure(endpoint, options['repeat'], options['warm_cache']) for endpoint in endpoints]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'database': connection.vendor,
+            'dataset': {name: options[name] for name in (
+                'collections', 'products', 'images', 'customers', 'carts', 'cart_items', 'orders', 'order_items'
+            )},
+            'repeat': options['repeat'],
+            'warm_cache': options['warm_cache'],
+            'endpoints': results,
+        }
+        with open(options['output'], 'w') as file:
+            json.dump(report, file, indent=2)
+
+        for result in results:
+            line = (
+                f"{result['label']:<45} {result['queries']:>3}/{result['budget']:<3} queries "
+                f"{result['p50_ms']:8.2f} ms p50 {result['p95_ms']:8.2f} ms p95 "
+                f"{result['peak_kib']:9.1f} KiB peak"
+            )
+            self.stdout.write(self.style.ERROR(line) if result['errors'] else line)
+        self.stdout.write(f"Report written to {options['output']}.")
+
+        failed = [result for result in results if result['errors']]
+        if failed:
+            raise CommandError('\n'.join(
+                f"{result['label']}: {error}" for result in failed for error in result['errors']
+            ))
+
+    # Dataset
+
+    def seed(self, options):
+        self.titles = count()
+        now = timezone.now()
+
+        Collection.objects.bulk_create(
+            Collection(title=f'benchmark collection {i}') for i in range(options['collections'])
+        )
+        collection_ids = list(Collection.objects.order_by('id').values_list('id', flat=True))
+        Product.objects.bulk_create(
+            Product(
+                title=f'benchmark product {i}',
+                description=f'synthetic product {i} for endpoint benchmarks',
+                unit_price=Decimal(i % 500) + Decimal('0.99'),
+                inventory=10 ** 6,
+                collection_id=collection_ids[i % len(collection_ids)],
+            )
+            for i in range(options['products'])
+        )
+        self.product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        Collection.objects.all().recount_products()
+        self.collection_id = collection_ids[0]
+        self.product_id = self.product_ids[0]
+
+        ProductImage.objects.bulk_create(
+            ProductImage(product_id=product_id, image=f'store/images/benchmark-{product_id}-{i}.jpg', processed_at=now)
+            for product_id in self.product_ids
+            for i in range(options['images'])
+        )
+        image_ids = list(ProductImage.objects.order_by('id').values_list('id', flat=True))
+        ProductImageVariant.objects.bulk_create(
+            ProductImageVariant(image_id=image_id, name=name, format='webp', width=width, height=width,
+                                file=f'store/images/variants/benchmark-{image_id}-{name}.webp', content_hash='')
+            for image_id in image_ids
+            for name, width in (('thumbnail', 150), ('medium', 600))
+        )
+        self.image_id = image_ids[0]
+        rebuild_index()
+
+        # bulk_create skips the signal that creates customers, and the
+        # password hasher would dominate the seeding time
+        User = get_user_model()
+        User.objects.bulk_create(
+            User(username=f'benchmark-{i}', email=f'benchmark-{i}@example.com', password='!')
+            for i in range(options['customers'])
+        )
+        Customer.objects.bulk_create(
+            Customer(user_id=user_id, phone='0912345678')
+            for user_id in User.objects.filter(username__startswith='benchmark-').order_by('id').values_list('id', flat=True)
+        )
+        customer_ids = list(Customer.objects.order_by('id').values_list('id', flat=True))
+        self.customer_id = customer_ids[0]
+        customer_user = User.objects.get(customer__id=self.customer_id)
+        admin = User.objects.create_superuser('benchmark-admin', 'benchmark-admin@example.com', 'benchmark')
+
+        self.clients = {'anonymous': APIClient()}
+        for name, user in (('customer', customer_user), ('admin', admin)):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'JWT {MyTokenObtainPairSerializer.get_token(user).access_token}')
+            self.clients[name] = client
+
+        with transaction.atomic():
+            statuses = [Order.PAYMENT_STATUS_COMPLETE, Order.PAYMENT_STATUS_PENDING, Order.PAYMENT_STATUS_FAILED]
+            Order.objects.bulk_create(
+                Order(
+                    customer_id=customer_ids[i % len(customer_ids)],
+                    address=f'{i} Benchmark Street',
+                    payment_status=statuses[i % len(statuses)],
+                    completed_at=now if i % len(statuses) == 0 else None,
+                )
+                for i in range(options['orders'])
+            )
+            order_ids = list(Order.objects.order_by('id').values_list('id', flat=True))
+            OrderItem.objects.bulk_create(
+                OrderItem(
+                    order_id=order_id,
+                    product_id=self.product_ids[(i + j) % len(self.product_ids)],
+                    quantity=j + 1,
+                    unit_price=Decimal('9.99'),
+                )
+                for i, order_id in enumerate(order_ids)
+                for j in range(options['order_items'])
+            )
+            rollup_orders(order_ids[::len(statuses)])
+        self.order_id = order_ids[0]
+
+        self.cart_items = options['cart_items']
+        self.cart_ids = [self.new_cart(options['cart_items']) for _ in range(options['carts'])]
+        self.cart_id = self.cart_ids[0]
+        self.cart_item_id = self.clients['anonymous'].get(
+            reverse('cart-items-list', kwargs={'cart_pk': self.cart_id})
+        ).data[0]['id']
+
+    def request(self, user, method, url, data=None):
+        response = getattr(self.clients[user], method.lower())(url, data, format='json')
+        if response.status_code >= 400:
+            raise CommandError(f'{method} {url} failed with {response.status_code}: {response.data}')
+        return response
+
+    def new_cart(self, items):
+        cart_id = self.request('customer', 'POST', reverse('carts-list')).data['id']
+        if items:
+            self.request('customer', 'POST', reverse('cart-items-batch', kwargs={'cart_pk': cart_id}), [
+                {'product_id': product_id, 'quantity': 1} for product_id in self.product_ids[:items]
+            ])
+        return cart_id
+
+    def title(self, prefix):
+        return f'{prefix} {next(self.titles)}'
+
+    # Endpoints
+
+    def endpoints(self):
+        product = {'pk': self.product_id}
+        image = {'product_pk': self.product_id, 'pk': self.image_id}
+        cart = {'pk': self.cart_id}
+        cart_items = {'cart_pk': self.cart_id}
+        cart_item = {'cart_pk': self.cart_id, 'pk': self.cart_item_id}
+
+        def fixed(kwargs=None, data=None):
+            return lambda: (kwargs or {}, data)
+
+        def new_product():
+            product = Product.objects.create(title=self.title('benchmark deleted'), unit_price=1, inventory=1,
+                                             collection_id=self.collection_id)
+            return {'pk': product.id}, None
+
+        def new_collection():
+            return {'pk': Collection.objects.create(title=self.title('benchmark empty')).id}, None
+
+        def new_empty_cart():
+            return {'pk': self.new_cart(0)}, None
+
+        def add_to_new_cart():
+            return {'cart_pk': self.new_cart(0)}, {'product_id': self.product_id, 'quantity': 1}
+
+        def batch_to_new_cart(items):
+            return lambda: ({'cart_pk': self.new_cart(0)}, [
+                {'product_id': product_id, 'quantity': 1} for product_id in self.product_ids[:items]
+            ])
+
+        def item_in_new_cart():
+            cart_id = self.new_cart(1)
+            item_id = self.request('customer', 'GET', reverse('cart-items-list', kwargs={'cart_pk': cart_id})).data[0]['id']
+            return {'cart_pk': cart_id, 'pk': item_id}, None
+
+        quantities = count(1)
+
+        def new_quantity():
+            return cart_item, {'quantity': next(quantities) % 5 + 1}
+
+        def checkout(items):
+            return lambda: ({}, {'cart_id': str(self.new_cart(items)), 'address': 'Benchmark Street'})
+
+        # Budgets are the queries each endpoint is meant to take, not what it
+        # happened to take when measured. None grows with the dataset, and
+        # batch adds and checkout cost the same for one item as for a full
+        # cart (so both are also measured with one item). Orders take 2
+        # queries, authenticated reads no auth query, and a cart item PATCH
+        # its read and write plus the stock reservation.
+        return [
+            Endpoint('api-root', 'GET', 0),
+
+            Endpoint('products-list', 'GET', 4),
+            Endpoint('products-list', 'GET', 4, label='GET products-list filtered',
+                     query={'collection_id': self.collection_id, 'ordering': '-unit_price'}),
+            Endpoint('products-list', 'GET', 3, label='GET products-list cursor', query={'pagination': 'cursor'}),
+            Endpoint('products-list', 'POST', 13, user='admin', status=201, prepare=lambda: ({}, {
+                'title': self.title('benchmark created'), 'price': '9.99', 'inventory': 10,
+                'collection': self.collection_id,
+            })),
+            Endpoint('products-detail', 'GET', 3, prepare=fixed(product)),
+            Endpoint('products-detail', 'PATCH', 19, user='admin', prepare=lambda: (product, {
+                'title': self.title('benchmark renamed'),
+            })),
+            Endpoint('products-detail', 'DELETE', 17, user='admin', status=204, prepare=new_product),
+            Endpoint('products-changes', 'GET', 2, query={'limit': 100}),
+            Endpoint('products-facets', 'GET', 1),
+            Endpoint('products-search', 'GET', 7, query={'q': 'benchmark prod'}),
+
+            Endpoint('product-images-list', 'GET', 2, prepare=fixed({'product_pk': self.product_id})),
+            Endpoint('product-images-detail', 'GET', 2, prepare=fixed(image)),
+
+            Endpoint('collections-list', 'GET', 1),
+            Endpoint('collections-list', 'POST', 4, user='admin', status=201, prepare=lambda: ({}, {
+                'title': self.title('benchmark collection created'),
+            })),
+            Endpoint('collections-detail', 'GET', 1, prepare=fixed({'pk': self.collection_id})),
+            Endpoint('collections-detail', 'PATCH', 5, user='admin', prepare=lambda: ({'pk': self.collection_id}, {
+                'title': self.title('benchmark collection renamed'),
+            })),
+            Endpoint('collections-detail', 'DELETE', 7, user='admin', status=204, prepare=new_collection),
+
+            Endpoint('carts-list', 'POST', 3, status=201),
+            Endpoint('carts-detail', 'GET', 3, prepare=fixed(cart)),
+            Endpoint('carts-detail', 'DELETE', 7, user='customer', status=204, prepare=new_empty_cart),
+
+            Endpoint('cart-items-list', 'GET', 2, prepare=fixed(cart_items)),
+            Endpoint('cart-items-list', 'POST', 16, user='customer', status=201, prepare=add_to_new_cart),
+            Endpoint('cart-items-detail', 'GET', 2, prepare=fixed(cart_item)),
+            Endpoint('cart-items-detail', 'PATCH', 13, user='customer', prepare=new_quantity),
+            Endpoint('cart-items-detail', 'DELETE', 9, user='customer', status=204, prepare=item_in_new_cart),
+            Endpoint('cart-items-batch', 'POST', 19, user='customer', prepare=batch_to_new_cart(self.cart_items)),
+            Endpoint('cart-items-batch', 'POST', 19, user='customer', prepare=batch_to_new_cart(1),
+                     label='POST cart-items-batch one item'),
+
+            Endpoint('customers-list', 'GET', 2, user='admin'),
+            Endpoint('customers-detail', 'GET', 1, user='admin', prepare=fixed({'pk': self.customer_id})),
+            Endpoint('customers-me', 'GET', 1, user='customer'),
+            Endpoint('customers-me', 'PUT', 4, user='customer', prepare=fixed(data={'phone': '0912345678'})),
+            Endpoint('customers-export', 'GET', 1, user='admin'),
+
+            Endpoint('orders-list', 'GET', 2, user='customer'),
+            Endpoint('orders-list', 'GET', 2, user='admin', label='GET orders-list staff'),
+            Endpoint('orders-list', 'POST', 19, user='customer', prepare=checkout(self.cart_items)),
+            Endpoint('orders-list', 'POST', 19, user='customer', prepare=checkout(1), label='POST orders-list one item'),
+            Endpoint('orders-detail', 'GET', 2, user='customer', prepare=fixed({'pk': self.order_id})),
+            Endpoint('orders-detail', 'PATCH', 4, user='admin', prepare=lambda: ({'pk': self.order_id}, {
+                'payment_status': Order.PAYMENT_STATUS_COMPLETE,
+            })),
+            Endpoint('orders-export', 'GET', 1, user='admin'),
+            Endpoint('orders-export', 'GET', 1, user='admin', label='GET orders-export items', query={'rows': 'items'}),
+
+            Endpoint('sales-analytics', 'GET', 3, user='admin', query={'by': 'product'}),
+
+            Endpoint('async-products-list', 'GET', 4),
+            Endpoint('async-products-detail', 'GET', 3, prepare=fixed(product)),
+            Endpoint('async-collections-list', 'GET', 1),
+            Endpoint('async-collections-detail', 'GET', 1, prepare=fixed({'pk': self.collection_id})),
+            Endpoint('async-carts-detail', 'GET', 3, prepare=fixed(cart)),
+        ]
+
+    def check_coverage(self, endpoints):
+        routes = {pattern.name for pattern in urls.urlpatterns if isinstance(pattern, URLPattern) and pattern.name}
+        missing = routes - {endpoint.route for endpoint in endpoints}
+        if missing:
+            raise CommandError(f"No benchmark for: {', '.join(sorted(missing))}.")
+
+    # Measurement
+
+    def call(self, endpoint, warm_cache):
+        kwargs, data = endpoint.prepare() if endpoint.prepare else ({}, None)
+        url = reverse(endpoint.route, kwargs=kwargs)
+        if endpoint.query:
+            url = f'{url}?{"&".join(f"{key}={value}" for key, value in endpoint.query.items())}'
+        if not warm_cache:
+            bump_catalog_version()
+        client = self.clients[endpoint.user]
+        method = getattr(client, endpoint.method.lower())
+
+        def send():
+            response = method(url, data, format='json')
+            # streamed exports run their queries while being read
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return response
+        return url, send
+
+    def measure(self, endpoint, repeat, warm_cache):
+        errors = []
+        url, send = self.call(endpoint, warm_cache)
+        response = send()
+        if response.status_code != endpoint.status:
+            errors.append(f'expected status {endpoint.status}, got {response.status_code}')
+
+        timings = []
+        queries = 0
+        for _ in range(repeat):
+            url, send = self.call(endpoint, warm_cache)
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                send()
+                timings.append((time.perf_counter() - start) * 1000)
+            queries = max(queries, len(context.captured_queries))
+        if queries > endpoint.budget:
+            errors.append(f'{queries} queries, budget is {endpoint.budget}')
+
+        # memory is traced in a separate pass, tracing slows every allocation
+        _, send = self.call(endpoint, warm_cache)
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            send()
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+        finally:
+            tracemalloc.stop()
+
+        timings.sort()
+        return {
+            'label': endpoint.label,
+            'route': endpoint.route,
+            'method': endpoint.method,
+            'url': url,
+            'user': endpoint.user,
+            'status': response.status_code,
+            'queries': queries,
+            'budget': endpoint.budget,
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[min(len(timings) - 1, round(0.95 * (len(timings) - 1)))], 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+            'peak_kib': round(peak / 1024, 1),
+            'errors': errors,
+        }
@@ -0,0 +1,51 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.images import get_image_setting, render_variants
+
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff')
+
+
+class Command(BaseCommand):
+    help = 'Time variant rendering for a folder of sample images with each executor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('folder')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--executor', choices=['sync', 'thread', 'process'], action='append')
+
+    def handle(self, *args, **options):
+        paths = [
+            os.path.join(options['folder'], name) for name in sorted(os.listdir(options['folder']))
+            if name.lower().endswith(EXTENSIONS)
+        ]
+        if not paths:
+            raise CommandError(f"No images found in {options['folder']}.")
+        images = []
+        for path in paths:
+            with open(path, 'rb') as file:
+                images.append(file.read())
+        source_bytes = sum(len(data) for data in images)
+
+        args = (get_image_setting('SIZES'), get_image_setting('FORMATS'), get_image_setting('QUALITY'))
+        for executor in options['executor'] or ['sync', 'thread', 'process']:
+            start = time.perf_counter()
+            results = self.run(executor, options['workers'], images, args)
+            seconds = time.perf_counter() - start
+            variant_bytes = sum(len(variant['content']) for variants in results for variant in variants)
+            self.stdout.write(
+                f'{executor:<8} {len(images)} images in {seconds:.2f}s '
+                f'({len(images) / seconds:.1f} images/s), '
+                f'{source_bytes / 1024:.0f} KiB -> {variant_bytes / 1024:.0f} KiB of variants'
+            )
+
+    def run(self, executor, workers, images, args):
+        if executor == 'sync':
+            return [render_variants(data, *args) for data in images]
+        pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        with pool_class(max_workers=workers) as pool:
+            futures = [pool.submit(render_variants, data, *args) for data in images]
+            return [future.result() for future in futures]
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from store.catalog_io import export_products, import_products
+from store.models import Collection
+
+
+class Command(BaseCommand):
+    help = 'Measure import/export throughput and peak memory on synthetic products in a throwaway test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+
+    def handle(self, *args, **options):
+        # a fresh test database, so the benchmark never touches real data
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        rows = options['rows']
+        format = options['format']
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f'products.{format}')
+            collection = Collection.objects.create(title='benchmark collection')
+            self.write_synthetic(path, rows, collection.title, format)
+
+            _, seconds, peak = self.measure(lambda: self.run_import(path, format, options['batch_size']))
+            self.report('import (insert)', rows, seconds, peak)
+            _, seconds, peak = self.measure(lambda: self.run_import(path, format, options['batch_size']))
+            self.report('import (same)', rows, seconds, peak)
+            self.write_synthetic(path, rows, collection.title, format, inventory_offset=1)
+            _, seconds, peak = self.measure(lambda: self.run_import(path, format, options['batch_size']))
+            self.report('import (update)', rows, seconds, peak)
+            _, seconds, peak = self.measure(lambda: self.run_export(os.path.join(directory, 'out'), format))
+            self.report('export', rows, seconds, peak)
+
+    def write_synthetic(self, path, rows, collection, format, inventory_offset=0):
+        with open(path, 'w', newline='', encoding='utf-8') as stream:
+            if format == 'csv':
+                stream.write('title,description,unit_price,inventory,collection\n')
+                for i in range(rows):
+                    stream.write(f'Synthetic product {i},Description {i},{i % 1000}.99,{i % 500 + inventory_offset},{collection}\n')
+            else:
+                for i in range(rows):
+                    stream.write(
+                        f'{{"title": "Synthetic product {i}", "description": "Description {i}", '
+                        f'"unit_price": "{i % 1000}.99", "inventory": {i % 500 + inventory_offset}, "collection": "{collection}"}}\n'
+                    )
+
+    def run_import(self, path, format, batch_size):
+        with open(path, newline='', encoding='utf-8') as stream:
+            return import_products(stream, format, batch_size)
+
+    def run_export(self, path, format):
+        with open(path, 'w', newline='', encoding='utf-8') as stream:
+            return export_products(stream, format)
+
+    def measure(self, func):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return result, seconds, peak
+
+    def report(self, name, rows, seconds, peak):
+        self.stdout.write(
+            f'{name:<16} {rows} rows in {seconds:.2f}s '
+            f'({rows / seconds:,.0f} rows/s, peak {peak / 1024 / 1024:.1f} MiB)'
+        )
@@ -0,0 +1,87 @@
+import statistics
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from store.customers import forget_customer_id
+from store.models import Collection, Order, OrderItem, Product
+from store.authentication import ClaimsJWTAuthentication, forget_user_flags
+from store.serializers import MyTokenObtainPairSerializer
+from store.views import OrderViewSet
+
+
+class Command(BaseCommand):
+    help = 'Count queries and time GET /store/orders/ with each way of resolving the user and customer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        # a fresh test database, so the benchmark never touches real data
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=['*']):
+                self.benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def benchmark(self, options):
+        user = self.seed(options['orders'])
+        # the ids of the test database may be cached for real users
+        forget_customer_id(user.id)
+        forget_user_flags(user.id)
+        plain_token = str(AccessToken.for_user(user))
+        claims_token = str(MyTokenObtainPairSerializer.get_token(user).access_token)
+
+        scenarios = [
+            ('user row + customer query', JWTAuthentication, plain_token, 0),
+            ('claims, customer cache cold', ClaimsJWTAuthentication, plain_token, None),
+            ('claims, customer cache warm', ClaimsJWTAuthentication, plain_token, 60),
+            ('claims with customer_id', ClaimsJWTAuthentication, claims_token, 60),
+        ]
+        for name, authentication, token, cache_timeout in scenarios:
+            timeout = 60 if cache_timeout is None else cache_timeout
+            # views read the authentication classes when they are defined
+            with mock.patch.object(OrderViewSet, 'authentication_classes', [authentication]), override_settings(
+                CUSTOMER_ID_CACHE={'TIMEOUT': timeout},
+                JWT_USER_CACHE={'TIMEOUT': timeout},
+            ):
+                timings, queries = self.run(user, token, options['repeat'], cold=cache_timeout is None)
+            self.stdout.write(
+                f'{name:<30} {queries} queries, {statistics.median(timings):7.2f} ms median'
+            )
+
+    def seed(self, count):
+        user = get_user_model().objects.create_user('benchmark-orders', 'benchmark-orders@example.com', 'x')
+        collection = Collection.objects.create(title='benchmark orders')
+        product = Product.objects.create(title='benchmark orders', unit_price=1, inventory=1, collection=collection)
+        for _ in range(count):
+            order = Order.objects.create(customer=user.customer, address='x')
+            OrderItem.objects.create(order=order, product=product, quantity=1, unit_price=1)
+        return user
+
+    def run(self, user, token, repeat, cold):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'JWT {token}')
+        client.get('/store/orders/')
+        timings = []
+        for _ in range(repeat):
+            if cold:
+                # only this user's keys, the cache may be shared with a deployment
+                forget_customer_id(user.id)
+                forget_user_flags(user.id)
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = client.get('/store/orders/')
+                timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.status_code
+        return timings, len(context.captured_queries)
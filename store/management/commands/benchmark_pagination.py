@@ -0,0 +1,78 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.pagination import Cursor
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from store.models import Collection, Product
+from store.paginations import DefaultPagination, KeysetPagination
+from store.views import ProductViewSet
+
+
+class Command(BaseCommand):
+    help = 'Compare page-number and keyset pagination on the first and a deep product page.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000)
+        parser.add_argument('--page', type=int, default=5000)
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        # a fresh test database, so the benchmark never touches real data
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.seed(options['products'])
+            for page in (1, options['page']):
+                for name, measure in (('page-number', self.page_number), ('keyset', self.keyset)):
+                    timings, queries = self.run(measure, page, options['page_size'], options['repeat'])
+                    self.stdout.write(
+                        f'{name:<12} page {page:>6}: '
+                        f'{statistics.median(timings):8.2f} ms median, {queries} queries'
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, count, batch_size=5000):
+        collection = Collection.objects.create(title='benchmark')
+        for start in range(0, count, batch_size):
+            Product.objects.bulk_create(
+                Product(title=f'product {i}', unit_price=1, inventory=1, collection=collection)
+                for i in range(start, min(start + batch_size, count))
+            )
+
+    def run(self, measure, page, page_size, repeat):
+        fetch = measure(page, page_size)
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                fetch()
+                timings.append((time.perf_counter() - start) * 1000)
+        return timings, len(context.captured_queries)
+
+    def queryset(self):
+        return ProductViewSet.queryset.all()
+
+    def page_number(self, page, page_size):
+        request = Request(APIRequestFactory().get('/store/products/', {'page': page, 'page_size': page_size}))
+        return lambda: list(DefaultPagination().paginate_queryset(self.queryset().order_by('id'), request))
+
+    def keyset(self, page, page_size):
+        view = ProductViewSet()
+        params = {'pagination': 'cursor', 'page_size': page_size}
+        if page > 1:
+            # a client that scrolled this far holds the cursor of the previous page
+            paginator = KeysetPagination()
+            paginator.base_url = 'http://testserver/store/products/'
+            paginator.ordering = view.cursor_ordering
+            last = self.queryset().order_by(*paginator.ordering)[(page - 1) * page_size - 1]
+            encoded = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=paginator.get_position(last)))
+            params['cursor'] = encoded.split('cursor=')[1]
+        request = Request(APIRequestFactory().get('/store/products/', params))
+        return lambda: list(KeysetPagination().paginate_queryset(self.queryset(), request, view=view))
@@ -0,0 +1,90 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection, transaction
+
+from store.carts import InsufficientInventory
+from store.models import Collection, Product, StockCounter, StockHold
+from store.reservations import convert_holds, reserve
+
+
+class Command(BaseCommand):
+    help = (
+        'Flash-sale load test: many carts reserve one SKU concurrently. '
+        'Checks that exactly the available stock is reserved and nothing is oversold. '
+        'Runs on a seeded test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carts', type=int, default=500)
+        parser.add_argument('--inventory', type=int, default=100)
+        parser.add_argument('--quantity', type=int, default=1, help='Units each cart asks for.')
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--retries', type=int, default=5,
+                            help='Attempts per cart on lock timeouts or deadlocks.')
+
+    def handle(self, *args, **options):
+        # threads use their own connections, so the data has to be committed;
+        # it goes into a test database that is dropped at the end
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        collection = Collection.objects.create(title='flash sale')
+        product = Product.objects.create(
+            title='flash sale', unit_price=1, inventory=options['inventory'], collection=collection)
+        carts = [uuid4() for _ in range(options['carts'])]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            results = list(pool.map(
+                lambda cart_id: self.attempt(cart_id, product.id, options['quantity'], options['retries']),
+                carts,
+            ))
+        seconds = time.perf_counter() - start
+
+        won = [cart_id for cart_id, result in zip(carts, results) if result == 'reserved']
+        sold_out = results.count('sold out')
+        errors = len(results) - len(won) - sold_out
+        reserved = StockCounter.objects.get(product=product).reserved
+        held = sum(StockHold.objects.filter(product=product).values_list('quantity', flat=True))
+        self.stdout.write(
+            f'{len(carts)} carts in {seconds:.2f}s ({len(carts) / seconds:.0f} reservations/s): '
+            f'{len(won)} reserved, {sold_out} sold out, {errors} errors'
+        )
+        self.stdout.write(f'counter {reserved}, holds {held}, inventory {options["inventory"]}')
+        expected = min(options['inventory'] // options['quantity'], len(carts)) * options['quantity']
+        if reserved != held or reserved > options['inventory']:
+            raise CommandError('Reservation counter does not match the holds, stock was oversold.')
+        if not errors and reserved != expected:
+            raise CommandError(f'Expected {expected} units reserved, got {reserved}.')
+
+        # winners check out, which must use exactly their holds
+        for cart_id in won:
+            with transaction.atomic():
+                shortages = convert_holds(cart_id, {product.id: options['quantity']}, {product.id: options['inventory']})
+            if shortages:
+                raise CommandError(f'Cart {cart_id} could not convert its hold.')
+        self.stdout.write(self.style.SUCCESS(
+            f'OK: {len(won)} carts converted their holds, counter back to '
+            f'{StockCounter.objects.get(product=product).reserved}.'
+        ))
+
+    def attempt(self, cart_id, product_id, quantity, retries):
+        try:
+            for attempt in range(retries):
+                try:
+                    reserve(cart_id, [(product_id, quantity)])
+                    return 'reserved'
+                except InsufficientInventory:
+                    return 'sold out'
+                except OperationalError:
+                    time.sleep(0.01 * 2 ** attempt)
+            return 'error'
+        finally:
+            close_old_connections()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from store.catalog_io import detect_format, export_products
+
+
+class Command(BaseCommand):
+    help = 'Export all products as CSV or NDJSON to a file or stdout.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o')
+        parser.add_argument('--format', choices=['csv', 'ndjson'])
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['output']
+        format = options['format'] or detect_format(path or '')
+
+        if path is None:
+            count = export_products(self.stdout, format, options['chunk_size'])
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as stream:
+                count = export_products(stream, format, options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'{count} products exported to {path}.'))
@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from store.catalog_io import detect_format, import_products
+
+
+class Command(BaseCommand):
+    help = 'Import or update products from a CSV or NDJSON file ("-" reads stdin).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'])
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or detect_format(path)
+
+        def report(line_number, message):
+            self.stderr.write(f'line {line_number}: {message}')
+
+        if path == '-':
+            stats = import_products(sys.stdin, format, options['batch_size'], on_error=report)
+        else:
+            with open(path, newline='', encoding='utf-8') as stream:
+                stats = import_products(stream, format, options['batch_size'], on_error=report)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['created']} created, {stats['updated']} updated, {stats['failed']} failed."
+        ))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.outbox import process_events
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued order events to the order_created receivers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Seconds to wait when the outbox is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the due events and exit.')
+
+    def handle(self, *args, **options):
+        while True:
+            processed, failed = process_events(options['batch_size'])
+            if processed:
+                self.stdout.write(f'{processed} events processed, {failed} failed.')
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['sleep'])
@@ -0,0 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from store.images import process_image
+from store.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Render variants for product images that have not been processed yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render every image.')
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        queryset = ProductImage.objects.order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(processed_at__isnull=True)
+        ids = list(queryset.values_list('id', flat=True))
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for count, variants in enumerate(executor.map(self.process, ids), start=1):
+                if count % 100 == 0:
+                    self.stdout.write(f'{count}/{len(ids)} images processed.')
+        self.stdout.write(self.style.SUCCESS(f'{len(ids)} images processed.'))
+
+    def process(self, product_image_id):
+        try:
+            return process_image(product_image_id)
+        finally:
+            close_old_connections()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store.sync import purge_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Delete product tombstones older than the catalog sync retention.'
+
+    def handle(self, *args, **options):
+        deleted = purge_tombstones()
+        self.stdout.write(self.style.SUCCESS(f'{deleted} tombstones deleted.'))
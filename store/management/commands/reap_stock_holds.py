@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.reservations import reap_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Return the stock of expired cart reservations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='Keep running, checking for expired holds every SECONDS.')
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while True:
+                reaped = reap_expired_holds(options['batch_size'])
+                total += reaped
+                if not reaped:
+                    break
+            if total or not options['loop']:
+                self.stdout.write(f'{total} expired holds released.')
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
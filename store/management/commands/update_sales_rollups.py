@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.analytics import rebuild_rollups, update_rollups
+
+
+class Command(BaseCommand):
+    help = 'Add orders completed and subtract orders reversed since the last run in the hourly and daily sales rollups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Drop the rollups and recompute them from every completed order.')
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='Keep running, checking for new orders every SECONDS.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            processed = rebuild_rollups(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Rollups rebuilt from {processed} orders.'))
+            return
+        while True:
+            processed = update_rollups(options['batch_size'])
+            if processed or not options['loop']:
+                self.stdout.write(f'{processed} orders rolled up.')
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
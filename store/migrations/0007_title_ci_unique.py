@@ -0,0 +1,49 @@
+# Generated by Django 4.0.4 on 2026-10-17 19:48
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+def dedupe_titles(apps, schema_editor):
+    # suffix later duplicates with their id so the unique index can be built,
+    # counting up when the suffixed title is itself taken
+    for model_name in ['Collection', 'Product']:
+        model = apps.get_model('store', model_name)
+        taken = {title.lower() for title in model.objects.values_list('title', flat=True).iterator()}
+        seen = set()
+        renamed = []
+        for instance in model.objects.only('id', 'title').order_by('id').iterator():
+            key = instance.title.lower()
+            if key in seen:
+                number = 1
+                while True:
+                    suffix = f' ({instance.id})' if number == 1 else f' ({instance.id}-{number})'
+                    title = instance.title[:255 - len(suffix)] + suffix
+                    if title.lower() not in taken:
+                        break
+                    number += 1
+                instance.title = title
+                renamed.append(instance)
+                key = title.lower()
+                taken.add(key)
+            seen.add(key)
+        model.objects.bulk_update(renamed, ['title'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_product_order_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_titles, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='collection',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('title'), name='store_collection_title_ci_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('title'), name='store_product_title_ci_unique'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0.4 on 2026-10-17 19:59
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_products_count(apps, schema_editor):
+    Collection = apps.get_model('store', 'Collection')
+    Product = apps.get_model('store', 'Product')
+    counts = Product.objects \
+        .filter(collection=models.OuterRef('pk')) \
+        .order_by() \
+        .values('collection') \
+        .annotate(count=models.Count('id')) \
+        .values('count')
+    Collection.objects.update(products_count=Coalesce(models.Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_orderevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='products_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_products_count, migrations.RunPython.noop),
+    ]
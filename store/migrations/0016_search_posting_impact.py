@@ -0,0 +1,39 @@
+# Generated by Django 4.0.4 on 2026-10-17 21:23
+
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+
+def backfill_impact(apps, schema_editor):
+    # store.search.impact_expression with the BM25 constants of this migration
+    SearchIndexStats = apps.get_model('store', 'SearchIndexStats')
+    SearchPosting = apps.get_model('store', 'SearchPosting')
+    stats = SearchIndexStats.objects.values_list('documents', 'total_length').first()
+    if not stats or not stats[0]:
+        return
+    k1, b = 1.2, 0.75
+    frequency = Cast('frequency', models.FloatField())
+    SearchPosting.objects.update(impact=frequency * models.Value(k1 + 1) / (
+        frequency + models.Value(k1 * (1 - b))
+        + models.Value(k1 * b * stats[0] / stats[1]) * Cast('length', models.FloatField())
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchposting',
+            name='impact',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_impact, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='searchposting',
+            index=models.Index(fields=['term', '-impact'], name='store_searc_term_id_3f7bc6_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.0.4 on 2026-10-17 21:29
+
+from django.db import migrations, models
+
+
+def backfill_reversed_at(apps, schema_editor):
+    # Rollups now add every order with completed_at and subtract it again
+    # once reversed_at is set. Orders that completed and then failed were
+    # never counted, so they are reversed at their completion, and the
+    # reversals watermark starts where the rollups stopped: those already
+    # passed are skipped, those still ahead are added and taken back.
+    Order = apps.get_model('store', 'Order')
+    RollupWatermark = apps.get_model('store', 'RollupWatermark')
+    Order.objects \
+        .filter(completed_at__isnull=False) \
+        .exclude(payment_status='C') \
+        .update(reversed_at=models.F('completed_at'))
+    watermark = RollupWatermark.objects.filter(name='sales_rollups').first()
+    if watermark is not None:
+        RollupWatermark.objects.create(
+            name='sales_rollup_reversals',
+            position_at=watermark.position_at,
+            position_id=watermark.position_id,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_search_posting_impact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='reversed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_reversed_at, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='productsalesrollup',
+            unique_together={('period', 'period_start', 'product', 'collection')},
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['reversed_at', 'id'], name='store_order_reverse_da143d_idx'),
+        ),
+    ]
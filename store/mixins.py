@@ -1,7 +1,73 @@
-from rest_framework import permissions
+from django.utils.http import parse_etags
+from rest_framework import permissions, status
+from rest_framework.response import Response
 
+from core.routers import current_replica, get_replica_setting, read_from_replica
+
+from .caching import (catalog_etag, get_catalog_cache,
+                      get_catalog_cache_timeout, get_catalog_version,
+                      request_cache_key)
 from .permissions import IsStaffEditorPermission
 
 
 class StaffEditorPermissionMixin():
     permission_classes = [permissions.IsAdminUser, IsStaffEditorPermission]
+
+class CatalogCacheMixin():
+    """
+    Caches list and retrieve responses under the current catalog version,
+    which the store signal handlers bump whenever the catalog changes.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def get_catalog_cache_key(self, request, version):
+        return request_cache_key(
+            version, self.basename, self.action, request.path,
+            request.query_params, request.accepted_renderer.format
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        version = get_catalog_version()
+        key = self.get_catalog_cache_key(request, version)
+        etag = catalog_etag(key, version)
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        cache = get_catalog_cache()
+        entry = cache.get(key)
+        if entry is not None and entry['version'] == version:
+            response = Response(entry['data'])
+            replica = entry.get('replica', False)
+        else:
+            response = handler(request, *args, **kwargs)
+            replica = current_replica() is not None
+            if response.status_code == status.HTTP_200_OK:
+                timeout = get_catalog_cache_timeout()
+                if replica:
+                    # a lagging replica can return data older than the version
+                    timeout = min(timeout, get_replica_setting('CACHE_TIMEOUT'))
+                cache.set(key, {'version': version, 'data': response.data, 'replica': replica}, timeout)
+        # and clients would revalidate such data against the ETag indefinitely
+        if not replica:
+            response['ETag'] = etag
+        return response
+
+
+class ReplicaReadMixin():
+    """Serves safe requests from a read replica, see core/routers.py."""
+    # actions that must read from the primary even when safe
+    primary_actions = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        # dispatch sets self.action later, the router gave the action map already
+        action = getattr(self, 'action_map', {}).get(request.method.lower())
+        if request.method not in permissions.SAFE_METHODS or action in self.primary_actions:
+            return super().dispatch(request, *args, **kwargs)
+        with read_from_replica():
+            return super().dispatch(request, *args, **kwargs)
@@ -3,15 +3,41 @@ from uuid import uuid4
 from django.conf import settings
 from django.contrib import admin
 from django.db import models
+from django.db.models.functions import Coalesce, Lower
+from django.utils import timezone
 
 User = settings.AUTH_USER_MODEL
 
+class CollectionQuerySet(models.QuerySet):
+    def adjust_products_count(self, deltas):
+        """Apply {collection_id: delta} changes to products_count with F() updates."""
+        for collection_id, delta in sorted(deltas.items()):
+            if delta:
+                self.filter(id=collection_id).update(products_count=models.F('products_count') + delta)
+
+    def recount_products(self):
+        counts = Product.objects \
+            .filter(collection=models.OuterRef('pk')) \
+            .order_by() \
+            .values('collection') \
+            .annotate(count=models.Count('id')) \
+            .values('count')
+        return self.update(products_count=Coalesce(models.Subquery(counts), 0))
+
 class Collection(models.Model):
     title       = models.CharField(max_length=255)
+    products_count = models.IntegerField(default=0, editable=False)
+
+    objects = CollectionQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.title
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(Lower('title'), name='store_collection_title_ci_unique'),
+        ]
+
 class Product(models.Model):
     title       = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
@@ -23,9 +49,58 @@ class Product(models.Model):
     def __str__(self) -> str:
         return self.title
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_update', 'id']),
+            models.Index(fields=['unit_price', 'id']),
+            models.Index(fields=['collection', 'unit_price']),
+            models.Index(fields=['collection', 'last_update']),
+        ]
+        constraints = [
+            models.UniqueConstraint(Lower('title'), name='store_product_title_ci_unique'),
+        ]
+
+class StockCounter(models.Model):
+    """Units of a product held by active cart reservations."""
+    product     = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    reserved    = models.IntegerField(default=0)
+
+class StockHold(models.Model):
+    """A cart's time-limited reservation of units of one product."""
+    cart_id     = models.UUIDField()
+    product     = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity    = models.PositiveIntegerField()
+    expires_at  = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = [['cart_id', 'product']]
+
+class ProductTombstone(models.Model):
+    """Records a deleted product for the catalog changes feed."""
+    product_id  = models.IntegerField()
+    deleted_at  = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'product_id']),
+        ]
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='store/images')
+    processed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+class ProductImageVariant(models.Model):
+    image = models.ForeignKey(ProductImage, on_delete=models.CASCADE, related_name='variants')
+    name = models.CharField(max_length=32)
+    format = models.CharField(max_length=8)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    file = models.ImageField(upload_to='store/images/variants')
+    content_hash = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = [['image', 'name', 'format']]
 
 class Customer(models.Model):
     MEMBERSHIP_BRONZE = 'B'
@@ -73,6 +148,29 @@ class CartItem(models.Model):
         unique_together = [['cart', 'product']]
 
 
+class OrderQuerySet(models.QuerySet):
+    # the pre_save handler that stamps completed_at and reversed_at does not
+    # run for bulk writes, so these stamp them too
+
+    def update(self, **kwargs):
+        status = kwargs.get('payment_status')
+        if status == Order.PAYMENT_STATUS_COMPLETE:
+            kwargs.setdefault('completed_at', Coalesce('completed_at', models.Value(timezone.now())))
+        elif status is not None:
+            kwargs.setdefault('reversed_at', models.Case(
+                models.When(completed_at__isnull=False, reversed_at__isnull=True, then=models.Value(timezone.now())),
+                default=models.F('reversed_at'),
+            ))
+        return super().update(**kwargs)
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if 'payment_status' in fields:
+            now = timezone.now()
+            for order in objs:
+                order.stamp_payment_status(now)
+            fields = [*fields, *{'completed_at', 'reversed_at'}.difference(fields)]
+        return super().bulk_update(objs, fields, batch_size=batch_size)
+
 class Order(models.Model):
     PAYMENT_STATUS_PENDING = 'P'
     PAYMENT_STATUS_COMPLETE = 'C'
@@ -87,9 +185,123 @@ class Order(models.Model):
     payment_status = models.CharField(
         max_length=1, choices=PAYMENT_STATUS_CHOICES, default=PAYMENT_STATUS_PENDING)
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT)
+    completed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    reversed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['placed_at', 'id']),
+            models.Index(fields=['completed_at', 'id']),
+            models.Index(fields=['reversed_at', 'id']),
+        ]
+
+    def stamp_payment_status(self, now):
+        """
+        Stamp completed_at when the order completes and reversed_at when a
+        completed order is refunded or cancelled. Sales rollups add the
+        first and subtract the second; a reversal is final for them.
+        """
+        if self.payment_status == self.PAYMENT_STATUS_COMPLETE:
+            if self.completed_at is None:
+                self.completed_at = now
+        elif self.completed_at is not None and self.reversed_at is None:
+            self.reversed_at = now
 
 class OrderItem(models.Model):
     order       = models.ForeignKey(Order, on_delete=models.PROTECT, related_name='items')
     product     = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity    = models.PositiveSmallIntegerField()
     unit_price  = models.DecimalField(max_digits=6, decimal_places=2)
+
+
+class OrderEvent(models.Model):
+    EVENT_CREATED = 'created'
+    EVENT_CHOICES = [
+        (EVENT_CREATED, 'Created'),
+    ]
+    STATUS_PENDING = 'P'
+    STATUS_PROCESSING = 'R'
+    STATUS_DONE = 'D'
+    STATUS_FAILED = 'F'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    order       = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    event       = models.CharField(max_length=32, choices=EVENT_CHOICES)
+    status      = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts    = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error  = models.TextField(blank=True)
+    created_at  = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+
+class SearchTerm(models.Model):
+    term        = models.CharField(max_length=64, unique=True)
+    document_frequency = models.IntegerField(default=0)
+
+class SearchPosting(models.Model):
+    term        = models.ForeignKey(SearchTerm, on_delete=models.CASCADE, related_name='postings')
+    product     = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    frequency   = models.PositiveIntegerField()
+    length      = models.PositiveIntegerField()
+    impact      = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = [['term', 'product']]
+        indexes = [
+            models.Index(fields=['term', '-impact']),
+        ]
+
+class SearchIndexStats(models.Model):
+    documents   = models.IntegerField(default=0)
+    total_length = models.BigIntegerField(default=0)
+
+
+class SalesRollup(models.Model):
+    PERIOD_HOUR = 'H'
+    PERIOD_DAY = 'D'
+    PERIOD_CHOICES = [
+        (PERIOD_HOUR, 'Hour'),
+        (PERIOD_DAY, 'Day'),
+    ]
+    period      = models.CharField(max_length=1, choices=PERIOD_CHOICES)
+    period_start = models.DateTimeField()
+    revenue     = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    units       = models.PositiveIntegerField(default=0)
+    orders      = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+class ProductSalesRollup(SalesRollup):
+    product     = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    collection  = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        # a product that moves collections gets a row per collection
+        unique_together = [['period', 'period_start', 'product', 'collection']]
+
+class CollectionSalesRollup(SalesRollup):
+    collection  = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = [['period', 'period_start', 'collection']]
+
+class RollupWatermark(models.Model):
+    """How far an incremental job has read, as a (timestamp, id) position."""
+    name        = models.CharField(max_length=64, unique=True)
+    position_at = models.DateTimeField(null=True, blank=True)
+    position_id = models.IntegerField(default=0)
+    updated_at  = models.DateTimeField(auto_now=True)
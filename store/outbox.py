@@ -0,0 +1,94 @@
+"""
+Transactional outbox for order events.
+
+Checkout writes an OrderEvent row in the same transaction as the order, so
+the event is stored if and only if the order is. The process_order_events
+worker claims due events in batches and sends ``order_created`` to the
+registered receivers outside the checkout request, retrying failures with
+exponential backoff.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OrderEvent
+from .signals import order_created
+
+EVENT_SIGNALS = {
+    OrderEvent.EVENT_CREATED: order_created,
+}
+
+
+def get_outbox_setting(name, default):
+    return getattr(settings, 'ORDER_EVENTS', {}).get(name, default)
+
+
+def enqueue_order_event(order, event=OrderEvent.EVENT_CREATED):
+    return OrderEvent.objects.create(order=order, event=event)
+
+
+def claim_events(batch_size=None, lease=None):
+    """
+    Lock a batch of due events for this worker. Rows another worker is
+    claiming are skipped (SELECT ... FOR UPDATE SKIP LOCKED) where the
+    database supports it; events whose lease ran out are claimed again.
+    """
+    batch_size = batch_size or get_outbox_setting('BATCH_SIZE', 100)
+    lease = lease or get_outbox_setting('LEASE_SECONDS', 300)
+    now = timezone.now()
+    connection = connections[router.db_for_write(OrderEvent)]
+
+    with transaction.atomic(using=connection.alias):
+        queryset = OrderEvent.objects \
+            .filter(
+                Q(status=OrderEvent.STATUS_PENDING, available_at__lte=now) |
+                Q(status=OrderEvent.STATUS_PROCESSING, locked_until__lt=now)
+            ) \
+            .order_by('available_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        OrderEvent.objects.filter(id__in=ids).update(
+            status=OrderEvent.STATUS_PROCESSING,
+            locked_until=now + timedelta(seconds=lease),
+            attempts=F('attempts') + 1,
+        )
+    return list(OrderEvent.objects.select_related('order').filter(id__in=ids).order_by('id'))
+
+
+def retry_delay(attempts):
+    base = get_outbox_setting('RETRY_BASE_SECONDS', 30)
+    cap = get_outbox_setting('RETRY_MAX_SECONDS', 60 * 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), cap))
+
+
+def process_event(event):
+    signal = EVENT_SIGNALS[event.event]
+    results = signal.send_robust(OrderEvent, order=event.order)
+    errors = [repr(response) for _, response in results if isinstance(response, Exception)]
+
+    now = timezone.now()
+    event.locked_until = None
+    if not errors:
+        event.status = OrderEvent.STATUS_DONE
+        event.processed_at = now
+        event.last_error = ''
+    elif event.attempts >= get_outbox_setting('MAX_ATTEMPTS', 8):
+        event.status = OrderEvent.STATUS_FAILED
+        event.last_error = '\n'.join(errors)
+    else:
+        event.status = OrderEvent.STATUS_PENDING
+        event.available_at = now + retry_delay(event.attempts)
+        event.last_error = '\n'.join(errors)
+    event.save(update_fields=['status', 'locked_until', 'processed_at', 'available_at', 'last_error'])
+    return not errors
+
+
+def process_events(batch_size=None):
+    """Claim and process one batch. Returns (processed, failed)."""
+    events = claim_events(batch_size)
+    failed = sum(1 for event in events if not process_event(event))
+    return len(events), failed
@@ -1,5 +1,193 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import (BasePagination, Cursor,
+                                       CursorPagination, PageNumberPagination,
+                                       _reverse_ordering)
+from rest_framework.utils.urls import replace_query_param
+
+from .filters import stable_ordering
+
+DEFAULT_MAX_PAGE_SIZE = 100
+
+
+def get_max_page_size():
+    return getattr(settings, 'STORE_MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE)
 
 
 class DefaultPagination(PageNumberPagination):
     page_size = 10
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return get_max_page_size()
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over the view's ``cursor_ordering``, which ends with
+    the primary key. A cursor holds the value of every ordering field of
+    the row it points at, and a page is fetched with the row comparison
+    ``WHERE (a > x) OR (a = x AND id > y)`` instead of ``OFFSET``, so rows
+    sharing a value of the first field are neither skipped nor rescanned.
+    No ``COUNT(*)`` is issued, so deep pages cost the same as the first one.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    ordering = ('id',)
+
+    @property
+    def max_page_size(self):
+        return get_max_page_size()
+
+    def get_ordering(self, request, queryset, view):
+        # an explicit ?ordering= from the view's OrderingFilter wins, with
+        # the primary key appended so the position stays unique
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                params = request.query_params.get(backend.ordering_param)
+                ordering = backend().get_ordering(request, queryset, view) if params else None
+                if ordering:
+                    return tuple(stable_ordering(ordering))
+        return tuple(getattr(view, 'cursor_ordering', self.ordering))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request, queryset.model)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if position is not None:
+            queryset = queryset.filter(self.after(position, reverse))
+
+        # one extra row tells whether there is a page beyond this one
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        # an empty page keeps the position it was asked for
+        self.next_position = self.get_position(self.page[-1]) if self.page else position
+        self.previous_position = self.get_position(self.page[0]) if self.page else position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def after(self, position, reverse=False):
+        """Rows sorting after ``position``, or before it when ``reverse``."""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            condition |= Q(**equal, **{f"{name}__{'lt' if descending else 'gt'}": value})
+            equal[name] = value
+        return condition
+
+    def get_position(self, instance):
+        values = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            if isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            values.append(value)
+        return values
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            raw = urlsafe_b64decode(encoded.encode('ascii') + b'=' * (-len(encoded) % 4))
+            reverse, position = json.loads(raw)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # a well-formed cursor can still hold values of the wrong type,
+        # which would only fail once the filter is built
+        try:
+            position = [self.to_python(model, field, value) for field, value in zip(self.ordering, position)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=bool(reverse), position=position)
+
+    def to_python(self, model, field, value):
+        name = field.lstrip('-')
+        model_field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+        value = model_field.to_python(value)
+        if value is None:
+            raise ValidationError('A cursor position cannot be null.')
+        return value
+
+    def encode_cursor(self, cursor):
+        raw = json.dumps([int(cursor.reverse), cursor.position], separators=(',', ':'))
+        encoded = urlsafe_b64encode(raw.encode()).decode('ascii').rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+class OptInCursorPagination(BasePagination):
+    """
+    Page-number pagination by default; clients opt into keyset pagination
+    with ``?pagination=cursor`` (cursor links keep the flag).
+    """
+    mode_query_param = 'pagination'
+    default_class = DefaultPagination
+    cursor_class = KeysetPagination
+
+    def get_paginator(self, request):
+        if request.query_params.get(self.mode_query_param) == 'cursor' \
+                or self.cursor_class.cursor_query_param in request.query_params:
+            return self.cursor_class()
+        if self.default_class is not None:
+            return self.default_class()
+        return None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request)
+        if self.paginator is None:
+            return None
+        return self.paginator.paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    @property
+    def display_page_controls(self):
+        return getattr(getattr(self, 'paginator', None), 'display_page_controls', False)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+class OptInCursorOnlyPagination(OptInCursorPagination):
+    # unpaginated unless the client asks for cursor pagination
+    default_class = None
@@ -0,0 +1,235 @@
+"""
+Time-limited stock reservations for carts.
+
+Adding to a cart places a StockHold for the cart and product and adds its
+quantity to the product's StockCounter, so the stock a new cart can take
+is ``inventory - StockCounter.reserved``: one primary-key read, no scan of
+the holds. Holds expire after ``TTL_SECONDS`` of cart inactivity and
+reap_expired_holds() returns them in batches. Checkout turns a cart's
+holds into order lines, so a paid cart cannot be oversold by carts that
+came after it.
+
+Locks are always taken in the order product rows, holds, counters, so
+reservations, reaping and checkout cannot deadlock each other.
+
+Holds and counters live in SQL whatever the CART_STORE backend is: every
+add to a cart locks the product rows and writes a hold and a counter, even
+with KeyValueCartStore. That backend still keeps the cart contents out of
+SQL, but it no longer keeps carts from reaching SQL before checkout and
+does not take write load off the database.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .carts import InsufficientInventory
+from .models import Product, StockCounter, StockHold
+
+DEFAULT_STOCK_RESERVATIONS = {
+    'TTL_SECONDS': 15 * 60,
+    'REAP_BATCH_SIZE': 500,
+}
+
+
+def get_reservation_setting(name):
+    return getattr(settings, 'STOCK_RESERVATIONS', {}).get(name, DEFAULT_STOCK_RESERVATIONS[name])
+
+
+def available_stock(product_ids):
+    """Return {product_id: inventory - reserved} for the given products."""
+    reserved = dict(StockCounter.objects.filter(product_id__in=product_ids).values_list('product_id', 'reserved'))
+    return {
+        product_id: inventory - reserved.get(product_id, 0)
+        for product_id, inventory in Product.objects.filter(id__in=product_ids).values_list('id', 'inventory')
+    }
+
+
+def _lock_products(product_ids):
+    return dict(
+        Product.objects.select_for_update()
+                       .filter(id__in=product_ids)
+                       .order_by('id')
+                       .values_list('id', 'inventory')
+    )
+
+
+def _lock_holds(cart_id, product_ids=None):
+    holds = StockHold.objects.select_for_update().filter(cart_id=cart_id)
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    return {hold.product_id: hold for hold in holds.order_by('product_id')}
+
+
+def _adjust_counters(deltas):
+    """Apply {product_id: delta} to StockCounter.reserved in one statement."""
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if deltas:
+        StockCounter.objects.filter(product_id__in=deltas).update(
+            reserved=F('reserved') + Case(
+                *[When(product_id=product_id, then=Value(delta)) for product_id, delta in sorted(deltas.items())],
+                output_field=IntegerField()
+            )
+        )
+
+
+def _take(deltas, inventories):
+    """
+    Reserve {product_id: delta} more units where the stock allows it, with
+    one locking read, one update and one insert whatever the number of
+    products. The product rows must already be locked. Returns the
+    product ids that are short, taking nothing for them.
+    """
+    reserved = dict(
+        StockCounter.objects.select_for_update()
+                            .filter(product_id__in=deltas)
+                            .order_by('product_id')
+                            .values_list('product_id', 'reserved')
+    )
+    taken = {
+        product_id: delta for product_id, delta in deltas.items()
+        if reserved.get(product_id, 0) + delta <= inventories.get(product_id, 0)
+    }
+    _adjust_counters({product_id: delta for product_id, delta in taken.items() if product_id in reserved})
+    # counters are only created here, under the product lock
+    StockCounter.objects.bulk_create([
+        StockCounter(product_id=product_id, reserved=delta)
+        for product_id, delta in sorted(taken.items()) if product_id not in reserved
+    ])
+    return sorted(set(deltas) - set(taken))
+
+
+def _set_holds(cart_id, quantities, add=False):
+    """
+    Change the cart's holds to the {product_id: quantity} in
+    ``quantities``, or by them when ``add`` is true, taking or returning
+    the difference. All or nothing: raises InsufficientInventory with
+    every product that is short.
+    """
+    with transaction.atomic():
+        inventories = _lock_products(list(quantities))
+        holds = _lock_holds(cart_id, list(quantities))
+        # any activity keeps the whole cart reserved, and the reaper below
+        # must not take this cart's own holds
+        expires_at = timezone.now() + timedelta(seconds=get_reservation_setting('TTL_SECONDS'))
+        StockHold.objects.filter(cart_id=cart_id).update(expires_at=expires_at)
+
+        targets = dict(quantities)
+        if add:
+            for product_id, hold in holds.items():
+                targets[product_id] += hold.quantity
+
+        deltas = {}
+        for product_id, quantity in targets.items():
+            hold = holds.get(product_id)
+            delta = quantity - (hold.quantity if hold is not None else 0)
+            if delta > 0:
+                deltas[product_id] = delta
+        shortages = _take(deltas, inventories)
+        # stock held by abandoned carts goes back before giving up
+        reaped = [product_id for product_id in shortages if reap_expired_holds(product_id=product_id)]
+        if reaped:
+            shortages = sorted(set(shortages) - set(reaped)) \
+                + _take({product_id: deltas[product_id] for product_id in reaped}, inventories)
+        if shortages:
+            raise InsufficientInventory(*shortages)
+
+        _adjust_counters({
+            product_id: quantity - holds[product_id].quantity
+            for product_id, quantity in targets.items()
+            if product_id in holds and quantity < holds[product_id].quantity
+        })
+        to_update = []
+        to_create = []
+        for product_id, quantity in targets.items():
+            hold = holds.get(product_id)
+            if hold is None:
+                to_create.append(StockHold(cart_id=cart_id, product_id=product_id, quantity=quantity, expires_at=expires_at))
+            else:
+                hold.quantity = quantity
+                to_update.append(hold)
+        StockHold.objects.filter(id__in=[hold.id for hold in to_update if not hold.quantity]).delete()
+        StockHold.objects.bulk_update([hold for hold in to_update if hold.quantity], ['quantity'])
+        StockHold.objects.bulk_create([hold for hold in to_create if hold.quantity])
+
+
+def reserve(cart_id, lines):
+    """Hold ``(product_id, quantity)`` more units for the cart."""
+    quantities = {}
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    _set_holds(cart_id, quantities, add=True)
+
+
+def set_reserved(cart_id, product_id, quantity):
+    """Make the cart hold exactly ``quantity`` units of the product."""
+    _set_holds(cart_id, {product_id: quantity})
+
+
+def release(cart_id, product_ids=None):
+    """Return the cart's holds, or only those of ``product_ids``, to stock."""
+    with transaction.atomic():
+        holds = _lock_holds(cart_id, product_ids)
+        if not holds:
+            return
+        _adjust_counters({product_id: -hold.quantity for product_id, hold in holds.items()})
+        StockHold.objects.filter(id__in=[hold.id for hold in holds.values()]).delete()
+
+
+def convert_holds(cart_id, quantities, inventories):
+    """
+    Check out ``quantities`` ({product_id: quantity}) for the cart. The
+    product rows must already be locked and ``inventories`` read from
+    them. Units the cart holds count as available to it; anything beyond
+    must come from unreserved stock. Returns the product ids that are
+    short, or consumes the holds and returns [].
+    """
+    holds = _lock_holds(cart_id)
+    reserved = dict(
+        StockCounter.objects.select_for_update()
+                            .filter(product_id__in=quantities)
+                            .order_by('product_id')
+                            .values_list('product_id', 'reserved')
+    )
+    shortages = []
+    for product_id, quantity in quantities.items():
+        own = holds[product_id].quantity if product_id in holds else 0
+        if inventories.get(product_id, 0) - reserved.get(product_id, 0) + own < quantity:
+            shortages.append(product_id)
+    if shortages:
+        return shortages
+
+    if holds:
+        StockCounter.objects.filter(product_id__in=holds).update(
+            reserved=F('reserved') - Case(
+                *[When(product_id=product_id, then=Value(hold.quantity)) for product_id, hold in holds.items()],
+                output_field=IntegerField()
+            )
+        )
+        StockHold.objects.filter(id__in=[hold.id for hold in holds.values()]).delete()
+    return []
+
+
+def reap_expired_holds(batch_size=None, product_id=None):
+    """Delete up to ``batch_size`` expired holds and return their stock. Returns the count."""
+    batch_size = batch_size or get_reservation_setting('REAP_BATCH_SIZE')
+    connection = connections[router.db_for_write(StockHold)]
+    with transaction.atomic(using=connection.alias):
+        holds = StockHold.objects.filter(expires_at__lte=timezone.now()).order_by('expires_at', 'id')
+        if product_id is not None:
+            holds = holds.filter(product_id=product_id)
+        if connection.features.has_select_for_update_skip_locked:
+            holds = holds.select_for_update(skip_locked=True)
+        else:
+            holds = holds.select_for_update()
+        holds = list(holds.values_list('id', 'product_id', 'quantity')[:batch_size])
+        if not holds:
+            return 0
+        deltas = {}
+        for _, hold_product_id, quantity in holds:
+            deltas[hold_product_id] = deltas.get(hold_product_id, 0) - quantity
+        StockHold.objects.filter(id__in=[id for id, _, _ in holds]).delete()
+        _adjust_counters(deltas)
+    return len(holds)
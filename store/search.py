@@ -0,0 +1,297 @@
+"""
+Product full-text search over a database-backed inverted index.
+
+Titles and descriptions are tokenized into SearchTerm rows, with one
+SearchPosting per (term, product) holding the field-weighted term frequency,
+the document length and the posting's BM25 term-frequency factor (its
+impact, computed against the average document length when it was indexed;
+rebuild_index refreshes them all). Queries expand every token to the
+indexed terms it prefixes, the exact term always included.
+
+Ranking every match of a common term would aggregate a posting per
+product, so only candidates are scored. A single-token query takes the
+``limit`` highest-impact postings of each expanded term from the (term,
+impact) index, and those are its results. A longer query checks every
+product matching its most selective token, or that token's MAX_CANDIDATES
+highest-impact postings when it matches more, so a product ranked low on
+every token's common terms can be missed. Candidates are scored with BM25
+from their postings of the expanded terms, and every token must match.
+"""
+import heapq
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.db import connections, router
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from .models import Product, SearchIndexStats, SearchPosting, SearchTerm
+
+TOKEN_RE = re.compile(r'\w+')
+STOP_WORDS = frozenset(
+    'a an and are as at be by for from in is it of on or the this to with'.split()
+)
+MAX_TERM_LENGTH = 64
+TITLE_WEIGHT = 3
+MAX_QUERY_TOKENS = 8
+MAX_PREFIX_EXPANSIONS = 50
+MAX_CANDIDATES = 1000
+PREFIX_WEIGHT = 0.7
+K1 = 1.2
+B = 0.75
+STATS_ID = 1
+
+
+def tokenize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    return [
+        token[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall(text)
+        if (len(token) > 1 or token.isdigit()) and token not in STOP_WORDS
+    ]
+
+
+def impact(frequency, length, average_length):
+    """The BM25 term-frequency factor of a posting."""
+    return frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length / average_length))
+
+
+def impact_expression(average_length):
+    """impact() over the frequency and length columns of SearchPosting."""
+    frequency = Cast('frequency', FloatField())
+    return frequency * Value(K1 + 1) / (
+        frequency + Value(K1 * (1 - B)) + Value(K1 * B / average_length) * Cast('length', FloatField())
+    )
+
+
+def document_terms(product):
+    counts = Counter()
+    for token in tokenize(product.title):
+        counts[token] += TITLE_WEIGHT
+    counts.update(tokenize(product.description))
+    return counts
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _adjust_document_frequency(deltas):
+    by_delta = defaultdict(list)
+    for term_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(term_id)
+    for delta, term_ids in by_delta.items():
+        # a full rebuild can touch more terms than a query may bind
+        for batch in batched(term_ids, 1000):
+            SearchTerm.objects.filter(id__in=batch) \
+                .update(document_frequency=F('document_frequency') + delta)
+
+
+def _adjust_stats(documents, total_length):
+    if not documents and not total_length:
+        return
+    updated = SearchIndexStats.objects.filter(id=STATS_ID).update(
+        documents=F('documents') + documents,
+        total_length=F('total_length') + total_length,
+    )
+    if not updated:
+        SearchIndexStats.objects.create(id=STATS_ID, documents=documents, total_length=total_length)
+
+
+def _ensure_terms(terms):
+    term_ids = {}
+    for batch in batched(terms, 1000):
+        term_ids.update(SearchTerm.objects.filter(term__in=batch).values_list('term', 'id'))
+    missing = [term for term in terms if term not in term_ids]
+    if missing:
+        SearchTerm.objects.bulk_create([SearchTerm(term=term) for term in missing], batch_size=1000, ignore_conflicts=True)
+        for batch in batched(missing, 1000):
+            term_ids.update(SearchTerm.objects.filter(term__in=batch).values_list('term', 'id'))
+    return term_ids
+
+
+def unindex_products(product_ids):
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    deltas = Counter()
+    lengths = {}
+    for term_id, product_id, length in SearchPosting.objects \
+            .filter(product_id__in=product_ids) \
+            .values_list('term_id', 'product_id', 'length'):
+        deltas[term_id] -= 1
+        lengths[product_id] = length
+    if not lengths:
+        return
+    SearchPosting.objects.filter(product_id__in=product_ids).delete()
+    _adjust_document_frequency(deltas)
+    _adjust_stats(-len(lengths), -sum(lengths.values()))
+
+
+def _build_postings(products):
+    documents = {product.id: document_terms(product) for product in products}
+    documents = {product_id: counts for product_id, counts in documents.items() if counts}
+    postings = []
+    deltas = Counter()
+    total_length = 0
+    if not documents:
+        return postings, deltas, 0, 0
+    term_ids = _ensure_terms(set().union(*documents.values()))
+    for product_id, counts in documents.items():
+        length = sum(counts.values())
+        total_length += length
+        for term, frequency in counts.items():
+            postings.append(SearchPosting(
+                term_id=term_ids[term], product_id=product_id, frequency=frequency, length=length))
+            deltas[term_ids[term]] += 1
+    return postings, deltas, len(documents), total_length
+
+
+def index_products(products):
+    """(Re)index the given products, replacing any postings they had."""
+    products = list(products)
+    unindex_products([product.id for product in products])
+    postings, deltas, documents, total_length = _build_postings(products)
+    if not postings:
+        return
+    stats = SearchIndexStats.objects.filter(id=STATS_ID).values_list('documents', 'total_length').first()
+    indexed_documents, indexed_length = stats or (0, 0)
+    average_length = (indexed_length + total_length) / (indexed_documents + documents)
+    for posting in postings:
+        posting.impact = impact(posting.frequency, posting.length, average_length)
+    SearchPosting.objects.bulk_create(postings, batch_size=1000)
+    _adjust_document_frequency(deltas)
+    _adjust_stats(documents, total_length)
+
+
+def clear_index():
+    SearchPosting.objects.all().delete()
+    SearchTerm.objects.all().delete()
+    SearchIndexStats.objects.all().delete()
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Reindex every product. Postings are written per batch while document
+    frequencies and stats are accumulated and written once at the end,
+    followed by the impacts, which need the final average length.
+    """
+    clear_index()
+    count = 0
+    documents = 0
+    total_length = 0
+    deltas = Counter()
+    queryset = Product.objects.only('id', 'title', 'description').order_by('id')
+    for batch in batched(queryset.iterator(chunk_size=batch_size), batch_size):
+        postings, batch_deltas, batch_documents, batch_length = _build_postings(batch)
+        SearchPosting.objects.bulk_create(postings, batch_size=1000)
+        deltas.update(batch_deltas)
+        documents += batch_documents
+        total_length += batch_length
+        count += len(batch)
+    _adjust_document_frequency(deltas)
+    _adjust_stats(documents, total_length)
+    if documents:
+        SearchPosting.objects.update(impact=impact_expression(total_length / documents))
+    return count
+
+
+def prefix_range(token):
+    """Bounds [token, next) covering every term that starts with token."""
+    return token, token[:-1] + chr(ord(token[-1]) + 1)
+
+
+def _top_postings(connection, term_ids, per_term, fields):
+    """
+    SQL and params selecting ``fields`` of the ``per_term`` highest-impact
+    postings of each term. One UNION ALL of index-ordered reads, since a
+    single ORDER BY over several terms would sort all their postings.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(SearchPosting._meta.get_field(name).column) for name in fields)
+    select = 'SELECT {columns} FROM (SELECT {columns} FROM {table} WHERE {term} = %s ORDER BY {impact} DESC LIMIT %s) {alias}'
+    sql = ' UNION ALL '.join(
+        select.format(
+            columns=columns,
+            table=quote(SearchPosting._meta.db_table),
+            term=quote(SearchPosting._meta.get_field('term').column),
+            impact=quote(SearchPosting._meta.get_field('impact').column),
+            alias=quote(f'top{index}'),
+        )
+        for index in range(len(term_ids))
+    )
+    params = [param for term_id in term_ids for param in (term_id, per_term)]
+    return sql, params
+
+
+def search_products(query, limit=20):
+    """Return [(product_id, score)] best first; every query token must match."""
+    tokens = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return []
+    documents = SearchIndexStats.objects.filter(id=STATS_ID).values_list('documents', flat=True).first()
+    if not documents:
+        return []
+
+    expansions = []
+    for token in tokens:
+        # a range scan uses the unique index on every backend, LIKE may not;
+        # the token itself is always kept, however many commoner terms share it
+        lower, upper = prefix_range(token)
+        terms = SearchTerm.objects \
+            .filter(term__gte=lower, term__lt=upper, document_frequency__gt=0) \
+            .order_by(Case(When(term=token, then=Value(0)), default=Value(1)), '-document_frequency') \
+            .values_list('id', 'term', 'document_frequency')[:MAX_PREFIX_EXPANSIONS]
+        terms = list(terms)
+        if not terms:
+            return []
+        expansions.append(terms)
+
+    weights = {}
+    token_of_term = {}
+    for index, (token, terms) in enumerate(zip(tokens, expansions)):
+        for term_id, term, frequency in terms:
+            idf = math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+            weight = idf if term == token else idf * PREFIX_WEIGHT
+            if weight > weights.get(term_id, 0):
+                weights[term_id] = weight
+                token_of_term[term_id] = index
+
+    selective = min(expansions, key=lambda terms: sum(frequency for _, _, frequency in terms))
+    selective_ids = [term_id for term_id, _, _ in selective]
+    connection = connections[router.db_for_read(SearchPosting)]
+    if len(tokens) == 1:
+        # the best postings of each expanded term are the results
+        with connection.cursor() as cursor:
+            cursor.execute(*_top_postings(connection, selective_ids, limit, ('product', 'term', 'impact')))
+            postings = cursor.fetchall()
+    else:
+        if sum(frequency for _, _, frequency in selective) <= MAX_CANDIDATES:
+            # every product matching the most selective token is checked
+            candidates = SearchPosting.objects.filter(term_id__in=selective_ids).values('product_id')
+        else:
+            per_term = max(limit, MAX_CANDIDATES // len(selective))
+            candidates = RawSQL(*_top_postings(connection, selective_ids, per_term, ('product',)))
+        postings = SearchPosting.objects \
+            .filter(product_id__in=candidates, term_id__in=weights) \
+            .values_list('product_id', 'term_id', 'impact')
+
+    scores = defaultdict(float)
+    matched_tokens = defaultdict(set)
+    for product_id, term_id, impact in postings:
+        if term_id in weights:
+            scores[product_id] += weights[term_id] * impact
+            matched_tokens[product_id].add(token_of_term[term_id])
+    matches = [product_id for product_id, matched in matched_tokens.items() if len(matched) == len(tokens)]
+    best = heapq.nsmallest(limit, matches, key=lambda product_id: (-scores[product_id], product_id))
+    return [(product_id, scores[product_id]) for product_id in best]
@@ -1,11 +1,18 @@
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Lower
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
+from .caching import bump_catalog_version
+from .carts import InsufficientInventory, get_cart_store
 from .models import (Cart, CartItem, Collection, Customer, Order, OrderItem,
-                     Product, ProductImage)
-from .signals import order_created
+                     Product, ProductImage, ProductImageVariant, SalesRollup)
+from .outbox import enqueue_order_event
+from .reservations import convert_holds, reserve, set_reserved
 from .validators import (validate_file_size, validate_phone,
                          validate_product_title_no_fuck)
 
@@ -17,48 +24,84 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
 
         # Add custom claims
         token['username'] = user.username
-        # ...
+        # read by ClaimsJWTAuthentication so requests need no user query
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        token['customer_id'] = Customer.objects.filter(user_id=user.id).order_by('id').values_list('id', flat=True).first()
 
         return token
 
-class CollectionSerializer(serializers.ModelSerializer):
+class UniqueTitleMixin():
+    """
+    Case-insensitive title check that matches the Lower('title') unique
+    constraint, so the lookup is served by that index. The constraint
+    still guards against concurrent writes that pass validation; other
+    integrity errors are not about the title and propagate.
+    """
+    title_label = ''
+    title_constraint = ''
+
+    def title_taken_message(self, value):
+        return f"{value} is already a {self.title_label} name."
+
+    def validate_title(self, value):
+        qs = self.Meta.model.objects \
+            .annotate(title_lower=Lower('title')) \
+            .filter(title_lower=Lower(Value(value)))
+        if self.instance is not None:
+            qs = qs.exclude(pk=self.instance.pk)
+        if qs.exists():
+            raise serializers.ValidationError(self.title_taken_message(value))
+        return value
+
+    def save(self, **kwargs):
+        try:
+            with transaction.atomic():
+                return super().save(**kwargs)
+        except IntegrityError as exc:
+            # every backend names the violated index in the message
+            if self.title_constraint not in str(exc):
+                raise
+            title = self.validated_data.get('title', getattr(self.instance, 'title', ''))
+            raise serializers.ValidationError({'title': [self.title_taken_message(title)]})
+
+class CollectionSerializer(UniqueTitleMixin, serializers.ModelSerializer):
     products_count = serializers.IntegerField(read_only=True)
+    title_label = 'collection'
+    title_constraint = 'store_collection_title_ci_unique'
     class Meta:
         model = Collection
         fields = ['id', 'title', 'products_count']
 
-    def validate_title(self, value):
-        qs = Product.objects.filter(title__iexact=value)
-        if qs.exists():
-            raise serializers.ValidationError(f"{value} is already a collection name.")
-        return value
+class ProductImageVariantSerializer(serializers.ModelSerializer):
+    url = serializers.ImageField(source='file', read_only=True)
+    class Meta:
+        model = ProductImageVariant
+        fields = ['name', 'format', 'width', 'height', 'url', 'content_hash']
 
 class ProductImageSerializer(serializers.ModelSerializer):
     image = serializers.ImageField(validators=[validate_file_size])
+    variants = ProductImageVariantSerializer(many=True, read_only=True)
     class Meta:
         model = ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'variants']
     
     def create(self, validated_data):
         product_id = self.context['product_id']
         return ProductImage.objects.create(product_id=product_id, **validated_data)
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(UniqueTitleMixin, serializers.ModelSerializer):
     title = serializers.CharField(validators=[validate_product_title_no_fuck])
     price = serializers.DecimalField(max_digits=6, decimal_places=2, source='unit_price')
     collection = serializers.PrimaryKeyRelatedField(queryset=Collection.objects.all())
     images = ProductImageSerializer(many=True, read_only=True)
+    title_label = 'product'
+    title_constraint = 'store_product_title_ci_unique'
 
     class Meta:
         model = Product
         fields = ['id', 'title', 'description', 'price', 'inventory', 'collection', 'images']
 
-    def validate_title(self, value):
-        qs = Product.objects.filter(title__iexact=value)
-        if qs.exists():
-            raise serializers.ValidationError(f"{value} is already a product name.")
-        return value
-
 class AddCartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
@@ -66,35 +109,27 @@ class AddCartItemSerializer(serializers.ModelSerializer):
 
     product_id = serializers.IntegerField()
 
-    def validate_quantity(self, quantity, **kwargs):
-        product = Product.objects.get(id=self.initial_data['product_id'])
-        if quantity > product.inventory:
-            raise serializers.ValidationError('Dont have enough inventory.')
-        return quantity
-
-
-    def validate_product_id(self, value, **kwargs):
-        if not Product.objects.filter(id=value).exists():
-            raise serializers.ValidationError('No product with the given ID was found.')
-        return value
+    def validate(self, attrs):
+        # one read of the product for both checks and the save
+        product = Product.objects.filter(id=attrs['product_id']).first()
+        if product is None:
+            raise serializers.ValidationError({'product_id': ['No product with the given ID was found.']})
+        if attrs['quantity'] > product.inventory:
+            raise serializers.ValidationError({'quantity': ['Dont have enough inventory.']})
+        attrs['product'] = product
+        return attrs
 
     def save(self, **kwargs):
         cart_id = self.context['cart_id']
-        product_id = self.validated_data['product_id']
+        product = self.validated_data['product']
         quantity = self.validated_data['quantity']
 
-        product = Product.objects.get(id=product_id)
-
         try:
-            cart_item = CartItem.objects.get(cart_id=cart_id, product_id=product_id)
-            if cart_item.quantity + quantity > product.inventory:
-                raise serializers.ValidationError('Dont have enough inventory.')
-            else:
-                cart_item.quantity += quantity
-            cart_item.save()
-            self.instance = cart_item
-        except CartItem.DoesNotExist:
-            self.instance = CartItem.objects.create(cart_id=cart_id, **self.validated_data)
+            with transaction.atomic():
+                reserve(cart_id, [(product.id, quantity)])
+                self.instance = get_cart_store().add_item(cart_id, product, quantity)
+        except InsufficientInventory:
+            raise serializers.ValidationError('Dont have enough inventory.')
         
         return self.instance
 
@@ -104,12 +139,67 @@ class UpdateCartItemSerializer(serializers.ModelSerializer):
         fields = ['quantity']
 
     def validate_quantity(self, quantity, **kwargs):
-        cart_item_id = self.context['cart_item_id']
-        product = Product.objects.get(id=cart_item_id)
+        # the view loads the cart item with its product, scoped to the cart
+        product = self.instance.product
         if quantity > product.inventory:
             raise serializers.ValidationError('Dont have enough inventory.')
         return quantity
 
+    def save(self, **kwargs):
+        cart_id = self.context['cart_id']
+        quantity = self.validated_data['quantity']
+        try:
+            with transaction.atomic():
+                set_reserved(cart_id, self.instance.product_id, quantity)
+                self.instance = get_cart_store().update_item(cart_id, self.instance, quantity)
+        except InsufficientInventory:
+            raise serializers.ValidationError({'quantity': ['Dont have enough inventory.']})
+        return self.instance
+
+class BatchAddCartItemListSerializer(serializers.ListSerializer):
+    def validate(self, operations):
+        if not operations:
+            raise serializers.ValidationError('No items were given.')
+        quantities = {}
+        for operation in operations:
+            product_id = operation['product_id']
+            quantities[product_id] = quantities.get(product_id, 0) + operation['quantity']
+
+        products = Product.objects.in_bulk(quantities)
+        errors = [
+            f'No product with the given ID was found: {product_id}.'
+            for product_id in quantities if product_id not in products
+        ]
+        errors += [
+            f'Dont have enough inventory for product {product_id}.'
+            for product_id, quantity in quantities.items()
+            if product_id in products and quantity > products[product_id].inventory
+        ]
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        self.lines = [(products[product_id], quantity) for product_id, quantity in quantities.items()]
+        return operations
+
+    def save(self, **kwargs):
+        cart_id = self.context['cart_id']
+        try:
+            with transaction.atomic():
+                reserve(cart_id, [(product.id, quantity) for product, quantity in self.lines])
+                get_cart_store().add_items(cart_id, self.lines)
+        except InsufficientInventory as exc:
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                f'Dont have enough inventory for product {product_id}.' for product_id in exc.args
+            ]})
+        return get_cart_store().get_cart(cart_id)
+
+class BatchAddCartItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
+
+    class Meta:
+        list_serializer_class = BatchAddCartItemListSerializer
+
 class CartItemProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
@@ -167,32 +257,63 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
-    order_total_price = serializers.SerializerMethodField(method_name='get_order_total_price')
+    order_total_price = serializers.DecimalField(max_digits=9, decimal_places=2, read_only=True)
     class Meta:
         model = Order
         fields = ['id', 'customer', 'placed_at', 'address', 'payment_status', 'items', 'order_total_price']
-    
-    def get_order_total_price(self, order):
-        return sum([item.quantity * item.product.unit_price for item in order.items.all()])    
 
 class CreateOrderSerializer(serializers.Serializer):
     cart_id = serializers.UUIDField()
     address = serializers.CharField(max_length=255)
 
+    def validate(self, attrs):
+        # a user without a customer profile cannot place orders
+        if self.context.get('customer_id') is None:
+            raise serializers.ValidationError('No customer profile was found for this user.')
+        return attrs
+
     def validate_cart_id(self, cart_id):
-        if not Cart.objects.filter(id=cart_id).exists():
+        cart_store = get_cart_store()
+        if not cart_store.has_cart(cart_id):
             raise serializers.ValidationError('No cart with the given ID was found.')
-        if CartItem.objects.filter(cart_id=cart_id).count() == 0:
+        if cart_store.count_items(cart_id) == 0:
             raise serializers.ValidationError('The cart is empty.')
         return cart_id
 
     def save(self, **kwargs):
         with transaction.atomic():
+            cart_store = get_cart_store()
             cart_id = self.validated_data['cart_id']
-            customer = Customer.objects.get(user_id=self.context['user_id'])
-            order = Order.objects.create(customer=customer, address=self.validated_data['address'])
-            cart_items = CartItem.objects.select_related('product') \
-                                        .filter(cart_id=cart_id)
+            cart_items = sorted(cart_store.get_items(cart_id), key=lambda item: item.product_id)
+            quantities = {item.product_id: item.quantity for item in cart_items}
+
+            # lock the product rows in primary-key order so concurrent
+            # checkouts always acquire them in the same sequence
+            inventories = dict(
+                Product.objects.select_for_update()
+                               .filter(id__in=quantities)
+                               .order_by('id')
+                               .values_list('id', 'inventory')
+            )
+            # the cart's own holds count as available to it
+            shortages = convert_holds(cart_id, quantities, inventories)
+            if shortages:
+                raise serializers.ValidationError(
+                    {'cart_id': [f'Dont have enough inventory for product {product_id}.' for product_id in shortages]})
+
+            # update product inventory in a single statement
+            Product.objects.filter(id__in=quantities).update(
+                inventory=F('inventory') - Case(
+                    *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+                    output_field=IntegerField()
+                ),
+                last_update=timezone.now(),
+            )
+            # the update skips the signals, and cached responses and their
+            # ETags must not keep the old inventory
+            transaction.on_commit(bump_catalog_version)
+
+            order = Order.objects.create(customer_id=self.context['customer_id'], address=self.validated_data['address'])
             order_items = [
                 OrderItem(
                     order=order, 
@@ -204,18 +325,22 @@ class CreateOrderSerializer(serializers.Serializer):
 
             OrderItem.objects.bulk_create(order_items)
 
-            # update product inventory
-            for item in cart_items:
-                product = Product.objects.get(id=item.product_id)
-                inventory = product.inventory - item.quantity
-                Product.objects.filter(id=item.product.id).update(inventory=inventory)
-
-            Cart.objects.filter(id=cart_id).delete()
+            cart_store.delete_cart(cart_id)
             
-            order_created.send_robust(self.__class__, order=order)
+            enqueue_order_event(order)
 
             return order
 
+class SalesReportQuerySerializer(serializers.Serializer):
+    PERIODS = {'hour': SalesRollup.PERIOD_HOUR, 'day': SalesRollup.PERIOD_DAY}
 
+    period = serializers.ChoiceField(choices=list(PERIODS), default='day')
+    by = serializers.ChoiceField(choices=['product', 'collection'], default='collection')
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=50)
 
-
+    def validate(self, attrs):
+        if 'start' in attrs and 'end' in attrs and attrs['start'] >= attrs['end']:
+            raise serializers.ValidationError({'end': 'end must be after start.'})
+        return attrs
@@ -1,7 +1,16 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
 from django.dispatch import receiver
-from store.models import Customer, Product
+from django.utils import timezone
+from store.authentication import forget_user_flags
+from store.caching import bump_catalog_version
+from store.customers import forget_customer_id
+from store.images import delete_variant_files, schedule_image_processing
+from store.search import index_products, unindex_products
+from store.models import (Collection, Customer, Order, Product, ProductImage,
+                          ProductImageVariant, ProductTombstone)
 
 from . import order_created
 
@@ -11,7 +20,86 @@ def create_customer_for_new_user(sender, **kwargs):
     if kwargs['created']:
         Customer.objects.create(user=kwargs['instance'])
 
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def forget_cached_user_flags(sender, instance, **kwargs):
+    forget_user_flags(instance.id)
+
+@receiver([post_save, post_delete], sender=Customer)
+def forget_cached_customer_id(sender, instance, **kwargs):
+    forget_customer_id(instance.user_id)
+
 @receiver(order_created)
 def on_order_created(sender, **kwargs):
     print('ok')
 
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=Collection)
+def invalidate_catalog_cache(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+@receiver(post_init, sender=Product)
+def remember_product_collection(sender, instance, **kwargs):
+    # read __dict__ so a deferred collection_id is not loaded
+    instance._loaded_collection_id = instance.__dict__.get('collection_id')
+
+@receiver(post_save, sender=Product)
+def count_saved_product(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = instance._loaded_collection_id
+    if created:
+        Collection.objects.adjust_products_count({instance.collection_id: 1})
+    elif previous is not None and previous != instance.collection_id:
+        Collection.objects.adjust_products_count({previous: -1, instance.collection_id: 1})
+    instance._loaded_collection_id = instance.collection_id
+
+@receiver(post_delete, sender=Product)
+def count_deleted_product(sender, instance, **kwargs):
+    Collection.objects.adjust_products_count({instance.collection_id: -1})
+
+@receiver(post_save, sender=ProductImage)
+def process_uploaded_image(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_image_processing(instance.id)
+
+@receiver(post_delete, sender=ProductImageVariant)
+def delete_variant_file(sender, instance, **kwargs):
+    # covers deleted images and the variants replaced by a re-render
+    name = instance.file.name
+    transaction.on_commit(lambda: delete_variant_files([name]))
+
+@receiver(post_init, sender=Product)
+def remember_product_search_text(sender, instance, **kwargs):
+    instance._loaded_search_text = (instance.__dict__.get('title'), instance.__dict__.get('description'))
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not {'title', 'description'} & set(update_fields):
+        return
+    search_text = (instance.title, instance.description)
+    if created or search_text != instance._loaded_search_text:
+        index_products([instance])
+    instance._loaded_search_text = search_text
+
+@receiver(pre_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    unindex_products([instance.id])
+
+@receiver(post_delete, sender=Product)
+def record_deleted_product(sender, instance, **kwargs):
+    ProductTombstone.objects.create(product_id=instance.id)
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def touch_image_product(sender, instance, raw=False, **kwargs):
+    # images are part of the product payload, so they count as a product change
+    if not raw:
+        Product.objects.filter(id=instance.product_id).update(last_update=timezone.now())
+
+@receiver(pre_save, sender=Order)
+def stamp_order_payment_status(sender, instance, raw=False, **kwargs):
+    # sales rollups pick up completed and reversed orders by these stamps
+    if not raw:
+        instance.stamp_payment_status(timezone.now())
@@ -0,0 +1,122 @@
+"""
+Catalog delta sync.
+
+Clients keep an opaque token and ask for the changes after it. A change is
+either a product whose last_update moved past the token or a
+ProductTombstone written when a product was deleted. Both streams are read
+in (timestamp, id) order from their indexes and merged, so a request costs
+the number of changes returned and not the size of the catalog.
+
+Changes newer than SETTLE_SECONDS are held back, so a row saved by a
+transaction that has not committed yet is not skipped by a token that
+already moved past its timestamp. The timestamp is taken when the row is
+written, not when it commits, so SETTLE_SECONDS must exceed the longest
+transaction that saves products or deletes them: a row committed later than
+that is behind every token handed out meanwhile and is never sent.
+
+Once a client has read everything up to the settle horizon its token moves
+to the horizon itself, so a client that polls keeps a fresh token even
+when nothing changes and does not outlive TOMBSTONE_RETENTION_DAYS.
+"""
+import base64
+import heapq
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Product, ProductTombstone
+
+UPSERT = 0
+DELETE = 1
+
+DEFAULT_CATALOG_SYNC = {
+    'BATCH_SIZE': 500,
+    'MAX_BATCH_SIZE': 2000,
+    'SETTLE_SECONDS': 5,
+    'TOMBSTONE_RETENTION_DAYS': 30,
+}
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class ExpiredToken(InvalidToken):
+    pass
+
+
+def get_sync_setting(name):
+    return getattr(settings, 'CATALOG_SYNC', {}).get(name, DEFAULT_CATALOG_SYNC[name])
+
+
+def encode_token(position):
+    timestamp, kind, id = position
+    raw = json.dumps([timestamp.isoformat(), kind, id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Return the (timestamp, kind, id) position of ``token``; None starts from scratch."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        timestamp, kind, id = json.loads(raw)
+        timestamp = parse_datetime(timestamp)
+    except (ValueError, TypeError):
+        raise InvalidToken('Invalid sync token.')
+    if timestamp is None or kind not in (UPSERT, DELETE) or not isinstance(id, int):
+        raise InvalidToken('Invalid sync token.')
+    if timestamp < timezone.now() - timedelta(days=get_sync_setting('TOMBSTONE_RETENTION_DAYS')):
+        raise ExpiredToken('Sync token expired, start a full sync.')
+    return timestamp, kind, id
+
+
+def _after(position, kind, time_field, id_field):
+    """Filter for rows of ``kind`` that sort after ``position``."""
+    timestamp, position_kind, id = position
+    if kind < position_kind:
+        return Q(**{f'{time_field}__gt': timestamp})
+    if kind > position_kind:
+        return Q(**{f'{time_field}__gte': timestamp})
+    return Q(**{f'{time_field}__gt': timestamp}) | Q(**{time_field: timestamp, f'{id_field}__gt': id})
+
+
+def get_changes(position, limit, queryset=None):
+    """
+    Return (changes, next_position, has_more). ``changes`` is a list of
+    (kind, product_id, product) in feed order, product being None for
+    deletions. ``queryset`` lets callers prefetch what they serialize.
+    """
+    until = timezone.now() - timedelta(seconds=get_sync_setting('SETTLE_SECONDS'))
+    products = (queryset if queryset is not None else Product.objects.all()) \
+        .filter(last_update__lt=until) \
+        .order_by('last_update', 'id')
+    tombstones = ProductTombstone.objects \
+        .filter(deleted_at__lt=until) \
+        .order_by('deleted_at', 'product_id')
+    if position is not None:
+        products = products.filter(_after(position, UPSERT, 'last_update', 'id'))
+        tombstones = tombstones.filter(_after(position, DELETE, 'deleted_at', 'product_id'))
+
+    upserts = (((product.last_update, UPSERT, product.id), product) for product in products[:limit + 1])
+    deletes = (((tombstone.deleted_at, DELETE, tombstone.product_id), None) for tombstone in tombstones[:limit + 1])
+    merged = list(heapq.merge(upserts, deletes, key=lambda change: change[0]))
+
+    page = merged[:limit]
+    changes = [(key[1], key[2], product) for key, product in page]
+    has_more = len(merged) > limit
+    # with nothing left before the horizon, continue from the horizon; rows
+    # stamped exactly at it sort after (until, UPSERT, 0) and still come next
+    next_position = page[-1][0] if has_more else (until, UPSERT, 0)
+    return changes, next_position, has_more
+
+
+def purge_tombstones():
+    cutoff = timezone.now() - timedelta(days=get_sync_setting('TOMBSTONE_RETENTION_DAYS'))
+    deleted, _ = ProductTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
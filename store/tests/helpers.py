@@ -0,0 +1,43 @@
+from decimal import Decimal
+from itertools import count
+
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from store.models import Cart, CartItem, Collection, Product
+
+_numbers = count()
+
+
+def create_collection(**kwargs):
+    kwargs.setdefault('title', f'collection {next(_numbers)}')
+    return Collection.objects.create(**kwargs)
+
+
+def create_product(collection=None, **kwargs):
+    kwargs.setdefault('title', f'product {next(_numbers)}')
+    kwargs.setdefault('unit_price', Decimal('9.99'))
+    kwargs.setdefault('inventory', 10)
+    return Product.objects.create(collection=collection or create_collection(), **kwargs)
+
+
+def create_user(is_staff=False):
+    number = next(_numbers)
+    return get_user_model().objects.create_user(
+        f'user-{number}', f'user-{number}@example.com', 'password', is_staff=is_staff)
+
+
+def client_for(user=None):
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+def create_cart(lines):
+    """A cart with ``(product, quantity)`` lines, bypassing reservations."""
+    cart = Cart.objects.create()
+    CartItem.objects.bulk_create(
+        CartItem(cart=cart, product=product, quantity=quantity) for product, quantity in lines
+    )
+    return cart
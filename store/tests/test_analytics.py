@@ -0,0 +1,129 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from store.analytics import sales_report, update_rollups
+from store.models import (CollectionSalesRollup, Order, OrderItem,
+                          ProductSalesRollup, SalesRollup)
+
+from .helpers import create_collection, create_product, create_user
+
+
+def settled():
+    return mock.patch('store.analytics.timezone.now', return_value=timezone.now() + timedelta(minutes=1))
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.customer = create_user().customer
+        self.collection = create_collection()
+        self.product = create_product(self.collection)
+
+    def order(self, quantity=1, product=None, status=Order.PAYMENT_STATUS_COMPLETE):
+        order = Order.objects.create(customer=self.customer, address='Test Street', payment_status=status)
+        OrderItem.objects.create(
+            order=order, product=product or self.product, quantity=quantity, unit_price=Decimal('2.00'))
+        return order
+
+    def roll_up(self):
+        with settled():
+            return update_rollups()
+
+    def rollups(self, model, key):
+        return sorted(
+            model.objects
+            .filter(period=SalesRollup.PERIOD_DAY)
+            .values_list(key, 'revenue', 'units', 'orders')
+        )
+
+    def test_product_moved_between_collections(self):
+        self.order(quantity=1)
+        self.roll_up()
+        other = create_collection()
+        self.product.collection = other
+        self.product.save()
+        self.order(quantity=2)
+        self.roll_up()
+        self.assertEqual(
+            sorted(ProductSalesRollup.objects
+                   .filter(period=SalesRollup.PERIOD_DAY)
+                   .values_list('collection_id', 'units')),
+            sorted([(self.collection.id, 1), (other.id, 2)]))
+        self.assertEqual(self.rollups(CollectionSalesRollup, 'collection_id'), sorted([
+            (self.collection.id, Decimal('2.00'), 1, 1),
+            (other.id, Decimal('4.00'), 2, 1),
+        ]))
+        self.assertEqual(sales_report(SalesRollup.PERIOD_DAY, 'product'), [
+            {'product_id': self.product.id, 'revenue': Decimal('6.00'), 'units': 3, 'orders': 2},
+        ])
+
+    def test_queryset_update_stamps_completed_at(self):
+        order = self.order(status=Order.PAYMENT_STATUS_PENDING)
+        Order.objects.filter(id=order.id).update(payment_status=Order.PAYMENT_STATUS_COMPLETE)
+        order.refresh_from_db()
+        self.assertIsNotNone(order.completed_at)
+        self.assertEqual(self.roll_up(), 1)
+        self.assertEqual(self.rollups(ProductSalesRollup, 'product_id'), [
+            (self.product.id, Decimal('2.00'), 1, 1),
+        ])
+
+    def test_bulk_update_stamps_completed_at(self):
+        order = self.order(status=Order.PAYMENT_STATUS_PENDING)
+        order.payment_status = Order.PAYMENT_STATUS_COMPLETE
+        Order.objects.bulk_update([order], ['payment_status'])
+        order.refresh_from_db()
+        self.assertIsNotNone(order.completed_at)
+        self.assertIsNone(order.reversed_at)
+
+    def test_reversal_is_subtracted(self):
+        kept, refunded = self.order(quantity=1), self.order(quantity=3)
+        self.roll_up()
+        Order.objects.filter(id=refunded.id).update(payment_status=Order.PAYMENT_STATUS_FAILED)
+        refunded.refresh_from_db()
+        self.assertIsNotNone(refunded.reversed_at)
+        self.roll_up()
+        self.assertEqual(self.rollups(ProductSalesRollup, 'product_id'), [
+            (self.product.id, Decimal('2.00'), 1, 1),
+        ])
+        self.assertEqual(self.rollups(CollectionSalesRollup, 'collection_id'), [
+            (self.collection.id, Decimal('2.00'), 1, 1),
+        ])
+
+        # a reversal is only subtracted once
+        kept.payment_status = Order.PAYMENT_STATUS_COMPLETE
+        kept.save()
+        refunded.save()
+        self.assertEqual(self.roll_up(), 0)
+
+    def test_reversal_after_moving_collections(self):
+        order = self.order(quantity=2)
+        self.roll_up()
+        self.product.collection = create_collection()
+        self.product.save()
+        Order.objects.filter(id=order.id).update(payment_status=Order.PAYMENT_STATUS_FAILED)
+        self.roll_up()
+        self.assertEqual(self.rollups(ProductSalesRollup, 'collection_id'), [
+            (self.collection.id, Decimal('0.00'), 0, 0),
+        ])
+        self.assertEqual(self.rollups(CollectionSalesRollup, 'collection_id'), [
+            (self.collection.id, Decimal('0.00'), 0, 0),
+        ])
+
+    def test_failed_before_rollup(self):
+        order = self.order()
+        order.payment_status = Order.PAYMENT_STATUS_FAILED
+        order.save()
+        self.roll_up()
+        self.assertEqual(self.rollups(ProductSalesRollup, 'product_id'), [
+            (self.product.id, Decimal('0.00'), 0, 0),
+        ])
+
+    def test_pending_order_is_not_reversed(self):
+        order = self.order(status=Order.PAYMENT_STATUS_PENDING)
+        Order.objects.filter(id=order.id).update(payment_status=Order.PAYMENT_STATUS_FAILED)
+        order.refresh_from_db()
+        self.assertIsNone(order.reversed_at)
+        self.assertEqual(self.roll_up(), 0)
@@ -0,0 +1,52 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from .helpers import create_product
+
+ACCEPT_HEADERS = [
+    None,
+    '*/*',
+    'application/json',
+    'application/json; indent=2',
+    'text/html,application/xhtml+xml,*/*;q=0.8',
+    'application/xml',
+    'text/csv',
+]
+
+
+class AsyncCatalogViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_product()
+
+    def get(self, url, accept, **params):
+        headers = {'HTTP_ACCEPT': accept} if accept else {}
+        return self.client.get(url, params, **headers)
+
+    def assert_same(self, sync_url, async_url, **params):
+        for accept in ACCEPT_HEADERS:
+            with self.subTest(accept=accept, **params):
+                cache.clear()
+                expected = self.get(sync_url, accept, **params)
+                # a miss goes to the viewset, the second request is served from the cache
+                for _ in range(2):
+                    response = self.get(async_url, accept, **params)
+                    self.assertEqual(response.status_code, expected.status_code)
+                    self.assertEqual(response['Content-Type'], expected['Content-Type'])
+                    if expected['Content-Type'].startswith('application/json'):
+                        self.assertEqual(response.content, expected.content)
+
+    def test_list(self):
+        self.assert_same('/store/products/', '/store/async/products/')
+
+    def test_detail(self):
+        self.assert_same(f'/store/collections/{self.product.collection_id}/',
+                         f'/store/async/collections/{self.product.collection_id}/')
+
+    def test_format_parameter(self):
+        for format in ('json', 'api', 'xml'):
+            self.assert_same('/store/products/', '/store/async/products/', format=format)
+
+    def test_unacceptable_after_a_cached_response(self):
+        self.assertEqual(self.get('/store/async/products/', 'application/json').status_code, 200)
+        self.assertEqual(self.get('/store/async/products/', 'application/xml').status_code, 406)
@@ -0,0 +1,206 @@
+import threading
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from store.carts import (InsufficientInventory, KeyValueCartStore,
+                         LocMemClient, ORMCartStore, WatchError)
+from store.models import CartItem
+
+from .helpers import client_for, create_collection, create_product, create_user
+
+
+class CartStoreContract:
+    """Behaviour every CartStore backend must share."""
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.make_store()
+        self.cart_id = self.store.create_cart().id
+        collection = create_collection()
+        self.product = create_product(collection, inventory=5)
+        self.other = create_product(collection, inventory=5)
+
+    def test_add_and_read(self):
+        self.store.add_item(self.cart_id, self.product, 2)
+        item = self.store.add_item(self.cart_id, self.product, 1)
+        self.assertEqual(item.quantity, 3)
+        self.assertEqual(self.store.count_items(self.cart_id), 1)
+        self.assertEqual([(item.product_id, item.quantity) for item in self.store.get_items(self.cart_id)],
+                         [(self.product.id, 3)])
+
+    def test_first_add_over_inventory(self):
+        with self.assertRaises(InsufficientInventory):
+            self.store.add_item(self.cart_id, self.product, 6)
+        self.assertEqual(self.store.count_items(self.cart_id), 0)
+
+    def test_add_over_inventory(self):
+        self.store.add_item(self.cart_id, self.product, 4)
+        with self.assertRaises(InsufficientInventory):
+            self.store.add_item(self.cart_id, self.product, 2)
+        self.assertEqual(self.store.get_items(self.cart_id)[0].quantity, 4)
+
+    def test_add_items_is_all_or_nothing(self):
+        with self.assertRaises(InsufficientInventory) as raised:
+            self.store.add_items(self.cart_id, [(self.product, 1), (self.other, 6)])
+        self.assertEqual(raised.exception.args, (self.other.id,))
+        self.assertEqual(self.store.count_items(self.cart_id), 0)
+
+    def test_update_and_remove(self):
+        item = self.store.add_item(self.cart_id, self.product, 1)
+        item = self.store.get_item(self.cart_id, item.id)
+        self.store.update_item(self.cart_id, item, 4)
+        self.assertEqual(self.store.get_item(self.cart_id, item.id).quantity, 4)
+        self.assertTrue(self.store.remove_item(self.cart_id, item.id))
+        self.assertIsNone(self.store.get_item(self.cart_id, item.id))
+        self.assertTrue(self.store.delete_cart(self.cart_id))
+        self.assertFalse(self.store.has_cart(self.cart_id))
+
+
+class ORMCartStoreTests(CartStoreContract, TestCase):
+    def make_store(self):
+        return ORMCartStore()
+
+    def concurrent_first_add(self, method, quantity=2):
+        # another request inserts the product right after this one found it
+        # missing from the cart
+        original = getattr(self.store, method)
+        calls = []
+
+        def then_insert(*args, **kwargs):
+            result = original(*args, **kwargs)
+            if not calls:
+                calls.append(1)
+                CartItem.objects.create(cart_id=self.cart_id, product=self.product, quantity=quantity)
+            return result
+
+        return mock.patch.object(self.store, method, side_effect=then_insert)
+
+    def test_concurrent_first_add_item(self):
+        with self.concurrent_first_add('_increment'):
+            self.store.add_item(self.cart_id, self.product, 1)
+        self.assertEqual(self.store.get_items(self.cart_id)[0].quantity, 3)
+
+    def test_concurrent_first_add_item_over_inventory(self):
+        with self.concurrent_first_add('_increment', quantity=5):
+            with self.assertRaises(InsufficientInventory):
+                self.store.add_item(self.cart_id, self.product, 1)
+        self.assertEqual(self.store.get_items(self.cart_id)[0].quantity, 5)
+
+    def test_concurrent_first_add_items(self):
+        with self.concurrent_first_add('_lock_lines'):
+            self.store.add_items(self.cart_id, [(self.product, 1), (self.other, 1)])
+        quantities = {item.product_id: item.quantity for item in self.store.get_items(self.cart_id)}
+        self.assertEqual(quantities, {self.product.id: 3, self.other.id: 1})
+
+    def test_concurrent_first_add_items_over_inventory(self):
+        with self.concurrent_first_add('_lock_lines', quantity=5):
+            with self.assertRaises(InsufficientInventory):
+                self.store.add_items(self.cart_id, [(self.product, 1)])
+        self.assertEqual(self.store.get_items(self.cart_id)[0].quantity, 5)
+
+
+class KeyValueCartStoreTests(CartStoreContract, TestCase):
+    def make_store(self):
+        self.client = LocMemClient()
+        return KeyValueCartStore(client=self.client, TTL=60)
+
+    def test_concurrent_write_between_check_and_add(self):
+        key = self.store._key(self.cart_id)
+        hgetall = self.client.hgetall
+        interleaved = []
+
+        def hgetall_then_write(name):
+            fields = hgetall(name)
+            if not interleaved:
+                # another request adds to the cart after this one has read it
+                interleaved.append(self.client.hincrby(key, str(self.product.id), 3))
+            return fields
+
+        self.client.hgetall = hgetall_then_write
+        with self.assertRaises(InsufficientInventory):
+            self.store.add_item(self.cart_id, self.product, 3)
+        self.assertEqual(self.client.hget(key, str(self.product.id)), '3')
+
+    def test_concurrent_adds(self):
+        barrier = threading.Barrier(10)
+        added = []
+
+        def add():
+            barrier.wait()
+            try:
+                self.store.add_item(self.cart_id, self.product, 1)
+                added.append(1)
+            except InsufficientInventory:
+                pass
+
+        threads = [threading.Thread(target=add) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(added), 5)
+        self.assertEqual(self.store.get_items(self.cart_id)[0].quantity, 5)
+
+    def test_watch_detects_changes(self):
+        key = self.store._key(self.cart_id)
+        with self.client.pipeline() as pipe:
+            pipe.watch(key)
+            self.client.hset(key, 'field', 'changed')
+            pipe.multi()
+            pipe.hset(key, 'field', 'mine')
+            with self.assertRaises(WatchError):
+                pipe.execute()
+        self.assertEqual(self.client.hget(key, 'field'), 'changed')
+
+
+class CartApiContract:
+    """The cart endpoints behave the same on every backend."""
+
+    def test_cart_flow(self):
+        product = create_product(inventory=5)
+        client = client_for(create_user())
+        cart_id = client.post('/store/carts/').data['id']
+
+        response = client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 2})
+        self.assertEqual(response.status_code, 201, response.data)
+        item_id = response.data['id']
+        response = client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 4})
+        self.assertEqual(response.status_code, 400)
+        response = client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.id + 1000, 'quantity': 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('product_id', response.data)
+
+        response = client.patch(f'/store/carts/{cart_id}/items/{item_id}/', {'quantity': 3}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        response = client.get(f'/store/carts/{cart_id}/')
+        self.assertEqual([(item['product']['id'], item['quantity']) for item in response.data['items']],
+                         [(product.id, 3)])
+
+        self.assertEqual(client.delete(f'/store/carts/{cart_id}/items/{item_id}/').status_code, 204)
+        self.assertEqual(client.get(f'/store/carts/{cart_id}/items/').data, [])
+        self.assertEqual(client.delete(f'/store/carts/{cart_id}/').status_code, 204)
+        self.assertEqual(client.get(f'/store/carts/{cart_id}/').status_code, 404)
+
+
+class ORMCartApiTests(CartApiContract, TestCase):
+    def test_update_item_queries(self):
+        product = create_product(inventory=5)
+        client = client_for(create_user())
+        cart_id = client.post('/store/carts/').data['id']
+        item_id = client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 2}).data['id']
+        # the cart check and the item read with its product, the stock
+        # reservation (two savepoints, products, holds and counters locked,
+        # holds touched, counter and hold changed) and the item write;
+        # validation and the response read nothing more
+        with self.assertNumQueries(13):
+            response = client.patch(f'/store/carts/{cart_id}/items/{item_id}/', {'quantity': 3}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['product']['id'], product.id)
+
+
+@override_settings(CART_STORE={'BACKEND': 'store.carts.KeyValueCartStore', 'OPTIONS': {'URL': 'locmem://'}})
+class KeyValueCartApiTests(CartApiContract, TestCase):
+    pass
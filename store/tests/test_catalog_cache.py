@@ -0,0 +1,47 @@
+import io
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from store.catalog_io import import_products
+
+from .helpers import client_for, create_cart, create_product, create_user
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_product(inventory=10)
+        self.url = f'/store/products/{self.product.id}/'
+
+    def get(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(self.url, **headers)
+
+    def test_revalidation(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(etag).status_code, 304)
+
+    def test_checkout_invalidates(self):
+        etag = self.get()['ETag']
+        cart = create_cart([(self.product, 4)])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client_for(create_user()).post(
+                '/store/orders/', {'cart_id': str(cart.id), 'address': 'Test Street'})
+        self.assertEqual(response.status_code, 200)
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['inventory'], 6)
+
+    def test_import_invalidates(self):
+        etag = self.get()['ETag']
+        rows = io.StringIO(
+            'title,description,unit_price,inventory,collection\n'
+            f'{self.product.title},,9.99,3,{self.product.collection.title}\n'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = import_products(rows)
+        self.assertEqual(stats['updated'], 1)
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['inventory'], 3)
@@ -0,0 +1,88 @@
+import threading
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+
+from store.models import Order, OrderItem, Product
+
+from .helpers import client_for, create_cart, create_collection, create_product, create_user
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.client = client_for(create_user())
+        collection = create_collection()
+        self.products = [create_product(collection, inventory=10) for _ in range(5)]
+
+    def checkout(self, cart):
+        return self.client.post('/store/orders/', {'cart_id': str(cart.id), 'address': 'Test Street'})
+
+    def test_decrements_inventory(self):
+        cart = create_cart([(product, 3) for product in self.products])
+        response = self.checkout(cart)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('inventory', flat=True)), [7] * 5)
+        self.assertEqual(OrderItem.objects.filter(order_id=response.data['id']).count(), 5)
+
+    def test_insufficient_inventory_changes_nothing(self):
+        cart = create_cart([(self.products[0], 3), (self.products[1], 11)])
+        response = self.checkout(cart)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cart_id', response.data)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(set(Product.objects.values_list('inventory', flat=True)), {10})
+
+    def test_user_without_customer(self):
+        user = create_user()
+        user.customer.delete()
+        response = client_for(user).post(
+            '/store/orders/', {'cart_id': str(create_cart([(self.products[0], 1)]).id), 'address': 'Test Street'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        # the first checkout also caches the customer id
+        self.checkout(create_cart([(self.products[0], 1)]))
+        counts = []
+        for size in (1, 5):
+            cart = create_cart([(product, 1) for product in self.products[:size]])
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.checkout(cart).status_code, 200)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentCheckoutTests(TransactionTestCase):
+    def test_last_units_are_sold_once(self):
+        units = 3
+        product = create_product(inventory=units)
+        carts = [create_cart([(product, 1)]) for _ in range(units * 2)]
+        clients = [client_for(create_user()) for _ in carts]
+        barrier = threading.Barrier(len(carts))
+        responses = [None] * len(carts)
+
+        def checkout(index):
+            try:
+                barrier.wait()
+                responses[index] = clients[index].post(
+                    '/store/orders/', {'cart_id': str(carts[index].id), 'address': 'Test Street'})
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(index,)) for index in range(len(carts))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        statuses = sorted(response.status_code for response in responses)
+        self.assertEqual(statuses, [200] * units + [400] * units)
+        for response in responses:
+            if response.status_code == 400:
+                self.assertEqual(response.data['cart_id'], [f'Dont have enough inventory for product {product.id}.'])
+        product.refresh_from_db()
+        self.assertEqual(product.inventory, 0)
+        self.assertEqual(sum(OrderItem.objects.filter(product=product).values_list('quantity', flat=True)), units)
@@ -0,0 +1,37 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from store.models import Collection
+
+from .helpers import client_for, create_collection, create_product, create_user
+
+
+class CollectionDeleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = client_for(create_user(is_staff=True))
+
+    def test_empty_collection(self):
+        collection = create_collection()
+        self.assertEqual(self.client.delete(f'/store/collections/{collection.id}/').status_code, 204)
+        self.assertFalse(Collection.objects.filter(id=collection.id).exists())
+
+    def test_collection_with_products(self):
+        collection = create_product().collection
+        # a counter that drifted to 0 must not let the delete through
+        Collection.objects.filter(id=collection.id).update(products_count=0)
+        self.assertEqual(self.client.delete(f'/store/collections/{collection.id}/').status_code, 405)
+        self.assertTrue(Collection.objects.filter(id=collection.id).exists())
+
+
+class CollectionAdminTests(TestCase):
+    def test_changelist(self):
+        collection = create_product().collection
+        user = create_user(is_staff=True)
+        user.is_superuser = True
+        user.save()
+        self.client.force_login(user)
+        response = self.client.get('/admin/store/collection/?o=2')
+        self.assertContains(response, 'Products count')
+        self.assertContains(response, '1 Products')
+        self.assertContains(response, collection.title)
@@ -0,0 +1,83 @@
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from store.images import process_image
+from store.models import ProductImage, ProductImageVariant
+
+from .helpers import client_for, create_product, create_user
+
+IMAGE_PROCESSING = {'EXECUTOR': 'sync', 'SIZES': {'thumbnail': 8, 'small': 16}, 'FORMATS': ['jpeg']}
+
+
+def upload(color='red', name='image.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(IMAGE_PROCESSING=IMAGE_PROCESSING)
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.product = create_product()
+        self.client = client_for(create_user(is_staff=True))
+
+    def post_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/store/products/{self.product.id}/images/', {'image': upload()}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return ProductImage.objects.get(id=response.data['id'])
+
+    def variant_files(self, image):
+        return [variant.file.name for variant in image.variants.all()]
+
+    def test_delete_image_deletes_variant_files(self):
+        image = self.post_image()
+        files = self.variant_files(image)
+        self.assertEqual(len(files), 2)
+        self.assertTrue(all(default_storage.exists(name) for name in files))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/store/products/{self.product.id}/images/{image.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(any(default_storage.exists(name) for name in files))
+
+    def test_files_shared_with_another_image_are_kept(self):
+        first, second = self.post_image(), self.post_image()
+        files = self.variant_files(first)
+        self.assertEqual(sorted(files), sorted(self.variant_files(second)))
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(all(default_storage.exists(name) for name in files))
+
+    def test_rerender_deletes_replaced_files(self):
+        image = self.post_image()
+        old_files = self.variant_files(image)
+        with override_settings(IMAGE_PROCESSING={**IMAGE_PROCESSING, 'SIZES': {'small': 16, 'large': 24}}):
+            with self.captureOnCommitCallbacks(execute=True):
+                process_image(image.id)
+        new_files = self.variant_files(image)
+        self.assertEqual(ProductImageVariant.objects.filter(image=image).count(), 2)
+        self.assertTrue(all(default_storage.exists(name) for name in new_files))
+        self.assertEqual([default_storage.exists(name) for name in old_files],
+                         [name in new_files for name in old_files])
+
+    def test_failed_sync_render_keeps_the_upload(self):
+        with mock.patch('store.images.render', side_effect=OSError('broken image')):
+            with self.assertLogs('store.images', 'ERROR'):
+                image = self.post_image()
+        self.assertEqual(self.variant_files(image), [])
@@ -0,0 +1,46 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from store.models import Order, OrderItem
+
+from .helpers import client_for, create_collection, create_product, create_user
+
+
+class OrderQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        collection = create_collection()
+        products = [create_product(collection) for _ in range(3)]
+        for _ in range(3):
+            order = Order.objects.create(customer=self.user.customer, address='Test Street')
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product=product, quantity=2, unit_price=Decimal('1.50'))
+                for product in products
+            )
+        self.order = order
+
+    def assert_fixed_queries(self, client):
+        # a first request resolves and caches the customer id
+        client.get('/store/orders/')
+        with self.assertNumQueries(2):
+            response = client.get('/store/orders/')
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(response.data[0]['order_total_price'], Decimal('9.00'))
+        self.assertEqual(len(response.data[0]['items']), 3)
+        with self.assertNumQueries(2):
+            response = client.get(f'/store/orders/{self.order.id}/')
+        self.assertEqual(response.data['order_total_price'], Decimal('9.00'))
+
+    def test_customer_queries(self):
+        self.assert_fixed_queries(client_for(self.user))
+
+    def test_staff_queries(self):
+        self.assert_fixed_queries(client_for(create_user(is_staff=True)))
+
+    def test_order_without_items_totals_zero(self):
+        order = Order.objects.create(customer=self.user.customer, address='Test Street')
+        response = client_for(self.user).get(f'/store/orders/{order.id}/')
+        self.assertEqual(response.data['order_total_price'], Decimal('0.00'))
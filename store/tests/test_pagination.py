@@ -0,0 +1,94 @@
+import json
+from base64 import urlsafe_b64encode
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from store.models import Order
+
+from .helpers import client_for, create_collection, create_product, create_user
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        collection = create_collection()
+        # many rows share a price, so the first ordering field alone is not unique
+        self.products = [
+            create_product(collection, unit_price=Decimal(index % 3)) for index in range(23)
+        ]
+
+    def walk(self, client, url):
+        ids = []
+        pages = 0
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+            pages += 1
+        return ids, response.data['previous'], pages
+
+    def walk_back(self, client, url):
+        ids = []
+        while url:
+            response = client.get(url)
+            ids = [row['id'] for row in response.data['results']] + ids
+            url = response.data['previous']
+        return ids
+
+    def test_ties_on_the_first_field(self):
+        expected = [product.id for product in sorted(self.products, key=lambda p: (p.unit_price, p.id))]
+        ids, previous, pages = self.walk(self.client, '/store/products/?pagination=cursor&ordering=unit_price&page_size=4')
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 6)
+        # back from the last page to the first
+        self.assertEqual(self.walk_back(self.client, previous), expected[:-3])
+
+    def test_descending(self):
+        expected = [product.id for product in sorted(self.products, key=lambda p: (-p.unit_price, -p.id))]
+        ids, _, _ = self.walk(self.client, '/store/products/?pagination=cursor&ordering=-unit_price&page_size=5')
+        self.assertEqual(ids, expected)
+
+    def test_orders_placed_at_the_same_time(self):
+        user = create_user()
+        orders = [Order.objects.create(customer=user.customer, address='Test Street') for _ in range(7)]
+        Order.objects.update(placed_at=timezone.now())
+        ids, _, _ = self.walk(client_for(user), '/store/orders/?pagination=cursor&page_size=2')
+        self.assertEqual(ids, [order.id for order in orders])
+
+    def test_page_numbers_over_ties(self):
+        expected = [product.id for product in sorted(self.products, key=lambda p: (-p.unit_price, -p.id))]
+        ids = []
+        for page in range(1, 7):
+            response = self.client.get(f'/store/products/?ordering=-unit_price&page_size=4&page={page}')
+            ids += [row['id'] for row in response.data['results']]
+        self.assertEqual(ids, expected)
+
+    def test_several_ordering_fields(self):
+        expected = [product.id for product in sorted(self.products, key=lambda p: (p.unit_price, -p.last_update.timestamp(), p.id))]
+        ids, _, _ = self.walk(self.client, '/store/products/?pagination=cursor&ordering=unit_price,-last_update&page_size=4')
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/store/products/?cursor=bm90LWpzb24').status_code, 404)
+        # well-formed cursors holding values of the wrong type
+        for ordering, position in [
+            ('', ['abc']),
+            ('', [{'a': 1}]),
+            ('', [None]),
+            ('unit_price', ['xyz', 1]),
+            ('-last_update', ['notadate', 1]),
+        ]:
+            cursor = urlsafe_b64encode(json.dumps([0, position]).encode()).decode('ascii')
+            response = self.client.get('/store/products/', {'cursor': cursor, 'ordering': ordering})
+            self.assertEqual(response.status_code, 404, (ordering, position))
+
+    def test_max_page_size_is_read_per_request(self):
+        with override_settings(STORE_MAX_PAGE_SIZE=5):
+            response = self.client.get('/store/products/?page_size=50')
+            self.assertEqual(len(response.data['results']), 5)
+            response = self.client.get('/store/products/?pagination=cursor&page_size=50')
+            self.assertEqual(len(response.data['results']), 5)
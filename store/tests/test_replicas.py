@@ -0,0 +1,85 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from core import routers
+from core.routers import read_from_replica
+from store.models import Product
+
+from .helpers import client_for, create_collection, create_product, create_user
+
+REPLICAS = ['replica_1', 'replica_2']
+
+
+@override_settings(READ_REPLICAS={'ALIASES': REPLICAS, 'SELECTION': 'round-robin', 'LAG_CHECK_SECONDS': 0})
+class ReplicaRoutingTests(TransactionTestCase):
+    """The replica aliases of the test settings mirror the test database."""
+    databases = {'default', *REPLICAS}
+
+    def setUp(self):
+        cache.clear()
+        routers._lags.clear()
+        self.collection = create_collection()
+        self.product = create_product(self.collection)
+
+    def databases_used(self, request):
+        contexts = {alias: CaptureQueriesContext(connections[alias]) for alias in self.databases}
+        for context in contexts.values():
+            context.__enter__()
+        try:
+            response = request()
+        finally:
+            for context in contexts.values():
+                context.__exit__(None, None, None)
+        return response, {alias for alias, context in contexts.items() if context.captured_queries}
+
+    def get(self, client, url):
+        cache.clear()
+        response, used = self.databases_used(lambda: client.get(url))
+        self.assertEqual(response.status_code, 200)
+        return response, used
+
+    def test_round_robin(self):
+        client = client_for()
+        used = [self.get(client, '/store/products/')[1] for _ in range(4)]
+        self.assertTrue(all(len(aliases) == 1 and aliases <= set(REPLICAS) for aliases in used), used)
+        self.assertEqual(set().union(*used), set(REPLICAS))
+        self.assertNotEqual(used[0], used[1])
+
+    def test_least_lag(self):
+        lags = {'replica_1': 3.0, 'replica_2': 1.0}
+        with override_settings(READ_REPLICAS={'ALIASES': REPLICAS, 'SELECTION': 'least-lag', 'LAG_CHECK_SECONDS': 0}), \
+                mock.patch.object(routers, 'measure_lag', side_effect=lags.get):
+            self.assertEqual(self.get(client_for(), '/store/collections/')[1], {'replica_2'})
+            # too far behind, or down, falls back to the primary
+            lags.update(replica_1=None, replica_2=10.0)
+            self.assertEqual(self.get(client_for(), '/store/collections/')[1], {'default'})
+
+    def test_pinned_after_a_write(self):
+        client = client_for(create_user(is_staff=True))
+        response = client.post('/store/collections/', {'title': 'pinned'})
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('primary_pin', response.cookies)
+        self.assertEqual(self.get(client, '/store/collections/')[1], {'default'})
+        # other clients still read from a replica
+        self.assertLessEqual(self.get(client_for(), '/store/collections/')[1], set(REPLICAS))
+
+    def test_carts_and_orders_on_the_primary(self):
+        client = client_for(create_user())
+        response, used = self.databases_used(lambda: client.post('/store/carts/'))
+        self.assertEqual(used, {'default'})
+        cart_id = response.data['id']
+        self.assertEqual(self.get(client_for(), f'/store/carts/{cart_id}/')[1], {'default'})
+        self.assertEqual(self.get(client, '/store/orders/')[1], {'default'})
+
+    def test_changes_on_the_primary(self):
+        self.assertEqual(self.get(client_for(), '/store/products/changes/')[1], {'default'})
+
+    def test_atomic_block_on_the_primary(self):
+        with read_from_replica():
+            self.assertIn(router.db_for_read(Product), REPLICAS)
+        with read_from_replica(), transaction.atomic():
+            self.assertEqual(router.db_for_read(Product), 'default')
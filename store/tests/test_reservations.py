@@ -0,0 +1,70 @@
+import threading
+import time
+from uuid import uuid4
+
+from django.db import OperationalError, connection, transaction
+from django.test import TransactionTestCase
+
+from store.carts import InsufficientInventory
+from store.models import StockCounter, StockHold
+from store.reservations import convert_holds, reserve
+
+from .helpers import create_product
+
+
+class FlashSaleTests(TransactionTestCase):
+    """Many carts reserve the last units of one product at once."""
+
+    def reserve_concurrently(self, product, carts, quantity):
+        barrier = threading.Barrier(len(carts))
+        results = [None] * len(carts)
+
+        def attempt(index):
+            try:
+                barrier.wait()
+                # SQLite reports lock contention as an error, retry it like the benchmark does
+                for retry in range(50):
+                    try:
+                        reserve(carts[index], [(product.id, quantity)])
+                        results[index] = 'reserved'
+                        return
+                    except InsufficientInventory:
+                        results[index] = 'sold out'
+                        return
+                    except OperationalError:
+                        time.sleep(0.005 * min(retry + 1, 10))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt, args=(index,)) for index in range(len(carts))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_stock_is_reserved_exactly_once(self):
+        units = 5
+        product = create_product(inventory=units)
+        carts = [uuid4() for _ in range(units * 3)]
+        results = self.reserve_concurrently(product, carts, 1)
+
+        self.assertEqual(sorted(results), ['reserved'] * units + ['sold out'] * units * 2)
+        self.assertEqual(StockCounter.objects.get(product=product).reserved, units)
+        self.assertEqual(
+            sorted(StockHold.objects.filter(product=product).values_list('cart_id', 'quantity')),
+            sorted((cart_id, 1) for cart_id, result in zip(carts, results) if result == 'reserved'))
+
+        # every winner checks out with its own hold
+        for cart_id, result in zip(carts, results):
+            if result == 'reserved':
+                with transaction.atomic():
+                    self.assertEqual(convert_holds(cart_id, {product.id: 1}, {product.id: units}), [])
+        self.assertEqual(StockCounter.objects.get(product=product).reserved, 0)
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_quantity_larger_than_one(self):
+        product = create_product(inventory=7)
+        results = self.reserve_concurrently(product, [uuid4() for _ in range(6)], 2)
+        self.assertEqual(results.count('reserved'), 3)
+        self.assertEqual(StockCounter.objects.get(product=product).reserved, 6)
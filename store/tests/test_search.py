@@ -0,0 +1,106 @@
+import io
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from store import search
+from store.catalog_io import import_products
+from store.models import SearchPosting
+from store.search import rebuild_index, search_products
+
+from .helpers import create_collection, create_product
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.collection = create_collection()
+
+    def product(self, title, description=''):
+        return create_product(self.collection, title=title, description=description)
+
+    def ids(self, query, **kwargs):
+        return [product_id for product_id, _ in search_products(query, **kwargs)]
+
+    def test_title_outranks_description(self):
+        in_description = self.product('Plain tee', 'A linen shirt for summer')
+        in_title = self.product('Linen shirt')
+        self.assertEqual(self.ids('shirt'), [in_title.id, in_description.id])
+
+    def test_every_token_must_match(self):
+        both = self.product('Blue linen shirt')
+        self.product('Blue jeans')
+        self.product('Linen trousers')
+        self.assertEqual(self.ids('blue linen'), [both.id])
+
+    def test_prefix_and_exact_match(self):
+        prefixed = self.product('Cartoon mug')
+        exact = self.product('Cart handle')
+        self.assertEqual(self.ids('cart'), [exact.id, prefixed.id])
+        self.assertEqual(self.ids('cartoo'), [prefixed.id])
+        self.assertEqual(self.ids('mug cart'), [prefixed.id])
+
+    def test_exact_term_beyond_the_expansion_limit(self):
+        exact = self.product('Cart')
+        for title in ['Carton', 'Cartel', 'Cartoon']:
+            for number in range(3):
+                self.product(f'{title} {number}')
+        with mock.patch.object(search, 'MAX_PREFIX_EXPANSIONS', 2):
+            self.assertIn(exact.id, self.ids('cart'))
+
+    def test_candidates_of_a_common_token(self):
+        wanted = [self.product(f'Shirt red {number}') for number in range(3)]
+        for number in range(8):
+            self.product(f'Shirt blue {number}')
+        for number in range(6):
+            self.product(f'Red mug {number}', 'A large ceramic mug for coffee')
+        # both tokens match more products than are read, so only the
+        # highest-impact postings of red, the rarer one, are scored
+        with mock.patch.object(search, 'MAX_CANDIDATES', 4):
+            self.assertEqual(self.ids('shirt red', limit=2), [product.id for product in wanted[:2]])
+
+    def test_rebuild_matches_incremental_index(self):
+        self.product('Linen shirt', 'Soft linen')
+        self.product('Wool coat', 'A warm coat for winter')
+        incremental = search_products('linen')
+        indexed = sorted(SearchPosting.objects.values_list('term__term', 'product_id', 'frequency'))
+        rebuild_index()
+        self.assertEqual(sorted(SearchPosting.objects.values_list('term__term', 'product_id', 'frequency')), indexed)
+        self.assertEqual([product_id for product_id, _ in search_products('linen')],
+                         [product_id for product_id, _ in incremental])
+
+    def test_endpoint(self):
+        product = self.product('Linen shirt')
+        response = self.client.get('/store/products/search/?q=lin')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data['results']], [product.id])
+
+
+class SearchIndexUpdateTests(TestCase):
+    def setUp(self):
+        self.product = create_product(title='Linen shirt')
+
+    def test_save_without_searchable_changes(self):
+        with mock.patch('store.signals.handlers.index_products') as index_products:
+            self.product.inventory = 3
+            self.product.save()
+            self.product.unit_price = 5
+            self.product.save(update_fields=['unit_price'])
+        index_products.assert_not_called()
+
+    def test_save_with_new_title(self):
+        self.product.title = 'Wool shirt'
+        self.product.save()
+        self.assertEqual(search_products('wool')[0][0], self.product.id)
+        self.assertEqual(search_products('linen'), [])
+
+    def test_import_reindexes_changed_text_only(self):
+        rows = io.StringIO(
+            'title,description,unit_price,inventory,collection\n'
+            f'{self.product.title},,9.99,3,{self.product.collection.title}\n'
+        )
+        with mock.patch('store.catalog_io.index_products') as index_products:
+            stats = import_products(rows)
+        self.assertEqual(stats['updated'], 1)
+        index_products.assert_not_called()
@@ -0,0 +1,82 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from store.models import Product
+from store.sync import decode_token, encode_token
+
+from .helpers import create_product
+
+
+def sync_now(now):
+    return mock.patch('store.sync.timezone.now', return_value=now)
+
+
+@override_settings(CATALOG_SYNC={'SETTLE_SECONDS': 5, 'TOMBSTONE_RETENTION_DAYS': 30})
+class ChangesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_product()
+        Product.objects.filter(id=self.product.id).update(last_update=timezone.now() - timedelta(days=20))
+
+    def changes(self, token=None, **params):
+        if token:
+            params['since'] = token
+        response = self.client.get('/store/products/changes/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_idle_token_advances_to_the_horizon(self):
+        data = self.changes()
+        self.assertEqual([change['id'] for change in data['changes']], [self.product.id])
+        self.assertFalse(data['has_more'])
+
+        data = self.changes(data['next'])
+        self.assertEqual(data['changes'], [])
+        timestamp, _, _ = decode_token(data['next'])
+        self.assertGreater(timestamp, timezone.now() - timedelta(seconds=10))
+
+    def test_polled_token_outlives_the_retention(self):
+        token = self.changes()['next']
+        now = timezone.now()
+        for days in (20, 40, 60):
+            with sync_now(now + timedelta(days=days)):
+                data = self.changes(token)
+            self.assertEqual(data['changes'], [])
+            token = data['next']
+
+    def test_changes_at_and_after_the_horizon(self):
+        token = self.changes()['next']
+        horizon, _, _ = decode_token(token)
+        Product.objects.filter(id=self.product.id).update(last_update=horizon)
+        deleted = create_product()
+        deleted_id = deleted.id
+        deleted.delete()
+        with sync_now(timezone.now() + timedelta(seconds=10)):
+            data = self.changes(token)
+        self.assertEqual([(change['type'], change['id']) for change in data['changes']],
+                         [('upsert', self.product.id), ('delete', deleted_id)])
+
+    def test_unsettled_changes_are_held_back(self):
+        token = self.changes()['next']
+        self.product.save()
+        self.assertEqual(self.changes(token)['changes'], [])
+        with sync_now(timezone.now() + timedelta(seconds=10)):
+            self.assertEqual([change['id'] for change in self.changes(token)['changes']], [self.product.id])
+
+    def test_paging(self):
+        create_product()
+        Product.objects.update(last_update=timezone.now() - timedelta(days=1))
+        data = self.changes(limit=1)
+        self.assertTrue(data['has_more'])
+        data = self.changes(data['next'], limit=1)
+        self.assertEqual(len(data['changes']), 1)
+        self.assertFalse(data['has_more'])
+        self.assertEqual(self.changes(data['next'])['changes'], [])
+
+    def test_expired_token(self):
+        token = encode_token((timezone.now() - timedelta(days=31), 0, 0))
+        self.assertEqual(self.client.get('/store/products/changes/', {'since': token}).status_code, 410)
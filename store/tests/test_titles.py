@@ -0,0 +1,67 @@
+from unittest import mock
+
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+
+from store.serializers import ProductSerializer
+
+from .helpers import create_product
+
+
+class UniqueTitleTests(TestCase):
+    def setUp(self):
+        self.product = create_product(title='Blue Shirt')
+
+    def test_concurrent_duplicate_is_a_validation_error(self):
+        # as if another request created the title after this one validated
+        serializer = ProductSerializer(data={
+            'title': 'blue shirt', 'price': '1.00', 'inventory': 1, 'collection': self.product.collection_id,
+        })
+        with mock.patch.object(ProductSerializer, 'validate_title', lambda self, value: value):
+            serializer.is_valid(raise_exception=True)
+            with self.assertRaisesMessage(Exception, 'blue shirt is already a product name.'):
+                serializer.save()
+
+    def test_partial_update_without_title(self):
+        serializer = ProductSerializer(self.product, data={'inventory': 3}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        error = IntegrityError('UNIQUE constraint failed: index store_product_title_ci_unique')
+        with mock.patch('rest_framework.serializers.ModelSerializer.update', side_effect=error):
+            with self.assertRaisesMessage(Exception, 'Blue Shirt is already a product name.'):
+                serializer.save()
+
+    def test_other_integrity_errors_propagate(self):
+        serializer = ProductSerializer(self.product, data={'inventory': 3}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        error = IntegrityError('NOT NULL constraint failed: store_product.collection_id')
+        with mock.patch('rest_framework.serializers.ModelSerializer.update', side_effect=error):
+            with self.assertRaises(IntegrityError):
+                serializer.save()
+
+
+class DedupeTitlesMigrationTests(TransactionTestCase):
+    before = [('store', '0006_product_order_keyset_indexes')]
+    after = [('store', '0007_title_ci_unique')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_suffixed_title_is_free(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        Collection = executor.loader.project_state(self.before).apps.get_model('store', 'Collection')
+        first = Collection.objects.create(title='Shoes')
+        duplicate = Collection.objects.create(title='shoes')
+        # the title the duplicate would be renamed to already exists
+        taken = Collection.objects.create(title=f'Shoes ({duplicate.id})')
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        titles = dict(Collection.objects.values_list('id', 'title'))
+        self.assertEqual(titles, {
+            first.id: 'Shoes',
+            duplicate.id: f'shoes ({duplicate.id}-2)',
+            taken.id: f'Shoes ({duplicate.id})',
+        })
@@ -2,7 +2,7 @@ from django.urls import path
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested import routers
 
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 
@@ -22,5 +22,11 @@ cart_router.register('items', views.CartItemViewSet, basename='cart-items')
 
 
 urlpatterns = [
+    path('analytics/sales/', views.sales_analytics, name='sales-analytics'),
+    path('async/products/', async_views.product_list, name='async-products-list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async-products-detail'),
+    path('async/collections/', async_views.collection_list, name='async-collections-list'),
+    path('async/collections/<int:pk>/', async_views.collection_detail, name='async-collections-detail'),
+    path('async/carts/<uuid:pk>/', async_views.cart_detail, name='async-carts-detail'),
 ] + router.urls + products_router.urls + cart_router.urls
 
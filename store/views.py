@@ -1,68 +1,183 @@
-from django.db.models.aggregates import Count
+from django.db.models import DecimalField, F, Prefetch, ProtectedError, Value
+from django.db.models.aggregates import Sum
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.mixins import (CreateModelMixin, DestroyModelMixin,
-                                   RetrieveModelMixin)
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from .models import (Cart, CartItem, Collection, Customer, Order, Product,
+from .analytics import sales_report, sales_series
+from .carts import get_cart_store
+from .customers import get_customer_id
+from .exports import FORMATS, export_response
+from .filters import ProductFilter, StableOrderingFilter, product_facets
+from .mixins import CatalogCacheMixin, ReplicaReadMixin
+from .models import (Collection, Customer, Order, OrderItem, Product,
                      ProductImage)
-from .paginations import DefaultPagination
+from .paginations import (OptInCursorOnlyPagination, OptInCursorPagination,
+                          get_max_page_size)
 from .permissions import IsAdminOrReadOnly
-from .serializers import (AddCartItemSerializer, CartItemSerializer,
-                          CartSerializer, CollectionSerializer,
-                          CreateOrderSerializer, CustomerSerializer,
-                          MyTokenObtainPairSerializer, OrderSerializer,
-                          ProductImageSerializer, ProductSerializer,
-                          UpdateCartItemSerializer, UpdateCustomerSerializer,
-                          UpdateOrderSerializer)
+from .reservations import release
+from .search import search_products
+from .sync import (DELETE, ExpiredToken, InvalidToken, decode_token,
+                   encode_token, get_changes, get_sync_setting)
+from .serializers import (AddCartItemSerializer, BatchAddCartItemSerializer,
+                          CartItemSerializer, CartSerializer,
+                          CollectionSerializer, CreateOrderSerializer,
+                          CustomerSerializer, MyTokenObtainPairSerializer,
+                          OrderSerializer, ProductImageSerializer,
+                          ProductSerializer, SalesReportQuerySerializer,
+                          UpdateCartItemSerializer,
+                          UpdateCustomerSerializer, UpdateOrderSerializer)
 
 
+def stream_export(request, name):
+    # not ?format=, which DRF reserves for picking a renderer
+    format = request.query_params.get('file_format', 'csv')
+    if format not in FORMATS:
+        return Response({'error': f"file_format must be one of {', '.join(FORMATS)}."},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return export_response(name, format)
+
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.prefetch_related('images').all()
+class ProductViewSet(ReplicaReadMixin, CatalogCacheMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.prefetch_related('images__variants').all()
     serializer_class = ProductSerializer
-    pagination_class = DefaultPagination
+    pagination_class = OptInCursorPagination
+    # by id, so products updated while a client scrolls do not move between pages
+    cursor_ordering = ('id',)
+    filter_backends = [DjangoFilterBackend, StableOrderingFilter]
+    filterset_class = ProductFilter
+    ordering_fields = ['unit_price', 'last_update']
+    ordering = ['id']
     permission_classes = [IsAdminOrReadOnly]
     lookup_field = 'pk'
+    # a replica lagging more than the settle window would make the delta
+    # feed advance its token past rows it has not seen yet
+    primary_actions = ['changes']
+
+    def get_queryset(self):
+        # a delete serializes nothing, so it skips the image prefetch
+        if self.request.method == 'DELETE':
+            return Product.objects.all()
+        return super().get_queryset()
+
+    @action(detail=False, methods=['GET'])
+    def changes(self, request, *args, **kwargs):
+        try:
+            position = decode_token(request.query_params.get('since'))
+        except ExpiredToken as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_410_GONE)
+        except InvalidToken as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', get_sync_setting('BATCH_SIZE')))
+        except ValueError:
+            limit = get_sync_setting('BATCH_SIZE')
+        limit = min(max(limit, 1), get_sync_setting('MAX_BATCH_SIZE'))
+
+        changes, position, has_more = get_changes(position, limit, self.get_queryset())
+        results = []
+        for kind, product_id, product in changes:
+            if kind == DELETE:
+                results.append({'type': 'delete', 'id': product_id})
+            else:
+                results.append({'type': 'upsert', 'id': product_id, 'product': self.get_serializer(product).data})
+        return Response({
+            'changes': results,
+            'next': encode_token(position) if position else None,
+            'has_more': has_more,
+        })
+
+    @action(detail=False, methods=['GET'])
+    def facets(self, request, *args, **kwargs):
+        return self.cached_response(self.facet_counts, request, *args, **kwargs)
+
+    def facet_counts(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(Product.objects.all())
+        return Response(product_facets(queryset))
+
+    @action(detail=False, methods=['GET'])
+    def search(self, request, *args, **kwargs):
+        return self.cached_response(self.search_results, request, *args, **kwargs)
+
+    def search_results(self, request, *args, **kwargs):
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), get_max_page_size())
+        except ValueError:
+            limit = 20
+        scores = search_products(request.query_params.get('q', ''), limit=max(limit, 1))
+        products = self.get_queryset().in_bulk([product_id for product_id, _ in scores])
+        results = []
+        for product_id, score in scores:
+            if product_id in products:
+                data = self.get_serializer(products[product_id]).data
+                data['score'] = round(score, 4)
+                results.append(data)
+        return Response({'count': len(results), 'results': results})
 
-class ProductImageViewSet(viewsets.ModelViewSet):
+class ProductImageViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     serializer_class = ProductImageSerializer
     permission_classes = [IsAdminOrReadOnly]
 
     def get_queryset(self, *args, **kwargs):
         print(self.kwargs)
-        return ProductImage.objects.filter(product_id=self.kwargs['product_pk'])
+        return ProductImage.objects \
+            .filter(product_id=self.kwargs['product_pk']) \
+            .prefetch_related('variants')
 
     def get_serializer_context(self):
         return {'product_id': self.kwargs['product_pk']}
 
-class CollectionViewSet(viewsets.ModelViewSet):
-    queryset = Collection.objects.annotate(products_count=Count('products')).all()
+class CollectionViewSet(ReplicaReadMixin, CatalogCacheMixin, viewsets.ModelViewSet):
+    queryset = Collection.objects.all()
     serializer_class = CollectionSerializer
     permission_classes = [IsAdminOrReadOnly]
 
     def destroy(self, request, *args, **kwargs):
-        if Product.objects.filter(collection_id=kwargs['pk']).count() > 0:
+        # products_count is denormalized and may drift; the PROTECT foreign key
+        # is checked against the products themselves, before anything is deleted
+        try:
+            return super().destroy(request, *args, **kwargs)
+        except ProtectedError:
             return Response({'error': 'Collection cannot be delleted.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
-        return super().destroy(request, *args, **kwargs)
 
-class CartViewSet(CreateModelMixin, 
-                  RetrieveModelMixin, 
-                  DestroyModelMixin, 
-                  viewsets.GenericViewSet):
-    queryset = Cart.objects.prefetch_related('items__product').all()
+class CartViewSet(viewsets.GenericViewSet):
     serializer_class = CartSerializer
     permission_classes = [AllowAny]
 
-class CartItemViewSet(viewsets.ModelViewSet):
+    def create(self, request, *args, **kwargs):
+        cart = get_cart_store().create_cart()
+        serializer = self.get_serializer(cart)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, *args, **kwargs):
+        cart = get_cart_store().get_cart(kwargs['pk'])
+        if cart is None:
+            raise NotFound()
+        serializer = self.get_serializer(cart)
+        return Response(serializer.data)
+
+    def destroy(self, request, *args, **kwargs):
+        if not get_cart_store().delete_cart(kwargs['pk']):
+            raise NotFound()
+        release(kwargs['pk'])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class CartItemViewSet(viewsets.GenericViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
     
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not get_cart_store().has_cart(self.kwargs['cart_pk']):
+            raise NotFound('No cart with the given ID was found.')
+
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return AddCartItemSerializer
@@ -71,24 +186,64 @@ class CartItemViewSet(viewsets.ModelViewSet):
         return CartItemSerializer
 
     def get_serializer_context(self):
-        if self.request.method == 'PATCH':
-            return {'cart_id': self.kwargs['cart_pk'], 'cart_item_id': self.kwargs['pk']}
         return {'cart_id': self.kwargs['cart_pk']}
 
-    def get_queryset(self):
-        return CartItem.objects \
-            .filter(cart_id=self.kwargs['cart_pk']) \
-            .select_related('product')
+    def get_object(self):
+        cart_item = get_cart_store().get_item(self.kwargs['cart_pk'], self.kwargs['pk'])
+        if cart_item is None:
+            raise NotFound()
+        return cart_item
+
+    def list(self, request, *args, **kwargs):
+        cart_items = get_cart_store().get_items(self.kwargs['cart_pk'])
+        serializer = self.get_serializer(cart_items, many=True)
+        return Response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_object())
+        return Response(serializer.data)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def partial_update(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_object(), data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        cart_item = serializer.save()
+        # same product instance as validation, no extra query
+        return Response(CartItemSerializer(cart_item).data)
+
+    def destroy(self, request, *args, **kwargs):
+        cart_item = self.get_object()
+        if not get_cart_store().remove_item(self.kwargs['cart_pk'], cart_item.id):
+            raise NotFound()
+        release(self.kwargs['cart_pk'], [cart_item.product_id])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['POST'])
+    def batch(self, request, *args, **kwargs):
+        serializer = BatchAddCartItemSerializer(data=request.data, many=True, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        cart = serializer.save()
+        return Response(CartSerializer(cart).data)
 
 class CustomerViewSet(viewsets.ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
-    pagination_class = DefaultPagination
+    pagination_class = OptInCursorPagination
+    cursor_ordering = ('id',)
     permission_classes = [IsAdminUser]
     
+    @action(detail=False, methods=['GET'])
+    def export(self, request):
+        return stream_export(request, 'customers')
+
     @action(detail=False, methods=['GET', 'PUT'], permission_classes=[IsAuthenticated])
     def me(self, request):
-        customer = Customer.objects.get(user_id=request.user.id)
+        customer = get_object_or_404(Customer, id=get_customer_id(request.user))
         if request.method == 'GET':
             serializer = CustomerSerializer(customer)
             return Response(serializer.data)
@@ -101,12 +256,19 @@ class CustomerViewSet(viewsets.ModelViewSet):
 
 class OrderViewSet(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
+    pagination_class = OptInCursorOnlyPagination
+    cursor_ordering = ('placed_at', 'id')
 
     def get_permissions(self):
-        if self.request.method in ['PATCH', 'DELETE']:
+        if self.request.method in ['PATCH', 'DELETE'] or self.action == 'export':
             return [IsAdminUser()]
         return [IsAuthenticated()]
 
+    @action(detail=False, methods=['GET'])
+    def export(self, request):
+        name = 'order-items' if request.query_params.get('rows') == 'items' else 'orders'
+        return stream_export(request, name)
+
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return CreateOrderSerializer
@@ -116,14 +278,42 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        queryset = Order.objects \
+            .prefetch_related(Prefetch('items', queryset=OrderItem.objects.select_related('product'))) \
+            .annotate(order_total_price=Coalesce(
+                Sum(F('items__quantity') * F('items__unit_price')),
+                Value(0),
+                output_field=DecimalField(max_digits=9, decimal_places=2)
+            ))
         if user.is_staff:
-            return Order.objects.all()
-        customer_id = Customer.objects.only('id').get(user_id=user.id)
-        return Order.objects.filter(customer_id=customer_id)
+            return queryset
+        return queryset.filter(customer_id=get_customer_id(user))
 
     def create(self, request, *args, **kwargs):
-        serializer = CreateOrderSerializer(data=request.data, context={'user_id':self.request.user.id})
+        serializer = CreateOrderSerializer(data=request.data, context={'customer_id': get_customer_id(self.request.user)})
         serializer.is_valid(raise_exception=True)
         order = serializer.save()
+        order = self.get_queryset().get(id=order.id)
         serializer = OrderSerializer(order)
         return Response(serializer.data)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def sales_analytics(request):
+    query = SalesReportQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+    params = query.validated_data
+    period = SalesReportQuerySerializer.PERIODS[params['period']]
+    start, end = params.get('start'), params.get('end')
+
+    results = sales_report(period, params['by'], start, end, params['limit'])
+    model, key = (Product, 'product_id') if params['by'] == 'product' else (Collection, 'collection_id')
+    titles = dict(model.objects.filter(id__in=[row[key] for row in results]).values_list('id', 'title'))
+    for row in results:
+        row['title'] = titles.get(row[key])
+    return Response({
+        'period': params['period'],
+        'by': params['by'],
+        'results': results,
+        'series': sales_series(period, start, end),
+    })